@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 import uuid
 
+from base.mixins import LoadedStateMixin
+
 # Create your models here.
 
 class Company(models.Model):
@@ -13,7 +15,7 @@ class Company(models.Model):
         return self.name
     
     
-class User(AbstractUser):
+class User(LoadedStateMixin, AbstractUser):
     ROLE_CHOICES = (
         ('admin', 'Admin'),
         ('salesperson', 'Salesperson'),  # Corrected key
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import AuditLog
+from .models import AuditArchiveSegment, AuditLog
 
 
 @admin.register(AuditLog)
@@ -12,7 +12,7 @@ class AuditLogAdmin(admin.ModelAdmin):
         'performed_by', 'timestamp', 'data_preview'
     ]
     list_filter = [
-        'model_name', 'action', 'performed_by', 'timestamp'
+        'company', 'model_name', 'action', 'performed_by', 'timestamp'
     ]
     search_fields = [
         'model_name', 'record_number', 'performed_by__username', 
@@ -20,7 +20,7 @@ class AuditLogAdmin(admin.ModelAdmin):
     ]
     readonly_fields = [
         'id', 'model_name', 'record_number', 'action', 
-        'performed_by', 'timestamp', 'formatted_before_data', 
+        'performed_by', 'company', 'timestamp', 'formatted_before_data', 
         'formatted_after_data'
     ]
     ordering = ['-timestamp']
@@ -28,7 +28,7 @@ class AuditLogAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('id', 'model_name', 'record_number', 'action', 'performed_by', 'timestamp')
+            'fields': ('id', 'model_name', 'record_number', 'action', 'performed_by', 'company', 'timestamp')
         }),
         ('Data Changes', {
             'fields': ('formatted_before_data', 'formatted_after_data'),
@@ -83,3 +83,10 @@ class AuditLogAdmin(admin.ModelAdmin):
         css = {
             'all': ('admin/css/audit_admin.css',)
         }
+
+
+@admin.register(AuditArchiveSegment)
+class AuditArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ['path', 'company', 'month', 'entry_count', 'first_timestamp', 'last_timestamp', 'size_bytes']
+    list_filter = ['company', 'month']
+    readonly_fields = [field.name for field in AuditArchiveSegment._meta.fields]
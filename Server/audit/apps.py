@@ -6,4 +6,5 @@ class AuditConfig(AppConfig):
     name = 'audit'
     
     def ready(self):
-        import audit.signals
\ No newline at end of file
+        import audit.signals
+        audit.signals.register_auditable_models()
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Per-transaction / per-request coalescing of automatic audit entries.
+
+The audit signals record one entry per save or delete. Within a transaction
+(and, when CurrentUserMiddleware has opened a request scope, across the whole
+request) entries for the same (model, pk) are merged into one record carrying
+the net change: create+update stays a create with the final data, repeated
+updates keep the first before_data and the last after_data, create+delete
+disappears. Updates whose tracked fields did not change are dropped.
+
+Buffered entries are only emitted once their transaction commits, so entries
+recorded inside a savepoint that rolls back are dropped with it. This applies
+in both writer modes; AUDIT_LOG_ASYNC only decides how emitted rows are saved.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+_state = threading.local()
+
+
+class PendingEntry:
+    __slots__ = ("model", "action", "by", "number", "before_data", "after_data", "company")
+
+    def __init__(self, model, action, by, number, before_data, after_data, company=None):
+        self.model = model
+        self.action = action
+        self.by = by
+        self.number = number
+        self.before_data = before_data
+        self.after_data = after_data
+        self.company = company
+
+    def merge(self, later):
+        """Fold a later entry for the same record into this one; False if nothing is left"""
+        if later.by is not None:
+            self.by = later.by
+        if later.number:
+            self.number = later.number
+        if later.company is not None:
+            self.company = later.company
+        if later.action == "delete":
+            if self.action == "create":
+                return False
+            self.action = "delete"
+            self.after_data = None
+            return True
+        if self.action == "delete":
+            # Deleted and written again under the same pk: net effect is an update
+            self.action = "update"
+        self.after_data = later.after_data
+        return True
+
+    def is_noop(self):
+        return self.action == "update" and self.before_data == self.after_data
+
+
+def _emit(entries):
+    from .utils import create_audit_log
+
+    for entry in entries:
+        if entry.is_noop():
+            continue
+        create_audit_log(
+            model=entry.model,
+            action=entry.action,
+            by=entry.by,
+            number=entry.number,
+            before_data=entry.before_data,
+            after_data=entry.after_data,
+            company=entry.company,
+        )
+
+
+def _add(buffer, key, entry):
+    existing = buffer.get(key)
+    if existing is None:
+        buffer[key] = entry
+    elif not existing.merge(entry):
+        del buffer[key]
+
+
+def _transaction_buffer():
+    """
+    The buffer for entries recorded under the current savepoints.
+
+    Consecutive entries recorded under the same savepoints share a buffer
+    whose flush is registered with on_commit at that depth, so Django drops
+    it when one of those savepoints (or the transaction) rolls back. Entering
+    or leaving a savepoint starts a new buffer, which keeps buffers in the
+    order their entries were recorded; a record touched on both sides of a
+    savepoint boundary is merged again in the request scope, if there is one.
+    """
+    sids = tuple(connection.savepoint_ids)
+    current = getattr(_state, "transaction", None)
+    if current is not None:
+        buffer, callback, buffer_sids = current
+        if buffer_sids == sids and any(registered[1] is callback for registered in connection.run_on_commit):
+            return buffer
+    buffer = {}
+
+    def callback():
+        if getattr(_state, "transaction", None) and _state.transaction[0] is buffer:
+            _state.transaction = None
+        _flush_transaction(buffer)
+
+    _state.transaction = (buffer, callback, sids)
+    transaction.on_commit(callback)
+    return buffer
+
+
+def _flush_transaction(buffer):
+    request_buffer = getattr(_state, "request", None)
+    if request_buffer is None:
+        _emit(buffer.values())
+        return
+    for key, entry in buffer.items():
+        _add(request_buffer, key, entry)
+
+
+def record(model, pk, action, by, number, before_data, after_data, company=None):
+    """Record an automatic audit entry for coalescing (see module docstring)"""
+    entry = PendingEntry(model, action, by, number, before_data, after_data, company)
+    if entry.is_noop():
+        return
+    key = (model, str(pk))
+    if connection.in_atomic_block:
+        _add(_transaction_buffer(), key, entry)
+    elif getattr(_state, "request", None) is not None:
+        _add(_state.request, key, entry)
+    else:
+        _emit([entry])
+
+
+@contextmanager
+def request_scope():
+    """Coalesce audit entries across every transaction committed inside the block"""
+    outer = getattr(_state, "request", None)
+    if outer is not None:
+        yield
+        return
+    _state.request = {}
+    try:
+        yield
+    finally:
+        buffer, _state.request = _state.request, None
+        _emit(buffer.values())
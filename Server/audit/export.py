@@ -0,0 +1,75 @@
+"""
+Streaming serialization of audit log querysets.
+
+Rows are read with values() over a server-side iterator and written one at a
+time, so memory use does not grow with the size of the export.
+"""
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = [
+    'id', 'timestamp', 'model_name', 'record_number', 'action',
+    'performed_by_id', 'performed_by__username', 'company_id',
+    'before_data', 'after_data',
+]
+CSV_HEADER = [
+    'id', 'timestamp', 'model_name', 'record_number', 'action',
+    'performed_by_id', 'performed_by', 'company_id',
+    'before_data', 'after_data',
+]
+
+
+class _Echo:
+    """File-like object for csv.writer that returns each line instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, chunk_size=2000):
+    """values() rows of the queryset, fetched chunk_size at a time"""
+    return queryset.order_by('-timestamp', '-id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow([
+            row['id'],
+            row['timestamp'].isoformat(),
+            row['model_name'],
+            row['record_number'] or '',
+            row['action'],
+            row['performed_by_id'] or '',
+            row['performed_by__username'] or 'System',
+            row['company_id'] or '',
+            json.dumps(row['before_data'], cls=DjangoJSONEncoder) if row['before_data'] is not None else '',
+            json.dumps(row['after_data'], cls=DjangoJSONEncoder) if row['after_data'] is not None else '',
+        ])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        row['performed_by'] = row.pop('performed_by__username') or 'System'
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_gzip(chunks, min_block=64 * 1024):
+    """gzip a stream of str chunks, emitting compressed blocks of at least min_block input bytes"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= min_block:
+            block = compressor.compress(b''.join(pending))
+            pending, size = [], 0
+            if block:
+                yield block
+    yield compressor.compress(b''.join(pending)) + compressor.flush()
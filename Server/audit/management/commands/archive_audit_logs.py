@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from audit.retention import AuditRetentionService
+
+
+class Command(BaseCommand):
+    help = 'Move audit logs older than the retention period into compressed archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive entries older than this many days (default: AUDIT_RETENTION_DAYS)')
+        parser.add_argument('--company', type=int, help='Only archive entries of this company id')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows per read and per DELETE')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be archived without archiving')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.AUDIT_RETENTION_DAYS
+        cutoff = timezone.now() - timedelta(days=days)
+
+        try:
+            summaries = AuditRetentionService.archive(
+                cutoff=cutoff,
+                company_id=options['company'],
+                chunk_size=options['chunk_size'],
+                dry_run=options['dry_run'],
+            )
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        total = 0
+        for summary in summaries:
+            total += summary['entries']
+            target = summary['segment'] or '(dry run)'
+            self.stdout.write(
+                f"Company {summary['company_id']} {summary['month']}: {summary['entries']} entries -> {target}"
+            )
+
+        action = 'would be archived' if options['dry_run'] else 'archived'
+        self.stdout.write(self.style.SUCCESS(f"Audit logs before {cutoff:%Y-%m-%d} {action}: {total}"))
@@ -0,0 +1,48 @@
+import json
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from audit.retention import AuditRetentionService
+
+
+class Command(BaseCommand):
+    help = 'Search archived audit log segments and print matches as JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, required=True, help='Company id whose archive is searched')
+        parser.add_argument('--model', help='Model name, e.g. Invoice')
+        parser.add_argument('--record', help='Record number, e.g. INV-20240101-001')
+        parser.add_argument('--action', help='Action, e.g. update')
+        parser.add_argument('--date-from', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--limit', type=int, default=100, help='Maximum number of entries')
+
+    def handle(self, *args, **options):
+        try:
+            start = self._day(options['date_from'])
+            end = self._day(options['date_to'])
+        except ValueError:
+            raise CommandError('--date-from and --date-to must be YYYY-MM-DD')
+        if end is not None:
+            end += timedelta(days=1)
+
+        entries, scanned = AuditRetentionService.search(
+            options['company'],
+            model_name=options['model'],
+            record_number=options['record'],
+            action=options['action'],
+            start=start,
+            end=end,
+            limit=options['limit'],
+        )
+        for entry in entries:
+            self.stdout.write(json.dumps(entry))
+        self.stderr.write(f"{len(entries)} entries from {scanned} segments")
+
+    @staticmethod
+    def _day(value):
+        if not value:
+            return None
+        return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
@@ -36,7 +36,10 @@ class CurrentUserMiddleware:
         else:
             clear_current_user()
         
-        response = self.get_response(request)
+        # Audit entries for the same record are merged across the whole request
+        from .coalesce import request_scope
+        with request_scope():
+            response = self.get_response(request)
         
         # Clear the user after the request
         clear_current_user()
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_company(apps, schema_editor):
+    """Existing entries take the company of the user who performed them, in pk ranges"""
+    AuditLog = apps.get_model('audit', 'AuditLog')
+    User = apps.get_model('accounts', 'User')
+    user_company = User.objects.filter(pk=models.OuterRef('performed_by_id')).values('company_id')[:1]
+    last = AuditLog.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    chunk = 50000
+    for start in range(0, last + 1, chunk):
+        AuditLog.objects.filter(
+            pk__gte=start, pk__lt=start + chunk, performed_by__isnull=False, company__isnull=True
+        ).update(company_id=models.Subquery(user_company))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_role'),
+        ('audit', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='company',
+            field=models.ForeignKey(blank=True, help_text='Company the record belongs to (set at write time, also for system actions)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_logs', to='accounts.company'),
+        ),
+        migrations.RunPython(backfill_company, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['company', 'timestamp'], name='audit_company_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['company', 'model_name', 'timestamp'], name='audit_company_model_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['company', 'action', 'timestamp'], name='audit_company_action_ts_idx'),
+        ),
+    ]
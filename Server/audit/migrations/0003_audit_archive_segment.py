@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_role'),
+        ('audit', '0002_auditlog_company'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month the entries belong to')),
+                ('path', models.CharField(help_text='Path relative to AUDIT_ARCHIVE_DIR', max_length=500)),
+                ('entry_count', models.PositiveIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('min_log_id', models.BigIntegerField()),
+                ('max_log_id', models.BigIntegerField()),
+                ('model_names', models.JSONField(default=list)),
+                ('record_numbers', models.JSONField(blank=True, help_text='Distinct record numbers, or null if there were too many to index', null=True)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_archive_segments', to='accounts.company')),
+            ],
+            options={
+                'ordering': ['-month', '-max_log_id'],
+                'indexes': [models.Index(fields=['company', 'month'], name='audit_audit_company_61e3f1_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from django.utils import timezone
-from accounts.models import User
+from accounts.models import Company, User
 import json
 
 
@@ -22,6 +22,7 @@ class AuditLog(models.Model):
     record_number = models.CharField(max_length=100, null=True, blank=True, help_text="Record identifier (e.g., 'INV-1001', 'SO-2001')")
     action = models.CharField(max_length=20, choices=ACTION_CHOICES, help_text="Action performed on the record")
     performed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, help_text="User who performed the action")
+    company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_logs', help_text="Company the record belongs to (set at write time, also for system actions)")
     before_data = models.JSONField(null=True, blank=True, help_text="Data before the change (for updates)")
     after_data = models.JSONField(null=True, blank=True, help_text="Data after the change")
     timestamp = models.DateTimeField(default=timezone.now, help_text="When the action was performed")
@@ -33,6 +34,10 @@ class AuditLog(models.Model):
             models.Index(fields=['action']),
             models.Index(fields=['performed_by']),
             models.Index(fields=['timestamp']),
+            # The audit views always filter by company and order by timestamp
+            models.Index(fields=['company', 'timestamp'], name='audit_company_ts_idx'),
+            models.Index(fields=['company', 'model_name', 'timestamp'], name='audit_company_model_ts_idx'),
+            models.Index(fields=['company', 'action', 'timestamp'], name='audit_company_action_ts_idx'),
         ]
     
     def __str__(self):
@@ -53,3 +58,44 @@ class AuditLog(models.Model):
         if self.after_data:
             return json.dumps(self.after_data, indent=2, ensure_ascii=False)
         return "N/A"
+
+
+class AuditArchiveSegment(models.Model):
+    """
+    Index entry of one archived, gzip-compressed JSONL file of audit logs.
+    Written by audit.retention; every archive run adds new segments and never
+    rewrites existing ones.
+    """
+    company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_archive_segments')
+    month = models.DateField(help_text="First day of the month the entries belong to")
+    path = models.CharField(max_length=500, help_text="Path relative to AUDIT_ARCHIVE_DIR")
+    entry_count = models.PositiveIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    min_log_id = models.BigIntegerField()
+    max_log_id = models.BigIntegerField()
+    model_names = models.JSONField(default=list)
+    record_numbers = models.JSONField(null=True, blank=True, help_text="Distinct record numbers, or null if there were too many to index")
+    size_bytes = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-month', '-max_log_id']
+        indexes = [
+            models.Index(fields=['company', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.path} ({self.entry_count} entries)"
+
+    def may_contain(self, model_name=None, record_number=None, start=None, end=None):
+        """Whether the segment index allows a match, so non-matching files are never opened"""
+        if model_name and model_name not in self.model_names:
+            return False
+        if record_number and self.record_numbers is not None and record_number not in self.record_numbers:
+            return False
+        if start and self.last_timestamp < start:
+            return False
+        if end and self.first_timestamp >= end:
+            return False
+        return True
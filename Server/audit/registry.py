@@ -0,0 +1,78 @@
+"""
+Registry of audited models.
+
+The audit receivers are connected per model (sender=...) when a model is
+registered, so saves of unaudited models such as RouteLocationPing never
+reach them. Each registration carries the fields to track and the field used
+as the audit record number.
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+
+
+class AuditedModel:
+    """Audit configuration of one model"""
+
+    def __init__(self, model, fields=None, identifier=None):
+        self.model = model
+        self.fields = list(fields) if fields is not None else None
+        self.identifier = identifier
+
+    @property
+    def name(self):
+        return self.model.__name__
+
+    def record_number(self, instance):
+        from .signals import get_record_identifier
+
+        if self.identifier:
+            value = getattr(instance, self.identifier, None)
+            if value not in (None, ""):
+                return str(value)
+        return get_record_identifier(instance)
+
+
+class AuditRegistry:
+    """Connects the audit receivers to registered models only"""
+
+    def __init__(self):
+        self._models = {}
+
+    def register(self, model, fields=None, identifier=None):
+        """
+        Start auditing a model.
+
+        Args:
+            model: Model class
+            fields (list, optional): Fields to track. Defaults to all non-system fields.
+            identifier (str, optional): Field used as record number. Detected if omitted.
+
+        Returns:
+            AuditedModel: The registration
+        """
+        from .signals import audit_post_delete, audit_post_save, audit_pre_save
+
+        config = AuditedModel(model, fields=fields, identifier=identifier)
+        self._models[model] = config
+        uid = f"audit:{model._meta.label}"
+        pre_save.connect(audit_pre_save, sender=model, dispatch_uid=uid)
+        post_save.connect(audit_post_save, sender=model, dispatch_uid=uid)
+        post_delete.connect(audit_post_delete, sender=model, dispatch_uid=uid)
+        return config
+
+    def unregister(self, model):
+        """Stop auditing a model"""
+        uid = f"audit:{model._meta.label}"
+        pre_save.disconnect(sender=model, dispatch_uid=uid)
+        post_save.disconnect(sender=model, dispatch_uid=uid)
+        post_delete.disconnect(sender=model, dispatch_uid=uid)
+        self._models.pop(model, None)
+
+    def get(self, model):
+        """Registration of a model, or None if it is not audited"""
+        return self._models.get(model)
+
+    def is_registered(self, model):
+        return model in self._models
+
+
+audit_registry = AuditRegistry()
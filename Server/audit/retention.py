@@ -0,0 +1,212 @@
+"""
+Audit log retention.
+
+Entries older than AUDIT_RETENTION_DAYS are moved out of the AuditLog table
+into gzip-compressed JSONL files under AUDIT_ARCHIVE_DIR, one segment per
+company and month per archive run. Each segment is indexed by an
+AuditArchiveSegment row (time range, id range, model names, record numbers),
+so searches only open the files that can contain a match.
+
+Archived rows are deleted from the table, so the segments are the only copy:
+AUDIT_ARCHIVE_DIR has no default and must point at durable storage.
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .export import EXPORT_FIELDS
+from .models import AuditArchiveSegment, AuditLog
+
+
+class AuditRetentionService:
+    """Archives old audit logs into compressed segments and searches them"""
+
+    # Segments with more distinct record numbers than this are not indexed by record number
+    RECORD_INDEX_LIMIT = 5000
+
+    @staticmethod
+    def archive_root():
+        """The archive directory; raises ImproperlyConfigured while AUDIT_ARCHIVE_DIR is unset"""
+        if not getattr(settings, "AUDIT_ARCHIVE_DIR", ""):
+            raise ImproperlyConfigured(
+                "AUDIT_ARCHIVE_DIR must be set to durable storage before audit logs are archived"
+            )
+        return Path(settings.AUDIT_ARCHIVE_DIR)
+
+    @staticmethod
+    def default_cutoff():
+        return timezone.now() - timedelta(days=settings.AUDIT_RETENTION_DAYS)
+
+    @staticmethod
+    def partitions(queryset):
+        """(company_id, month start, count) of the given logs, oldest month first"""
+        return queryset.annotate(
+            month=TruncMonth('timestamp')
+        ).values('company_id', 'month').annotate(count=Count('id')).order_by('month', 'company_id')
+
+    @staticmethod
+    def archive(cutoff=None, company_id=None, chunk_size=None, dry_run=False):
+        """
+        Move audit logs older than the cutoff into archive segments.
+
+        Args:
+            cutoff (datetime, optional): Archive entries before this time. Defaults
+                to AUDIT_RETENTION_DAYS ago.
+            company_id (int, optional): Only archive this company's entries
+            chunk_size (int, optional): Rows per read and per DELETE. Defaults to
+                AUDIT_ARCHIVE_CHUNK_SIZE.
+            dry_run (bool): Only report what would be archived
+
+        Returns:
+            list[dict]: One summary per (company, month) partition
+
+        Raises:
+            ImproperlyConfigured: AUDIT_ARCHIVE_DIR is unset (not for dry runs)
+        """
+        if not dry_run:
+            # Fail before any row is touched
+            AuditRetentionService.archive_root()
+        cutoff = cutoff or AuditRetentionService.default_cutoff()
+        chunk_size = chunk_size or settings.AUDIT_ARCHIVE_CHUNK_SIZE
+        old_logs = AuditLog.objects.filter(timestamp__lt=cutoff)
+        if company_id is not None:
+            old_logs = old_logs.filter(company_id=company_id)
+
+        summaries = []
+        for partition in AuditRetentionService.partitions(old_logs):
+            month = partition['month']
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            rows = old_logs.filter(
+                company_id=partition['company_id'], timestamp__gte=month, timestamp__lt=next_month
+            )
+            summary = {
+                'company_id': partition['company_id'],
+                'month': month.date().isoformat(),
+                'entries': partition['count'],
+                'segment': None,
+            }
+            if not dry_run:
+                # Rows a previous, interrupted run archived but did not delete yet
+                for max_id in AuditArchiveSegment.objects.filter(
+                    company_id=partition['company_id'], month=month.date()
+                ).values_list('max_log_id', flat=True):
+                    AuditRetentionService._delete_archived(rows, max_id, chunk_size)
+                segment = AuditRetentionService._write_segment(
+                    rows, partition['company_id'], month, chunk_size
+                )
+                if segment is not None:
+                    AuditRetentionService._delete_archived(rows, segment.max_log_id, chunk_size)
+                    summary['segment'] = segment.path
+                    summary['entries'] = segment.entry_count
+            summaries.append(summary)
+        return summaries
+
+    @staticmethod
+    def _write_segment(rows, company_id, month, chunk_size):
+        """Stream the rows into a new gzip JSONL file and index it; None if there were none"""
+        root = AuditRetentionService.archive_root()
+        directory = root / (str(company_id) if company_id is not None else 'none') / month.strftime('%Y-%m')
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = directory / f".writing-{os.getpid()}.jsonl.gz"
+
+        count = 0
+        first = last = min_id = max_id = None
+        model_names = set()
+        record_numbers = set()
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as fh:
+            for row in rows.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+                row['performed_by'] = row.pop('performed_by__username') or 'System'
+                fh.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+                count += 1
+                first = row['timestamp'] if first is None else min(first, row['timestamp'])
+                last = row['timestamp'] if last is None else max(last, row['timestamp'])
+                min_id = row['id'] if min_id is None else min_id
+                max_id = row['id']
+                model_names.add(row['model_name'])
+                if record_numbers is not None and row['record_number']:
+                    record_numbers.add(row['record_number'])
+                    if len(record_numbers) > AuditRetentionService.RECORD_INDEX_LIMIT:
+                        record_numbers = None
+
+        if not count:
+            tmp_path.unlink()
+            return None
+        final_path = directory / f"{min_id}-{max_id}.jsonl.gz"
+        os.replace(tmp_path, final_path)
+        return AuditArchiveSegment.objects.create(
+            company_id=company_id,
+            month=month.date(),
+            path=str(final_path.relative_to(root)),
+            entry_count=count,
+            first_timestamp=first,
+            last_timestamp=last,
+            min_log_id=min_id,
+            max_log_id=max_id,
+            model_names=sorted(model_names),
+            record_numbers=sorted(record_numbers) if record_numbers is not None else None,
+            size_bytes=final_path.stat().st_size,
+        )
+
+    @staticmethod
+    def _delete_archived(rows, max_id, chunk_size):
+        """Delete archived rows from the live table in chunks, so no single DELETE holds long locks"""
+        archived = rows.filter(id__lte=max_id)
+        while True:
+            ids = list(archived.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return
+            AuditLog.objects.filter(id__in=ids).delete()
+
+    @staticmethod
+    def search(company_id, model_name=None, record_number=None, action=None, start=None, end=None, limit=100):
+        """
+        Search archived audit logs.
+
+        Args:
+            company_id (int): Company whose archive is searched
+            model_name, record_number, action (str, optional): Exact matches
+            start, end (datetime, optional): Time range [start, end)
+            limit (int): Maximum number of entries returned
+
+        Returns:
+            tuple: (matching entries as dicts, newest segments first; number of segments read)
+        """
+        segments = AuditArchiveSegment.objects.filter(company_id=company_id)
+        if start:
+            segments = segments.filter(last_timestamp__gte=start)
+        if end:
+            segments = segments.filter(first_timestamp__lt=end)
+
+        results = []
+        scanned = 0
+        for segment in segments.order_by('-month', '-max_log_id'):
+            if not segment.may_contain(model_name, record_number, start, end):
+                continue
+            scanned += 1
+            with gzip.open(AuditRetentionService.archive_root() / segment.path, 'rt', encoding='utf-8') as fh:
+                for line in fh:
+                    entry = json.loads(line)
+                    if model_name and entry['model_name'] != model_name:
+                        continue
+                    if record_number and entry['record_number'] != record_number:
+                        continue
+                    if action and entry['action'] != action:
+                        continue
+                    if start or end:
+                        timestamp = parse_datetime(entry['timestamp'])
+                        if (start and timestamp < start) or (end and timestamp >= end):
+                            continue
+                    results.append(entry)
+                    if len(results) >= limit:
+                        return results, scanned
+        return results, scanned
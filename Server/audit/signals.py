@@ -1,29 +1,38 @@
 from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from django.apps import apps
 from django.contrib.auth import get_user_model
 from .utils import create_audit_log, get_model_data
 from .middleware import get_current_user, set_current_user
+from . import coalesce
+from .registry import audit_registry
 import json
+import logging
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
-# Models to audit - add more models as needed
-AUDITABLE_MODELS = [
-    'Customer',
-    'Supplier', 
-    'Product',
-    'SalesOrder',
-    'Invoice',
-    'Payment',
-    'Route',
-    'RouteVisit',
-    'User',
-    'Credit'
-]
+# Models to audit, keyed by "app_label.ModelName". Optional settings per model:
+#   fields:     fields to track (default: all non-system fields)
+#   identifier: field used as the audit record number (default: detected)
+AUDITABLE_MODELS = {
+    'main.Customer': {'identifier': 'email'},
+    'main.Supplier': {'identifier': 'email'},
+    'main.Product': {'identifier': 'code'},
+    # SalesOrder and Route history has always been recorded under the pk
+    'transactions.SalesOrder': {},
+    'transactions.Invoice': {'identifier': 'invoice_no'},
+    'transactions.Payment': {},
+    'transactions.Route': {},
+    'transactions.RouteVisit': {},
+    'accounts.User': {'identifier': 'username'},
+    'main.Credit': {},
+}
 
-def should_audit_model(model_name):
-    """Check if a model should be audited"""
-    return model_name in AUDITABLE_MODELS
+def register_auditable_models():
+    """Connect the audit receivers to every model in AUDITABLE_MODELS (called from AuditConfig.ready)"""
+    for label, options in AUDITABLE_MODELS.items():
+        audit_registry.register(apps.get_model(label), **options)
 
 def get_record_identifier(instance):
     """Get a meaningful identifier for the record"""
@@ -45,28 +54,23 @@ def get_record_identifier(instance):
         return str(instance.id)
     return None
 
-# Store original data for comparison
-_original_data = {}
-
-@receiver(pre_save)
 def audit_pre_save(sender, instance, **kwargs):
-    """Store original data before save for update comparison"""
-    if should_audit_model(sender.__name__):
-        try:
-            # Get the original instance from database if it exists
-            if instance.pk:
-                try:
-                    original = sender.objects.get(pk=instance.pk)
-                    _original_data[instance.pk] = get_model_data(original)
-                except sender.DoesNotExist:
-                    pass
-        except Exception as e:
-            print(f"Error in audit_pre_save for {sender.__name__}: {e}")
+    """
+    Make sure an audited instance knows its database state before an update.
+    Instances loaded through the ORM already carry it (LoadedStateMixin);
+    only ones built by hand with an existing pk need a query here.
+    """
+    if instance._state.adding or getattr(instance, "_loaded_values", None) is not None:
+        return
+    try:
+        instance._loaded_values = sender.objects.filter(pk=instance.pk).values().first()
+    except Exception as e:
+        logger.exception(f"Error in audit_pre_save for {sender.__name__}: {e}")
 
-@receiver(post_save)
 def audit_post_save(sender, instance, created, **kwargs):
-    """Create audit log entry when a model is saved"""
-    if not should_audit_model(sender.__name__):
+    """Create audit log entry when a registered model is saved"""
+    config = audit_registry.get(sender)
+    if config is None:
         return
     
     try:
@@ -76,72 +80,68 @@ def audit_post_save(sender, instance, created, **kwargs):
         # Determine action
         action = 'create' if created else 'update'
         
-        # Debug logging to ensure user is captured
-        if current_user:
-            print(f"Audit: Captured user {current_user.username} for {sender.__name__} {action}")
-        else:
-            print(f"Audit: No user captured for {sender.__name__} {action} - using System")
+        if current_user is None:
+            logger.debug(f"Audit: No user captured for {sender.__name__} {action} - using System")
         
         # Get record identifier
-        record_number = get_record_identifier(instance)
+        record_number = config.record_number(instance)
         
         # Prepare data
         before_data = None
-        after_data = get_model_data(instance)
+        after_data = get_model_data(instance, config.fields)
         
-        # For updates, get the before data
-        if not created and instance.pk in _original_data:
-            before_data = _original_data[instance.pk]
-            # Clean up the stored data
-            del _original_data[instance.pk]
+        # For updates, diff against the state the instance was loaded with
+        if not created and hasattr(instance, "loaded_instance"):
+            before_data = get_model_data(instance.loaded_instance(), config.fields)
         
-        # Create audit log
-        create_audit_log(
+        # Coalesced per record within the transaction/request; no-op updates are dropped
+        coalesce.record(
             model=sender.__name__,
+            pk=instance.pk,
             action=action,
             by=current_user,
             number=record_number,
             before_data=before_data,
-            after_data=after_data
+            after_data=after_data,
+            company=getattr(instance, 'company_id', None)
         )
         
     except Exception as e:
-        print(f"Error creating audit log for {sender.__name__} {action}: {e}")
+        logger.exception(f"Error creating audit log for {sender.__name__} {action}: {e}")
 
-@receiver(post_delete)
 def audit_post_delete(sender, instance, **kwargs):
-    """Create audit log entry when a model is deleted"""
-    if not should_audit_model(sender.__name__):
+    """Create audit log entry when a registered model is deleted"""
+    config = audit_registry.get(sender)
+    if config is None:
         return
     
     try:
         # Get current user from middleware
         current_user = get_current_user()
         
-        # Debug logging to ensure user is captured
-        if current_user:
-            print(f"Audit: Captured user {current_user.username} for {sender.__name__} delete")
-        else:
-            print(f"Audit: No user captured for {sender.__name__} delete - using System")
+        if current_user is None:
+            logger.debug(f"Audit: No user captured for {sender.__name__} delete - using System")
         
         # Get record identifier
-        record_number = get_record_identifier(instance)
+        record_number = config.record_number(instance)
         
         # Get the data before deletion
-        before_data = get_model_data(instance)
+        before_data = get_model_data(instance, config.fields)
         
-        # Create audit log
-        create_audit_log(
+        # Coalesced per record; a delete cancels a create from the same transaction/request
+        coalesce.record(
             model=sender.__name__,
+            pk=instance.pk,
             action='delete',
             by=current_user,
             number=record_number,
             before_data=before_data,
-            after_data=None
+            after_data=None,
+            company=getattr(instance, 'company_id', None)
         )
         
     except Exception as e:
-        print(f"Error creating audit log for {sender.__name__} delete: {e}")
+        logger.exception(f"Error creating audit log for {sender.__name__} delete: {e}")
 
 # Special signal for user login/logout
 @receiver(post_save, sender=User)
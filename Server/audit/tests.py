@@ -1,3 +1,218 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import Company
+from transactions.models import Route, SalesOrder
+from . import coalesce
+from .models import AuditArchiveSegment, AuditLog
+from .registry import audit_registry
+from .retention import AuditRetentionService
+from .writer import AuditLogWriter
+
+
+def entry(number, model_name="Invoice"):
+    return AuditLog(model_name=model_name, record_number=number, action="update")
+
+
+@override_settings(AUDIT_LOG_ASYNC=True)
+class AuditLogWriterTests(TestCase):
+    def setUp(self):
+        self.writer = AuditLogWriter(batch_size=2, flush_interval=60)
+        # Flushes are driven by the test; no background thread
+        patcher = mock.patch.object(self.writer, "_ensure_thread")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def numbers(self):
+        return sorted(AuditLog.objects.values_list("record_number", flat=True))
+
+    def test_entries_are_queued_on_commit_and_dropped_on_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.submit([entry("kept")])
+            try:
+                with transaction.atomic():
+                    self.writer.submit([entry("rolled back")])
+                    raise ValueError
+            except ValueError:
+                pass
+            self.assertEqual(self.writer._buffer, [])
+        self.assertEqual([e.record_number for e in self.writer._buffer], ["kept"])
+        self.assertEqual(self.numbers(), [])
+
+        self.writer.flush()
+        self.assertEqual(self.numbers(), ["kept"])
+
+    def test_full_batch_wakes_the_writer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.submit([entry("1")])
+        self.assertFalse(self.writer._wakeup.is_set())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.submit([entry("2")])
+        self.assertTrue(self.writer._wakeup.is_set())
+
+    def test_failed_batch_keeps_valid_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.submit([entry("1"), entry("2"), entry("3", model_name=None), entry("4")])
+        with self.assertLogs("audit.writer", level="ERROR"):
+            self.writer.flush()
+        self.assertEqual(self.numbers(), ["1", "2", "4"])
+        self.assertEqual((self.writer.written, self.writer.dropped), (3, 1))
+
+    def test_sync_failure_leaves_callers_transaction_usable(self):
+        with override_settings(AUDIT_LOG_ASYNC=False), self.assertLogs("audit.writer", level="ERROR"):
+            with transaction.atomic():
+                self.writer.submit([entry(None, model_name=None)])
+                self.writer.submit([entry("after")])
+        self.assertEqual(self.numbers(), ["after"])
+
+    def test_shutdown_drains_the_queue_and_writes_synchronously_after(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.submit([entry("1")])
+        self.writer.shutdown()
+        self.assertEqual(self.numbers(), ["1"])
+
+        self.writer.submit([entry("2")])
+        self.assertEqual(self.writer._buffer, [])
+        self.assertEqual(self.numbers(), ["1", "2"])
+
+
+class CoalesceTests(TestCase):
+    def record(self, pk, action, before=None, after=None):
+        coalesce.record("Invoice", pk, action, None, f"INV-{pk}", before, after)
+
+    def rows(self):
+        return list(
+            AuditLog.objects.order_by("id").values_list("record_number", "action", "before_data", "after_data")
+        )
+
+    def test_entries_for_one_record_are_merged_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record(1, "create", after={"amount": 1})
+            self.record(1, "update", {"amount": 1}, {"amount": 2})
+            self.record(2, "update", {"amount": 1}, {"amount": 2})
+            self.record(2, "update", {"amount": 2}, {"amount": 3})
+            self.record(3, "create", after={"amount": 1})
+            self.record(3, "delete", {"amount": 1})
+            self.assertEqual(self.rows(), [])
+        self.assertEqual(self.rows(), [
+            ("INV-1", "create", None, {"amount": 2}),
+            ("INV-2", "update", {"amount": 1}, {"amount": 3}),
+        ])
+
+    def test_unchanged_updates_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record(1, "update", {"amount": 1}, {"amount": 1})
+            self.record(2, "update", {"amount": 1}, {"amount": 2})
+            self.record(2, "update", {"amount": 2}, {"amount": 1})
+        self.assertEqual(self.rows(), [])
+
+    def test_entries_of_a_rolled_back_savepoint_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record(1, "update", {"amount": 1}, {"amount": 2})
+            try:
+                with transaction.atomic():
+                    self.record(1, "update", {"amount": 2}, {"amount": 3})
+                    self.record(2, "create", after={"amount": 1})
+                    raise ValueError
+            except ValueError:
+                pass
+            with transaction.atomic():
+                self.record(3, "create", after={"amount": 1})
+        self.assertEqual(self.rows(), [
+            ("INV-1", "update", {"amount": 1}, {"amount": 2}),
+            ("INV-3", "create", None, {"amount": 1}),
+        ])
+
+    def test_request_scope_merges_across_transactions(self):
+        with coalesce.request_scope():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.record(1, "update", {"amount": 1}, {"amount": 2})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.record(1, "update", {"amount": 2}, {"amount": 3})
+                with transaction.atomic():
+                    self.record(1, "update", {"amount": 3}, {"amount": 4})
+            self.assertEqual(self.rows(), [])
+        self.assertEqual(self.rows(), [("INV-1", "update", {"amount": 1}, {"amount": 4})])
+
+
+class AuditRegistryTests(TestCase):
+    def test_orders_and_routes_keep_pk_record_numbers(self):
+        order = SalesOrder(order_number="SO-0001")
+        route = Route(route_number="RT-0001")
+        self.assertEqual(audit_registry.get(SalesOrder).record_number(order), str(order.pk))
+        self.assertEqual(audit_registry.get(Route).record_number(route), str(route.pk))
+
+
+class AuditRetentionTests(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir, ignore_errors=True)
+        settings_override = override_settings(AUDIT_ARCHIVE_DIR=archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.company = Company.objects.create(name="Acme")
+        self.other = Company.objects.create(name="Other")
+        self.old = timezone.make_aware(datetime(2024, 3, 10))
+        self.cutoff = timezone.make_aware(datetime(2024, 6, 1))
+        for index in range(3):
+            self.log(f"INV-{index}", self.company, self.old + timedelta(days=index))
+        self.log("INV-other", self.other, self.old)
+        self.log("INV-new", self.company, self.cutoff + timedelta(days=1))
+
+    def log(self, number, company, timestamp):
+        return AuditLog.objects.create(
+            model_name="Invoice", record_number=number, action="update", company=company, timestamp=timestamp
+        )
+
+    def live_numbers(self):
+        return sorted(AuditLog.objects.values_list("record_number", flat=True))
+
+    def test_archived_entries_are_searchable(self):
+        summaries = AuditRetentionService.archive(cutoff=self.cutoff, company_id=self.company.pk, chunk_size=2)
+        self.assertEqual([(s["month"], s["entries"]) for s in summaries], [("2024-03-01", 3)])
+        segment = AuditArchiveSegment.objects.get()
+        self.assertEqual((segment.entry_count, segment.record_numbers), (3, ["INV-0", "INV-1", "INV-2"]))
+
+        results, scanned = AuditRetentionService.search(self.company.pk, record_number="INV-1")
+        self.assertEqual(([entry["record_number"] for entry in results], scanned), (["INV-1"], 1))
+        self.assertEqual(AuditRetentionService.search(self.company.pk, record_number="INV-9"), ([], 0))
+
+    def test_only_archived_ids_are_deleted(self):
+        write_segment = AuditRetentionService._write_segment
+
+        def write_then_insert(*args, **kwargs):
+            segment = write_segment(*args, **kwargs)
+            # Logged for the same month while the segment was being written
+            self.log("INV-late", self.company, self.old)
+            return segment
+
+        with mock.patch.object(AuditRetentionService, "_write_segment", side_effect=write_then_insert):
+            AuditRetentionService.archive(cutoff=self.cutoff, company_id=self.company.pk, chunk_size=2)
+        self.assertEqual(self.live_numbers(), ["INV-late", "INV-new", "INV-other"])
+
+    def test_dry_run_changes_nothing(self):
+        with override_settings(AUDIT_ARCHIVE_DIR=""):
+            summaries = AuditRetentionService.archive(cutoff=self.cutoff, dry_run=True)
+        self.assertEqual(sorted(s["entries"] for s in summaries), [1, 3])
+        self.assertEqual(len(self.live_numbers()), 5)
+        self.assertFalse(AuditArchiveSegment.objects.exists())
+
+    def test_failed_segment_write_keeps_rows(self):
+        with mock.patch("audit.retention.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                AuditRetentionService.archive(cutoff=self.cutoff, company_id=self.company.pk)
+        self.assertEqual(len(self.live_numbers()), 5)
+        self.assertFalse(AuditArchiveSegment.objects.exists())
+
+    def test_unset_archive_dir_is_refused(self):
+        with override_settings(AUDIT_ARCHIVE_DIR=""), self.assertRaises(ImproperlyConfigured):
+            AuditRetentionService.archive(cutoff=self.cutoff)
+        self.assertEqual(len(self.live_numbers()), 5)
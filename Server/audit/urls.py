@@ -9,5 +9,6 @@ urlpatterns = [
     path('statistics/', views.AuditStatisticsView.as_view(), name='audit_statistics'),
     path('dashboard/', views.AuditDashboardView.as_view(), name='audit_dashboard'),
     path('export/', views.AuditExportView.as_view(), name='audit_export'),
+    path('archive/search/', views.AuditArchiveSearchView.as_view(), name='audit_archive_search'),
 ]
 
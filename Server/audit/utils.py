@@ -1,6 +1,7 @@
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from .models import AuditLog
+from .writer import audit_writer
 import json
 import uuid
 from decimal import Decimal
@@ -27,6 +28,54 @@ class AuditJSONEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+def _resolve_performed_by(by):
+    """Turn the 'by' argument of create_audit_log into a User or None"""
+    performed_by = None
+    if by is not None:
+        if hasattr(by, 'pk'):  # It's a User instance
+            performed_by = by
+        elif isinstance(by, (int, str)):  # It's a user ID
+            try:
+                performed_by = User.objects.get(pk=by)
+            except User.DoesNotExist:
+                performed_by = None
+        elif by == 'system' or by is None:
+            performed_by = None
+        else:
+            raise ValueError("Invalid 'by' parameter. Must be a User instance, user ID, 'system', or None")
+    return performed_by
+
+
+def _resolve_company_id(company, performed_by):
+    """Company for an audit entry: the given company (instance or id), else the performing user's"""
+    if company is not None:
+        return getattr(company, 'pk', company)
+    if performed_by is not None:
+        return getattr(performed_by, 'company_id', None)
+    return None
+
+
+def _to_json_value(value):
+    """Convert a value to something a JSONField stores as-is, the way AuditJSONEncoder would"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(key): _to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_to_json_value(item) for item in value]
+    return AuditJSONEncoder().default(value)
+
+
+def _serialize_audit_data(data, label):
+    """Make audit data JSONField-safe without a json.dumps/json.loads round trip"""
+    if data is None:
+        return None
+    try:
+        return _to_json_value(data)
+    except (TypeError, ValueError):
+        return {"error": f"Failed to serialize {label}"}
+
+
 def create_audit_log(
     model: str,
     action: str,
@@ -34,7 +83,8 @@ def create_audit_log(
     number: str = None,
     before_data: dict = None,
     after_data: dict = None,
-    timestamp=None
+    timestamp=None,
+    company=None
 ):
     """
     Create an audit log entry for tracking changes across the system.
@@ -47,9 +97,13 @@ def create_audit_log(
         before_data (dict, optional): Data before the change (for updates)
         after_data (dict, optional): Data after the change
         timestamp: When the action was performed (defaults to timezone.now())
+        company (optional): Company (instance or id) the record belongs to.
+            Defaults to the company of the performing user.
     
     Returns:
-        AuditLog: The created audit log instance
+        AuditLog: The audit log instance. It is handed to the batched audit
+        writer (audit.writer) and saved asynchronously, so it has no pk yet
+        unless AUDIT_LOG_ASYNC is off.
         
     Example:
         create_audit_log(
@@ -67,55 +121,75 @@ def create_audit_log(
     if action not in valid_actions:
         raise ValueError(f"Invalid action '{action}'. Must be one of: {valid_actions}")
     
-    # Handle user parameter
-    performed_by = None
-    if by is not None:
-        if hasattr(by, 'pk'):  # It's a User instance
-            performed_by = by
-        elif isinstance(by, (int, str)):  # It's a user ID
-            try:
-                performed_by = User.objects.get(pk=by)
-            except User.DoesNotExist:
-                performed_by = None
-        elif by == 'system' or by is None:
-            performed_by = None
-        else:
-            raise ValueError("Invalid 'by' parameter. Must be a User instance, user ID, 'system', or None")
+    performed_by = _resolve_performed_by(by)
     
     # Use current timestamp if not provided
     if timestamp is None:
         timestamp = timezone.now()
     
     # Serialize data using custom encoder to handle UUIDs and other non-serializable objects
-    serialized_before_data = None
-    serialized_after_data = None
-    
-    if before_data is not None:
-        try:
-            serialized_before_data = json.loads(json.dumps(before_data, cls=AuditJSONEncoder))
-        except (TypeError, ValueError):
-            serialized_before_data = {"error": "Failed to serialize before_data"}
-    
-    if after_data is not None:
-        try:
-            serialized_after_data = json.loads(json.dumps(after_data, cls=AuditJSONEncoder))
-        except (TypeError, ValueError):
-            serialized_after_data = {"error": "Failed to serialize after_data"}
-    
-    # Create the audit log entry
-    audit_log = AuditLog.objects.create(
+    serialized_before_data = _serialize_audit_data(before_data, "before_data")
+    serialized_after_data = _serialize_audit_data(after_data, "after_data")
+    
+    # Queue the audit log entry; the writer inserts it in a batch after commit
+    audit_log = AuditLog(
         model_name=model,
         record_number=number,
         action=action,
         performed_by=performed_by,
+        company_id=_resolve_company_id(company, performed_by),
         before_data=serialized_before_data,
         after_data=serialized_after_data,
         timestamp=timestamp
     )
+    audit_writer.submit([audit_log])
     
     return audit_log
 
 
+def create_audit_logs_bulk(model: str, action: str, by=None, entries=(), timestamp=None, company=None):
+    """
+    Create many audit log entries for the same model and action with one INSERT.
+    Used by batched write paths (e.g. bulk payment posting) that bypass save()
+    and therefore the audit signals.
+    
+    Args:
+        model (str): Name of the model being audited
+        action (str): Action performed (see create_audit_log)
+        by: User performing the action
+        entries: iterable of (number, before_data, after_data) tuples
+        timestamp: When the actions were performed (defaults to timezone.now())
+        company (optional): Company of the records (see create_audit_log)
+    
+    Returns:
+        list[AuditLog]: The audit log instances, queued like create_audit_log's
+    """
+    valid_actions = ['create', 'update', 'delete', 'block', 'unblock', 'read']
+    if action not in valid_actions:
+        raise ValueError(f"Invalid action '{action}'. Must be one of: {valid_actions}")
+    
+    performed_by = _resolve_performed_by(by)
+    company_id = _resolve_company_id(company, performed_by)
+    if timestamp is None:
+        timestamp = timezone.now()
+    
+    audit_logs = [
+        AuditLog(
+            model_name=model,
+            record_number=number,
+            action=action,
+            performed_by=performed_by,
+            company_id=company_id,
+            before_data=_serialize_audit_data(before_data, "before_data"),
+            after_data=_serialize_audit_data(after_data, "after_data"),
+            timestamp=timestamp
+        )
+        for number, before_data, after_data in entries
+    ]
+    audit_writer.submit(audit_logs)
+    return audit_logs
+
+
 def get_model_data(instance, fields=None):
     """
     Extract data from a model instance for audit logging.
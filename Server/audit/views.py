@@ -1,20 +1,43 @@
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from .export import iter_csv, iter_gzip, iter_ndjson, iter_rows
 from .models import AuditLog
+from .retention import AuditRetentionService
 from .serializers import AuditLogSerializer
 
 
+def company_audit_logs(user):
+    """
+    Audit logs of the user's company, including system actions.
+    Filters on AuditLog.company so the (company, ..., timestamp) indexes apply.
+    """
+    if hasattr(user, 'company') and user.company_id:
+        return AuditLog.objects.filter(company_id=user.company_id)
+    return AuditLog.objects.none()
+
+
+def day_start(day):
+    """Aware start of a local day, so day filters become index range scans on timestamp"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
 class AuditLogListView(generics.ListAPIView):
     """
     API endpoint to list audit logs with filtering and search capabilities.
-    Only shows audit logs from users in the same company as the current user.
+    Only shows audit logs of the current user's company.
     """
     serializer_class = AuditLogSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -23,79 +46,72 @@ class AuditLogListView(generics.ListAPIView):
     search_fields = ['model_name', 'record_number', 'performed_by__username']
     ordering_fields = ['timestamp', 'model_name', 'action']
     ordering = ['-timestamp']
+    # Cursor pages follow the (company, timestamp) index; ?ordering= applies to unpaginated lists
+    keyset_ordering = ('-timestamp', '-id')
     
     def get_queryset(self):
         """
-        Filter audit logs to only show logs from users in the same company.
+        Filter audit logs to only show logs of the user's company.
         """
-        user = self.request.user
-        if hasattr(user, 'company') and user.company:
-            return AuditLog.objects.filter(
-                performed_by__company=user.company
-            )
-        else:
-            # If user has no company, return empty queryset
-            return AuditLog.objects.none()
+        return company_audit_logs(self.request.user).select_related('performed_by')
 
 
 class AuditLogDetailView(generics.RetrieveAPIView):
     """
     API endpoint to retrieve a specific audit log entry.
-    Only allows access to audit logs from users in the same company.
+    Only allows access to audit logs of the current user's company.
     """
     serializer_class = AuditLogSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         """
-        Filter audit logs to only show logs from users in the same company.
+        Filter audit logs to only show logs of the user's company.
         """
-        user = self.request.user
-        if hasattr(user, 'company') and user.company:
-            return AuditLog.objects.filter(
-                performed_by__company=user.company
-            )
-        else:
-            # If user has no company, return empty queryset
-            return AuditLog.objects.none()
+        return company_audit_logs(self.request.user).select_related('performed_by')
 
 
 class AuditStatisticsView(APIView):
     """
     API endpoint to get audit statistics.
-    Only shows statistics for audit logs from users in the same company.
+    Only shows statistics for audit logs of the current user's company.
+    Built from two grouped queries: per (day, action, model) and per user.
     """
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
         days = int(request.query_params.get('days', 30))
         start_date = timezone.now() - timedelta(days=days)
+        today = timezone.localdate()
+        week_start = day_start(today - timedelta(days=6))
         
         # Filter by company
-        user = request.user
-        if hasattr(user, 'company') and user.company:
-            base_queryset = AuditLog.objects.filter(
-                performed_by__company=user.company,
-                timestamp__gte=start_date
-            )
-        else:
-            base_queryset = AuditLog.objects.none()
+        company_logs = company_audit_logs(request.user)
         
-        # Get basic statistics
-        total_logs = base_queryset.count()
+        # One pass over the period and the last 7 days, grouped by day, action and model
+        buckets = company_logs.filter(
+            timestamp__gte=min(start_date, week_start)
+        ).annotate(
+            day=TruncDate('timestamp')
+        ).values('day', 'action', 'model_name').annotate(
+            count=Count('id'),
+            in_period=Count('id', filter=Q(timestamp__gte=start_date))
+        ).order_by()
         
-        # Action statistics
-        action_stats = base_queryset.values('action').annotate(
-            count=Count('id')
-        ).order_by('-count')
-        
-        # Model statistics
-        model_stats = base_queryset.values('model_name').annotate(
-            count=Count('id')
-        ).order_by('-count')
+        total_logs = 0
+        action_counts = defaultdict(int)
+        model_counts = defaultdict(int)
+        day_counts = defaultdict(int)
+        for bucket in buckets:
+            total_logs += bucket['in_period']
+            if bucket['in_period']:
+                action_counts[bucket['action']] += bucket['in_period']
+                model_counts[bucket['model_name']] += bucket['in_period']
+            day_counts[bucket['day']] += bucket['count']
         
         # User statistics
-        user_stats = base_queryset.filter(
+        user_stats = company_logs.filter(
+            timestamp__gte=start_date,
             performed_by__isnull=False
         ).values('performed_by__username').annotate(
             count=Count('id')
@@ -104,56 +120,59 @@ class AuditStatisticsView(APIView):
         # Daily statistics for the last 7 days
         daily_stats = []
         for i in range(7):
-            date = timezone.now().date() - timedelta(days=i)
-            if hasattr(user, 'company') and user.company:
-                count = AuditLog.objects.filter(
-                    performed_by__company=user.company,
-                    timestamp__date=date
-                ).count()
-            else:
-                count = 0
+            date = today - timedelta(days=i)
             daily_stats.append({
                 'date': date.isoformat(),
-                'count': count
+                'count': day_counts.get(date, 0)
             })
         
         return Response({
             'total_logs': total_logs,
-            'action_stats': list(action_stats),
-            'model_stats': list(model_stats),
+            'action_stats': self._ranked('action', action_counts),
+            'model_stats': self._ranked('model_name', model_counts),
             'user_stats': list(user_stats),
             'daily_stats': daily_stats,
             'period_days': days
         })
+    
+    @staticmethod
+    def _ranked(key, counts):
+        return [{key: name, 'count': count} for name, count in sorted(counts.items(), key=lambda item: -item[1])]
 
 
 class AuditDashboardView(APIView):
     """
     API endpoint to get audit dashboard data.
-    Only shows data for audit logs from users in the same company.
+    Only shows data for audit logs of the current user's company.
+    The counters and top users come from one grouped query over the last week.
     """
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        today = timezone.now().date()
+        today = day_start(timezone.localdate())
         yesterday = today - timedelta(days=1)
         week_ago = today - timedelta(days=7)
         
         # Filter by company
-        user = request.user
-        if hasattr(user, 'company') and user.company:
-            base_queryset = AuditLog.objects.filter(performed_by__company=user.company)
-        else:
-            base_queryset = AuditLog.objects.none()
-        
-        # Today's logs
-        today_logs = base_queryset.filter(timestamp__date=today).count()
+        base_queryset = company_audit_logs(request.user)
         
-        # Yesterday's logs
-        yesterday_logs = base_queryset.filter(timestamp__date=yesterday).count()
+        # Today's, yesterday's and this week's logs per user (None = system actions)
+        per_user = base_queryset.filter(
+            timestamp__gte=week_ago
+        ).values('performed_by__username').annotate(
+            today=Count('id', filter=Q(timestamp__gte=today)),
+            yesterday=Count('id', filter=Q(timestamp__gte=yesterday, timestamp__lt=today)),
+            week=Count('id')
+        ).order_by()
         
-        # This week's logs
-        week_logs = base_queryset.filter(timestamp__date__gte=week_ago).count()
+        today_logs = yesterday_logs = week_logs = 0
+        user_counts = []
+        for row in per_user:
+            today_logs += row['today']
+            yesterday_logs += row['yesterday']
+            week_logs += row['week']
+            if row['performed_by__username'] is not None:
+                user_counts.append({'performed_by__username': row['performed_by__username'], 'count': row['week']})
         
         # Recent activity (last 10 logs)
         recent_logs = base_queryset.select_related('performed_by').order_by('-timestamp')[:10]
@@ -169,52 +188,116 @@ class AuditDashboardView(APIView):
             })
         
         # Top active users
-        top_users = base_queryset.filter(
-            timestamp__date__gte=week_ago,
-            performed_by__isnull=False
-        ).values('performed_by__username').annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
+        top_users = sorted(user_counts, key=lambda row: -row['count'])[:5]
         
         return Response({
             'today_logs': today_logs,
             'yesterday_logs': yesterday_logs,
             'week_logs': week_logs,
             'recent_activity': recent_activity,
-            'top_users': list(top_users)
+            'top_users': top_users
         })
 
 
 class AuditExportView(APIView):
     """
     API endpoint to export audit logs.
-    Only exports audit logs from users in the same company.
+    Only exports audit logs of the current user's company.
+
+    Query params:
+        stream: "csv" or "ndjson" to stream plain rows instead of the JSON document
+        gzip: "true" to send the stream as a gzip file
+    The default JSON document is streamed as well, so exports of any size use
+    constant memory.
     """
     permission_classes = [permissions.IsAuthenticated]
+    CHUNK_SIZE = 2000
     
     def get(self, request):
+        stream = request.query_params.get('stream', 'json')
+        if stream not in ('json', 'csv', 'ndjson'):
+            return Response({'detail': "stream must be 'json', 'csv' or 'ndjson'."}, status=status.HTTP_400_BAD_REQUEST)
+        use_gzip = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+        
         # Filter by company first
-        user = request.user
-        if hasattr(user, 'company') and user.company:
-            queryset = AuditLog.objects.filter(performed_by__company=user.company)
-        else:
-            queryset = AuditLog.objects.none()
+        queryset = company_audit_logs(request.user)
         
         # Apply additional filters
         if 'model_name' in request.query_params:
             queryset = queryset.filter(model_name=request.query_params['model_name'])
         if 'action' in request.query_params:
             queryset = queryset.filter(action=request.query_params['action'])
-        if 'date_from' in request.query_params:
-            queryset = queryset.filter(timestamp__date__gte=request.query_params['date_from'])
-        if 'date_to' in request.query_params:
-            queryset = queryset.filter(timestamp__date__lte=request.query_params['date_to'])
+        try:
+            if 'date_from' in request.query_params:
+                date_from = datetime.strptime(request.query_params['date_from'], '%Y-%m-%d').date()
+                queryset = queryset.filter(timestamp__gte=day_start(date_from))
+            if 'date_to' in request.query_params:
+                date_to = datetime.strptime(request.query_params['date_to'], '%Y-%m-%d').date()
+                queryset = queryset.filter(timestamp__lt=day_start(date_to + timedelta(days=1)))
+        except ValueError:
+            return Response({'detail': 'date_from and date_to must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Serialize the data
-        serializer = AuditLogSerializer(queryset, many=True)
+        if stream == 'csv':
+            chunks, content_type, extension = iter_csv(iter_rows(queryset, self.CHUNK_SIZE)), 'text/csv', 'csv'
+        elif stream == 'ndjson':
+            chunks, content_type, extension = iter_ndjson(iter_rows(queryset, self.CHUNK_SIZE)), 'application/x-ndjson', 'ndjson'
+        else:
+            chunks, content_type, extension = self._stream_json(queryset, timezone.now()), 'application/json', 'json'
         
-        return Response({
-            'logs': serializer.data,
-            'count': queryset.count(),
-            'exported_at': timezone.now().isoformat()
-        })
+        filename = f"audit-logs-{timezone.localdate().isoformat()}.{extension}"
+        if use_gzip:
+            chunks, content_type, filename = iter_gzip(chunks), 'application/gzip', filename + '.gz'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        if use_gzip or stream != 'json':
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    def _stream_json(self, queryset, exported_at):
+        """Emit the same document as the serializer-based export, one log at a time"""
+        yield '{"logs": ['
+        count = 0
+        for log in queryset.select_related('performed_by').order_by('-timestamp', '-id').iterator(chunk_size=self.CHUNK_SIZE):
+            yield ("," if count else "") + json.dumps(AuditLogSerializer(log).data, cls=DjangoJSONEncoder)
+            count += 1
+        yield f'], "count": {count}, "exported_at": {json.dumps(exported_at.isoformat())}}}'
+
+
+class AuditArchiveSearchView(APIView):
+    """
+    API endpoint to search audit logs moved to the archive by the retention job.
+    Admins only; searches the archive of the current user's company.
+
+    Query params: model_name, record_number, action, date_from, date_to
+    (YYYY-MM-DD) and limit (default 100, at most 1000).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    MAX_LIMIT = 1000
+    
+    def get(self, request):
+        user = request.user
+        if getattr(user, 'role', '') != 'admin':
+            return Response({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+        if not user.company_id:
+            return Response({'results': [], 'segments_scanned': 0})
+        
+        params = request.query_params
+        try:
+            limit = min(int(params.get('limit', 100)), self.MAX_LIMIT)
+            start = end = None
+            if 'date_from' in params:
+                start = day_start(datetime.strptime(params['date_from'], '%Y-%m-%d').date())
+            if 'date_to' in params:
+                end = day_start(datetime.strptime(params['date_to'], '%Y-%m-%d').date() + timedelta(days=1))
+        except ValueError:
+            return Response({'detail': 'limit must be a number and dates YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results, scanned = AuditRetentionService.search(
+            user.company_id,
+            model_name=params.get('model_name'),
+            record_number=params.get('record_number'),
+            action=params.get('action'),
+            start=start,
+            end=end,
+            limit=limit
+        )
+        return Response({'results': results, 'segments_scanned': scanned})
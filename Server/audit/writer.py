@@ -0,0 +1,134 @@
+"""
+Batched, asynchronous writer for AuditLog rows.
+
+create_audit_log() hands unsaved AuditLog instances to the writer instead of
+inserting them inside the request. Entries produced inside a transaction are
+queued only once it commits (and dropped with it on rollback); a daemon
+thread drains the queue with bulk_create when it reaches AUDIT_LOG_BATCH_SIZE
+entries or every AUDIT_LOG_FLUSH_INTERVAL seconds.
+
+With AUDIT_LOG_ASYNC off entries are inserted synchronously, inside the
+caller's transaction. That is the default under `manage.py test` and on
+serverless deploys (VERCEL set): a platform that freezes the process between
+requests would leave the writer thread, and the entries it holds, suspended
+until the next invocation or lose them when the instance is recycled.
+"""
+import atexit
+import logging
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """Buffers AuditLog instances and writes them in batches from a background thread"""
+
+    def __init__(self, batch_size=200, flush_interval=2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def is_async(self):
+        return getattr(settings, "AUDIT_LOG_ASYNC", True) and not self._stopping
+
+    def submit(self, entries):
+        """
+        Queue AuditLog instances for writing.
+
+        Inside a transaction the entries are queued on commit, so rolled back
+        changes leave no audit trail. In sync mode they are inserted right away,
+        as part of the caller's transaction.
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        if not self.is_async:
+            self._write(entries)
+        elif connection.in_atomic_block:
+            transaction.on_commit(partial(self._accept, entries))
+        else:
+            self._accept(entries)
+
+    def _accept(self, entries):
+        if not self.is_async:
+            self._write(entries)
+            return
+        with self._lock:
+            self._buffer.extend(entries)
+            full = len(self._buffer) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write everything buffered so far on the calling thread"""
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+        self._write(entries)
+
+    def shutdown(self):
+        """Stop buffering and drain the queue synchronously (registered with atexit)"""
+        self._stopping = True
+        self._wakeup.set()
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # The writer thread owns its own connection; don't hold it between batches
+                connection.close()
+
+    def _write(self, entries):
+        for start in range(0, len(entries), self.batch_size):
+            batch = entries[start:start + self.batch_size]
+            try:
+                # A savepoint, so a failure in sync mode leaves the caller's transaction usable
+                with transaction.atomic():
+                    AuditLog.objects.bulk_create(batch)
+                written = len(batch)
+            except Exception:
+                # Keep the rest of the batch: retry the entries one by one
+                logger.exception(f"Failed to write {len(batch)} audit log entries, retrying one by one")
+                written = 0
+                for entry in batch:
+                    try:
+                        with transaction.atomic():
+                            AuditLog.objects.bulk_create([entry])
+                        written += 1
+                    except Exception:
+                        logger.error(f"Dropped audit log entry {entry.model_name} {entry.record_number} {entry.action}")
+            with self._lock:
+                self.written += written
+                self.dropped += len(batch) - written
+
+
+audit_writer = AuditLogWriter(
+    batch_size=getattr(settings, "AUDIT_LOG_BATCH_SIZE", 200),
+    flush_interval=getattr(settings, "AUDIT_LOG_FLUSH_INTERVAL", 2.0),
+)
+atexit.register(audit_writer.shutdown)
@@ -0,0 +1,67 @@
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+
+def parse_field_list(value):
+    """Names of a comma separated query parameter, e.g. "id, status" -> {'id', 'status'}"""
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin for sparse fieldsets on reads.
+
+    ?fields=id,status renders only the named fields. Fields listed in
+    Meta.expandable_fields are left out unless named in ?expand= (or in
+    ?fields=). Only the top-level serializer of a safe request is affected;
+    nested serializers and writes keep their full, non-expanded field set.
+
+    Pair it with a PrefetchProfile using by_field, so the relations behind
+    fields that are not rendered are not loaded either.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.get_sparse_params()
+        included = expand | (requested or set())
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in included:
+                fields.pop(name, None)
+        if requested:
+            for name in list(fields):
+                if name not in included:
+                    fields.pop(name)
+        return fields
+
+    def get_sparse_params(self):
+        """(requested field names or None, expanded field names) of the current request"""
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or not self._is_root():
+            return None, set()
+        params = request.query_params
+        return (
+            parse_field_list(params.get(self.fields_query_param)) or None,
+            parse_field_list(params.get(self.expand_query_param)),
+        )
+
+    def _is_root(self):
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+
+class SummaryListMixin:
+    """
+    ViewSet mixin serving the list action with `summary_serializer_class`,
+    a slim serializer whose heavy fields are only rendered via ?expand=.
+    Retrieve and writes keep using serializer_class.
+    """
+    summary_serializer_class = None
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self.summary_serializer_class is not None:
+            return self.summary_serializer_class
+        return super().get_serializer_class()
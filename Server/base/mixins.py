@@ -0,0 +1,65 @@
+import copy
+
+
+class LoadedStateMixin:
+    """
+    Keeps the field values an instance was loaded with (keyed by attname) and
+    refreshes them after every save(), so signal receivers can diff against
+    the database state without re-reading the row. Mix in before the Django
+    model base class.
+    """
+
+    # Field values as last read from / written to the database
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _snapshot(self, fields=None):
+        deferred = self.get_deferred_fields()
+        values = dict(self._loaded_values or {})
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                continue
+            if fields is None or field.attname in fields or field.name in fields:
+                values[field.attname] = getattr(self, field.attname)
+        self._loaded_values = values
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot(kwargs.get("update_fields"))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._snapshot(fields)
+
+    def loaded_instance(self):
+        """
+        A copy of this instance holding the loaded values, or None when it was
+        never loaded or saved. Related objects cached on this instance are kept
+        where the foreign key did not change, so reading them costs no query.
+        """
+        if self._loaded_values is None:
+            return None
+        original = copy.copy(self)
+        original.__dict__.update(self._loaded_values)
+        original._state = copy.copy(self._state)
+        original._state.fields_cache = {
+            name: value
+            for name, value in self._state.fields_cache.items()
+            if not self._related_changed(name)
+        }
+        return original
+
+    def _related_changed(self, name):
+        try:
+            field = self._meta.get_field(name)
+        except Exception:
+            return True
+        attname = getattr(field, "attname", None)
+        if not getattr(field, "concrete", False) or attname is None:
+            return True
+        return self._loaded_values.get(attname) != getattr(self, attname)
@@ -0,0 +1,130 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a composite key, newest first.
+
+    The page after a cursor is selected with a WHERE on the ordering columns
+    ((created_at, id) < cursor), so every page costs the same index range scan
+    no matter how deep it is. Views choose the key with `keyset_ordering`; by
+    default it is (-created_at, -id) for models with created_at, else -pk.
+
+    Existing clients get unpaginated lists: a list is only paginated when the
+    request sends `cursor` or `page_size`, or when API_PAGINATION_REQUIRED is on.
+    `page_size` is capped at API_MAX_PAGE_SIZE.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not (
+            getattr(settings, 'API_PAGINATION_REQUIRED', False)
+            or self.cursor_query_param in params
+            or self.page_size_query_param in params
+        ):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._after(queryset.model, self.decode_cursor(cursor)))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_position = self._position(page[-1]) if self.has_next else None
+        return page
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'API_PAGE_SIZE', 50)
+        maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, maximum))
+
+    def get_ordering(self, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering:
+            return tuple(ordering)
+        field_names = {field.name for field in queryset.model._meta.concrete_fields}
+        if 'created_at' in field_names:
+            return ('-created_at', '-id')
+        return ('-pk',)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'page_size': self.page_size,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'page_size': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_previous_link(self):
+        # Forward-only: clients go back by keeping the cursors they have seen
+        return None
+
+    def encode_cursor(self, position):
+        raw = json.dumps([None if value is None else str(value) for value in position])
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise ParseError(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise ParseError(self.invalid_cursor_message)
+        return position
+
+    def _position(self, instance):
+        return [getattr(instance, name.lstrip('-')) for name in self.ordering]
+
+    def _after(self, model, position):
+        """WHERE clause selecting the rows that sort after the cursor position"""
+        condition = Q()
+        equal = Q()
+        for name, raw in zip(self.ordering, position):
+            field_name = name.lstrip('-')
+            field = model._meta.pk if field_name == 'pk' else model._meta.get_field(field_name)
+            try:
+                value = field.to_python(raw)
+            except (ValidationError, TypeError, ValueError):
+                raise ParseError(self.invalid_cursor_message)
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field_name}__{lookup}': value})
+            equal &= Q(**{field_name: value})
+        return condition
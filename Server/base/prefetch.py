@@ -0,0 +1,85 @@
+from django.db.models import Prefetch
+from rest_framework.permissions import SAFE_METHODS
+
+
+class PrefetchProfile:
+    """
+    Declares the relations a serializer reads, so list endpoints can load them
+    with a fixed number of queries instead of one query per row.
+
+    Attach it to a serializer as `prefetch_profile`:
+
+        prefetch_profile = PrefetchProfile(
+            select_related=['company', 'customer'],
+            prefetch_related=[('line_items', OrderLineItem, OrderLineItemSerializer)],
+        )
+
+    prefetch_related entries are lookups, Prefetch objects, or
+    (lookup, model, serializer or profile) tuples. The nested profile is
+    applied to the prefetch queryset, so nested serializers are covered too.
+
+    by_field maps serializer field names to profiles that are only applied
+    when that field is rendered (see SparseFieldsetMixin), so relations of
+    fields a client did not ask for are not loaded.
+    """
+
+    def __init__(self, select_related=(), prefetch_related=(), by_field=None):
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self.by_field = dict(by_field or {})
+
+    def apply(self, queryset, fields=None):
+        """
+        Args:
+            queryset: QuerySet of the serializer's model
+            fields (iterable, optional): Names of the fields that will be rendered.
+                Defaults to all, i.e. every by_field profile is applied.
+        """
+        select_related = list(self.select_related)
+        prefetch_related = list(self.prefetch_related)
+        for name, profile in self.by_field.items():
+            if fields is None or name in fields:
+                select_related.extend(profile.select_related)
+                prefetch_related.extend(profile.prefetch_related)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        # A later entry for the same lookup replaces an earlier one
+        lookups = {}
+        for entry in prefetch_related:
+            lookup = self._lookup(entry)
+            lookups[getattr(lookup, 'prefetch_to', lookup)] = lookup
+        if lookups:
+            queryset = queryset.prefetch_related(*lookups.values())
+        return queryset
+
+    @staticmethod
+    def _lookup(entry):
+        if not isinstance(entry, tuple):
+            return entry
+        lookup, model, nested = entry
+        profile = getattr(nested, 'prefetch_profile', nested)
+        queryset = model._default_manager.all()
+        if profile is not None:
+            queryset = profile.apply(queryset)
+        return Prefetch(lookup, queryset=queryset)
+
+
+class PrefetchProfileMixin:
+    """
+    ViewSet mixin applying the serializer's prefetch_profile to reads.
+    Writes are left alone: related caches filled before an update would be
+    stale when the response is serialized.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            serializer_class = self.get_serializer_class()
+            profile = getattr(serializer_class, 'prefetch_profile', None)
+            if profile is not None:
+                fields = None
+                if profile.by_field:
+                    # Only load what the rendered (possibly sparse) fieldset needs
+                    fields = set(serializer_class(context=self.get_serializer_context()).fields)
+                queryset = profile.apply(queryset, fields)
+        return queryset
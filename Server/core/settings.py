@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from datetime import timedelta
 from pathlib import Path
 import os
+import sys
 from decouple import config
 import dj_database_url
 
@@ -134,8 +135,15 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    "DEFAULT_PAGINATION_CLASS": "base.pagination.KeysetPagination",
 }
 
+# Keyset pagination of list endpoints (base.pagination). Lists are paginated when the
+# client sends `cursor` or `page_size`, or always with API_PAGINATION_REQUIRED.
+API_PAGE_SIZE = config("API_PAGE_SIZE", default=50, cast=int)
+API_MAX_PAGE_SIZE = config("API_MAX_PAGE_SIZE", default=500, cast=int)
+API_PAGINATION_REQUIRED = config("API_PAGINATION_REQUIRED", default=False, cast=bool)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -195,3 +203,32 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
+
+# In-process cache for the report endpoints (transactions.report_cache)
+REPORT_CACHE_MAX_ENTRIES = config("REPORT_CACHE_MAX_ENTRIES", default=512, cast=int)
+REPORT_CACHE_TTL = config("REPORT_CACHE_TTL", default=300, cast=int)  # seconds
+
+# Largest number of GPS pings accepted by one route-location-pings/batch/ upload
+ROUTE_PING_BATCH_MAX = config("ROUTE_PING_BATCH_MAX", default=2000, cast=int)
+
+# Write-behind buffer for live tracking pings (transactions.ping_buffer)
+ROUTE_PING_BUFFER_SIZE = config("ROUTE_PING_BUFFER_SIZE", default=200, cast=int)
+ROUTE_PING_FLUSH_INTERVAL = config("ROUTE_PING_FLUSH_INTERVAL", default=0.5, cast=float)  # seconds
+
+# Audit log writer (audit.writer): batched inserts from a background thread.
+# Runs synchronously under `manage.py test` so tests see their audit rows, and on
+# serverless deploys (Vercel sets VERCEL=1), where the process can be frozen
+# between requests and a background thread cannot be relied on.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
+SERVERLESS = config("VERCEL", default=False, cast=bool)
+AUDIT_LOG_ASYNC = config("AUDIT_LOG_ASYNC", default=not (TESTING or SERVERLESS), cast=bool)
+AUDIT_LOG_BATCH_SIZE = config("AUDIT_LOG_BATCH_SIZE", default=200, cast=int)
+AUDIT_LOG_FLUSH_INTERVAL = config("AUDIT_LOG_FLUSH_INTERVAL", default=2.0, cast=float)  # seconds
+
+# Audit retention (audit.retention): entries older than AUDIT_RETENTION_DAYS are moved
+# into gzip-compressed JSONL segments under AUDIT_ARCHIVE_DIR, per company and month.
+# AUDIT_ARCHIVE_DIR must be durable storage (e.g. a mounted volume), not the app
+# directory, which serverless hosts discard; archiving refuses to run while it is unset.
+AUDIT_RETENTION_DAYS = config("AUDIT_RETENTION_DAYS", default=365, cast=int)
+AUDIT_ARCHIVE_DIR = config("AUDIT_ARCHIVE_DIR", default="")
+AUDIT_ARCHIVE_CHUNK_SIZE = config("AUDIT_ARCHIVE_CHUNK_SIZE", default=5000, cast=int)
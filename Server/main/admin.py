@@ -1,8 +1,9 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Product, Supplier, VATSettings,Customer
+from .models import Product, Supplier, VATSettings,Customer, CustomerLedgerEntry
 admin.site.register(Product)
 admin.site.register(Supplier)   
 admin.site.register(VATSettings)
-admin.site.register(Customer)   
\ No newline at end of file
+admin.site.register(Customer)   
+admin.site.register(CustomerLedgerEntry)
\ No newline at end of file
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.models import Customer
+from main.services import CustomerLedgerService
+
+
+class Command(BaseCommand):
+    help = 'Recompute customer balances and credit exposure in chunks and correct any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only check customers of this company id')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Customers per batch of queries')
+        parser.add_argument('--verify', action='store_true', help='Report mismatches without correcting them')
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.all()
+        if options['company']:
+            customers = customers.filter(company_id=options['company'])
+
+        mismatches = CustomerLedgerService.rebuild(
+            customers, chunk_size=options['chunk_size'], verify_only=options['verify']
+        )
+        for customer_id, balance, expected_balance, exposure, expected_exposure in mismatches:
+            self.stdout.write(
+                f"Customer {customer_id}: balance {balance} -> {expected_balance}, "
+                f"exposure {exposure} -> {expected_exposure}"
+            )
+
+        if options['verify'] and mismatches:
+            raise CommandError(f"{len(mismatches)} customer balances are out of sync")
+        action = 'found' if options['verify'] else 'corrected'
+        self.stdout.write(self.style.SUCCESS(f"Customer balances {action}: {len(mismatches)}"))
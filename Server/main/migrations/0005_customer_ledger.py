@@ -0,0 +1,82 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_customer_balances(apps, schema_editor):
+    """
+    Seed current_balance and credit_exposure from invoices and credits.
+
+    A frozen copy of the balance rules at this migration, using historical
+    models only; later checks go through rebuild_customer_balances.
+    """
+    from decimal import Decimal
+    from django.db.models import F, Sum
+
+    Customer = apps.get_model("main", "Customer")
+    CustomerLedgerEntry = apps.get_model("main", "CustomerLedgerEntry")
+    Credit = apps.get_model("main", "Credit")
+    Invoice = apps.get_model("transactions", "Invoice")
+
+    balances = dict(
+        Invoice.objects.exclude(status__in=("draft", "cancelled"))
+        .values_list("sales_order__customer_id")
+        .annotate(total=Sum(F("amount_due") - F("paid_amount")))
+    )
+    exposures = dict(
+        Credit.objects.values_list("invoice__sales_order__customer_id")
+        .annotate(total=Sum(F("amount") - F("payed_amount")))
+    )
+    customers = Customer.objects.order_by("pk").values_list("pk", "current_balance", "credit_exposure")
+    for customer_id, stored_balance, stored_exposure in customers.iterator():
+        balance = Decimal(str(balances.get(customer_id) or 0))
+        exposure = Decimal(str(exposures.get(customer_id) or 0))
+        balance_delta = balance - Decimal(str(stored_balance or 0))
+        exposure_delta = exposure - Decimal(str(stored_exposure or 0))
+        if not balance_delta and not exposure_delta:
+            continue
+        Customer.objects.filter(pk=customer_id).update(current_balance=balance, credit_exposure=exposure)
+        CustomerLedgerEntry.objects.create(
+            customer_id=customer_id,
+            entry_type="adjustment",
+            reference="backfill",
+            balance_delta=balance_delta,
+            exposure_delta=exposure_delta,
+            balance_after=balance,
+            exposure_after=exposure,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_remove_customer_credit_limit_and_more'),
+        ('transactions', '0005_salesorder_gone_for_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='credit_exposure',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+        ),
+        migrations.CreateModel(
+            name='CustomerLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('invoice', 'Invoice'), ('payment', 'Payment'), ('credit', 'Credit'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('reference', models.CharField(blank=True, help_text='Invoice number or payment id', max_length=100)),
+                ('balance_delta', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('exposure_delta', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('exposure_after', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='main.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'created_at'], name='main_custom_custome_0ec9e1_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_customer_balances, migrations.RunPython.noop),
+    ]
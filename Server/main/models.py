@@ -4,14 +4,16 @@ from decimal import Decimal
 
 # from Server.transactions.models import Invoice
 from accounts.models import Company
+from base.mixins import LoadedStateMixin
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.forms import ValidationError
 
 
 # Create your models here.
-class BaseModel(models.Model):
+class BaseModel(LoadedStateMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -55,7 +57,7 @@ class Credit(BaseModel):
 # Credit signal removed - credit creation and balance updates are now handled in Invoice and Payment models
 
 
-class Customer(models.Model):
+class Customer(LoadedStateMixin, models.Model):
     name = models.CharField(max_length=255)
     email = models.EmailField()
     phone = models.CharField(max_length=20, blank=True, null=True)
@@ -89,10 +91,16 @@ class Customer(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained incrementally through CustomerLedgerEntry (see CustomerLedgerService):
+    # current_balance = invoiced (not draft or cancelled) - paid, credit_exposure = open credit
     current_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    credit_exposure = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
 
     @property
     def can_order(self):
+        # Use the annotation when the customer came from an expired_credit_exists() query
+        if hasattr(self, "has_expired_credit"):
+            return not self.has_expired_credit
         from django.utils import timezone
         today = timezone.now()
         return not Credit.objects.filter(
@@ -101,34 +109,51 @@ class Customer(models.Model):
             payed_amount__lt=models.F('amount')
         ).exists()
 
+    @staticmethod
+    def expired_credit_exists():
+        """Exists() subquery over the customer's expired, unpaid credits, for annotating querysets"""
+        from django.utils import timezone
+        return models.Exists(
+            Credit.objects.filter(
+                invoice__sales_order__customer=models.OuterRef("pk"),
+                expired_at__lt=timezone.now(),
+                payed_amount__lt=models.F("amount"),
+            )
+        )
+
+    @staticmethod
+    def order_stats_annotations():
+        """
+        order_count and total_spent as correlated subqueries, for annotating
+        querysets. Subqueries rather than joins, so they stay correct when the
+        queryset also filters or joins through sales orders.
+        """
+        from transactions.models import SalesOrder
+
+        orders = SalesOrder.objects.filter(customer=models.OuterRef("pk")).order_by().values("customer")
+        return {
+            "order_count": Coalesce(
+                models.Subquery(orders.annotate(count=models.Count("pk")).values("count")),
+                0,
+            ),
+            "total_spent": Coalesce(
+                models.Subquery(orders.annotate(total=models.Sum("grand_total")).values("total")),
+                models.Value(0),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        }
+
     def __str__(self):
         return self.name
 
     def get_balance(self):
         """Return customer's outstanding balance (invoices - payments).
 
-        Includes all invoices linked to this customer's sales orders,
-        excluding draft and cancelled invoices.
+        Read from the current_balance column, which CustomerLedgerService keeps
+        up to date as invoices are written: the sum of amount_due - paid_amount
+        over the customer's invoices, excluding draft and cancelled ones.
         """
-        try:
-            from transactions.models import (
-                Invoice,
-            )  # local import to avoid circular dependency
-        except Exception:
-            return Decimal("0.00")
-
-        invoices_qs = Invoice.objects.filter(sales_order__customer=self).exclude(
-            status__in=["draft", "cancelled"]
-        )  # ignore non-actionable invoices
-
-        totals = invoices_qs.aggregate(
-            amount_due_total=models.Sum("amount_due"),
-            paid_total=models.Sum("paid_amount"),
-        )
-
-        amount_due = totals.get("amount_due_total") or Decimal("0.00")
-        paid = totals.get("paid_total") or Decimal("0.00")
-        return amount_due - paid
+        return Decimal(str(self.current_balance or 0))
 
     @property
     def has_coordinates(self):
@@ -157,9 +182,42 @@ class Customer(models.Model):
 
     class Meta:
         unique_together = ("email", "company")
+        indexes = [
+            # Keyset pagination (base.pagination) per company
+            models.Index(fields=["company", "created_at", "id"]),
+        ]
 
 
-class Supplier(models.Model):
+class CustomerLedgerEntry(models.Model):
+    """
+    Signed change to a customer's balance and credit exposure, with the running
+    totals after it was applied. Written by the invoice, payment and credit
+    write paths; rebuild_customer_balances re-derives and verifies them.
+    """
+    ENTRY_TYPE_CHOICES = [
+        ("invoice", "Invoice"),
+        ("payment", "Payment"),
+        ("credit", "Credit"),
+        ("adjustment", "Adjustment"),
+    ]
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="ledger_entries")
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE_CHOICES)
+    reference = models.CharField(max_length=100, blank=True, help_text="Invoice number or payment id")
+    balance_delta = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    exposure_delta = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    exposure_after = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["customer", "created_at"])]
+
+    def __str__(self):
+        return f"{self.customer} {self.entry_type} {self.balance_delta:+}"
+
+
+class Supplier(LoadedStateMixin, models.Model):
     name = models.CharField(max_length=255)
     email = models.EmailField()
     phone = models.CharField(max_length=20, blank=True, null=True)
@@ -181,9 +239,13 @@ class Supplier(models.Model):
 
     class Meta:
         unique_together = ("email", "company")
+        indexes = [
+            # Keyset pagination (base.pagination) per company
+            models.Index(fields=["company", "created_at", "id"]),
+        ]
 
 
-class VATSettings(models.Model):
+class VATSettings(LoadedStateMixin, models.Model):
     category = models.CharField(max_length=100)
     rate = models.DecimalField(max_digits=5, decimal_places=2)
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
@@ -234,6 +296,7 @@ class Product(BaseModel):
         indexes = [
             models.Index(fields=["code"]),
             models.Index(fields=["name"]),
+            models.Index(fields=["company", "created_at", "id"]),
         ]
         unique_together = ("code", "company")
 
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Credit, Customer, Product, Supplier, VATSettings
+from base.prefetch import PrefetchProfile
 
 class SupplierSerializer(serializers.ModelSerializer):
     company_name = serializers.CharField(source="company.name", read_only=True)
@@ -18,6 +19,8 @@ class ProductSerializer(serializers.ModelSerializer):
     vat_rate = serializers.ReadOnlyField(source='vat_category.rate')
     company_name = serializers.CharField(source="company.name", read_only=True)
 
+    prefetch_profile = PrefetchProfile(select_related=['company', 'vat_category'])
+
     class Meta:
         model = Product
         fields = [
@@ -38,9 +41,9 @@ class CustomerSerializer(serializers.ModelSerializer):
             'id', 'name', 'email', 'phone', 'address', 'credit_expire_days',
             'lat', 'lon', 'city', 'state', 'country', 'postal_code',
             'location_verified', 'has_coordinates', 'location_display',
-            'distance_km', 'current_balance', 'created_at', 'updated_at', 'company_name'
+            'distance_km', 'current_balance', 'credit_exposure', 'created_at', 'updated_at', 'company_name'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'current_balance', 'credit_exposure']
         ref_name = 'MainCustomerSerializer'
 
     
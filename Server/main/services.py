@@ -1,5 +1,7 @@
 import requests
+from decimal import Decimal
 from django.conf import settings
+from django.db import models, transaction
 from typing import Optional, Dict, Tuple
 import logging
 
@@ -126,3 +128,270 @@ class LocationService:
     def validate_coordinates(lat: float, lon: float) -> bool:
         """Validate if coordinates are within valid ranges"""
         return -90 <= lat <= 90 and -180 <= lon <= 180
+
+
+class CustomerLedgerService:
+    """
+    Maintains Customer.current_balance and Customer.credit_exposure as running
+    totals of CustomerLedgerEntry deltas.
+
+    balance  = sum of (amount_due - paid_amount) over the customer's issued (not draft or cancelled) invoices
+    exposure = open credit, i.e. sum of (credit.amount - credit.payed_amount)
+
+    Payments reach the balance through the paid_amount they set on their
+    invoice, which is capped at amount_due once the invoice is paid.
+    """
+
+    # Invoices in these states are not owed yet (draft) or no longer owed (cancelled)
+    EXCLUDED_INVOICE_STATUSES = ("draft", "cancelled")
+
+    @staticmethod
+    def invoice_balance(status, amount_due, paid_amount) -> Decimal:
+        """Contribution of one invoice to its customer's balance"""
+        if status in CustomerLedgerService.EXCLUDED_INVOICE_STATUSES:
+            return Decimal("0.00")
+        return Decimal(str(amount_due or 0)) - Decimal(str(paid_amount or 0))
+
+    @staticmethod
+    def credit_exposure(amount, payed_amount) -> Decimal:
+        """Contribution of one credit to its customer's exposure"""
+        return Decimal(str(amount or 0)) - Decimal(str(payed_amount or 0))
+
+    @staticmethod
+    def post(customer_id, entry_type: str, balance_delta=0, exposure_delta=0,
+             reference: str = "") -> Optional["CustomerLedgerEntry"]:
+        """
+        Apply signed deltas to a customer and record them in the ledger.
+
+        Args:
+            customer_id: Customer primary key
+            entry_type: One of CustomerLedgerEntry.ENTRY_TYPE_CHOICES
+            balance_delta: Change to current_balance
+            exposure_delta: Change to credit_exposure
+            reference: Invoice number or payment id the change came from
+
+        Returns:
+            The new ledger entry, or None when both deltas are zero
+        """
+        from .models import Customer, CustomerLedgerEntry
+
+        balance_delta = Decimal(str(balance_delta or 0))
+        exposure_delta = Decimal(str(exposure_delta or 0))
+        if customer_id is None or (not balance_delta and not exposure_delta):
+            return None
+
+        with transaction.atomic():
+            # Lock the row so concurrent postings see each other's running totals
+            totals = (
+                Customer.objects.select_for_update()
+                .filter(pk=customer_id)
+                .values("current_balance", "credit_exposure")
+                .first()
+            )
+            if totals is None:
+                return None
+            balance_after = Decimal(str(totals["current_balance"] or 0)) + balance_delta
+            exposure_after = Decimal(str(totals["credit_exposure"] or 0)) + exposure_delta
+            # A queryset update keeps balance bookkeeping out of the Customer audit trail
+            Customer.objects.filter(pk=customer_id).update(
+                current_balance=balance_after, credit_exposure=exposure_after
+            )
+            return CustomerLedgerEntry.objects.create(
+                customer_id=customer_id,
+                entry_type=entry_type,
+                reference=str(reference)[:100],
+                balance_delta=balance_delta,
+                exposure_delta=exposure_delta,
+                balance_after=balance_after,
+                exposure_after=exposure_after,
+            )
+
+    @staticmethod
+    def expected_totals(customer_ids) -> Dict[int, Tuple[Decimal, Decimal]]:
+        """
+        Recompute balance and exposure from source rows with two grouped queries.
+
+        Returns: {customer_id: (balance, exposure)} for every id passed in
+        """
+        from django.db.models import F, Sum
+        from transactions.models import Invoice
+        from .models import Credit
+
+        customer_ids = list(customer_ids)
+        balance = dict(
+            Invoice.objects.filter(sales_order__customer_id__in=customer_ids)
+            .exclude(status__in=CustomerLedgerService.EXCLUDED_INVOICE_STATUSES)
+            .values_list("sales_order__customer_id")
+            .annotate(total=Sum(F("amount_due") - F("paid_amount")))
+        )
+        exposure = dict(
+            Credit.objects.filter(invoice__sales_order__customer_id__in=customer_ids)
+            .values_list("invoice__sales_order__customer_id")
+            .annotate(total=Sum(F("amount") - F("payed_amount")))
+        )
+        return {
+            customer_id: (
+                Decimal(str(balance.get(customer_id) or 0)),
+                Decimal(str(exposure.get(customer_id) or 0)),
+            )
+            for customer_id in customer_ids
+        }
+
+    @staticmethod
+    def rebuild(queryset=None, chunk_size: int = 500, verify_only: bool = False) -> list:
+        """
+        Compare stored balances with recomputed ones, chunk by chunk, and post an
+        adjustment entry for every customer that drifted.
+
+        Args:
+            queryset: Customers to check (defaults to all)
+            chunk_size: Number of customers handled per round of queries
+            verify_only: Report mismatches without correcting them
+
+        Returns:
+            List of (customer_id, stored_balance, expected_balance, stored_exposure, expected_exposure)
+        """
+        from .models import Customer
+
+        queryset = (queryset if queryset is not None else Customer.objects.all()).order_by("pk")
+        mismatches = []
+        last_pk = 0
+        while True:
+            chunk = list(
+                queryset.filter(pk__gt=last_pk).values_list("pk", "current_balance", "credit_exposure")[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            expected = CustomerLedgerService.expected_totals(pk for pk, _, _ in chunk)
+            for customer_id, balance, exposure in chunk:
+                balance = Decimal(str(balance or 0))
+                exposure = Decimal(str(exposure or 0))
+                expected_balance, expected_exposure = expected[customer_id]
+                if balance == expected_balance and exposure == expected_exposure:
+                    continue
+                mismatches.append((customer_id, balance, expected_balance, exposure, expected_exposure))
+                if not verify_only:
+                    CustomerLedgerService.post(
+                        customer_id,
+                        "adjustment",
+                        balance_delta=expected_balance - balance,
+                        exposure_delta=expected_exposure - exposure,
+                        reference="rebuild",
+                    )
+        if mismatches:
+            logger.warning(f"Customer balances out of sync for {len(mismatches)} customers")
+        return mismatches
+
+
+class CreditReportService:
+    """Builds the per-customer credit report from grouped credit and payment rows"""
+
+    @staticmethod
+    def customer_ids_page(company, after=None, limit: int = 100) -> list:
+        """
+        Ids of the next `limit` customers (ordered by id) that hold any credit.
+
+        Args:
+            company: Company whose customers are reported
+            after: Only return customers with a greater id (keyset cursor)
+            limit: Page size
+        """
+        from .models import Credit
+
+        credits = Credit.objects.filter(invoice__company=company)
+        if after is not None:
+            credits = credits.filter(invoice__sales_order__customer_id__gt=after)
+        return list(
+            credits.order_by("invoice__sales_order__customer_id")
+            .values_list("invoice__sales_order__customer_id", flat=True)
+            .distinct()[:limit]
+        )
+
+    @staticmethod
+    def customer_reports(company, customer_ids=None, chunk_size: int = 2000):
+        """
+        Yield one report dict per customer with credit, in customer id order.
+
+        Credits and payments are read with one query each, both ordered by
+        customer, and merged in memory, so rows are streamed rather than held.
+
+        Args:
+            company: Company whose customers are reported
+            customer_ids: Restrict to these customers (one page); all when None
+            chunk_size: Rows fetched per round trip while iterating
+        """
+        from itertools import groupby
+        from operator import itemgetter
+        from transactions.models import Payment
+        from .models import Credit
+
+        credits = Credit.objects.filter(invoice__company=company)
+        payments = Payment.objects.filter(invoice__company=company)
+        if customer_ids is not None:
+            credits = credits.filter(invoice__sales_order__customer_id__in=customer_ids)
+            payments = payments.filter(invoice__sales_order__customer_id__in=customer_ids)
+
+        credit_rows = (
+            credits.order_by("invoice__sales_order__customer_id", "created_at")
+            .values(
+                "id", "amount", "payed_amount", "created_at", "expired_at",
+                "invoice__invoice_no",
+                customer_id=models.F("invoice__sales_order__customer_id"),
+                customer_name=models.F("invoice__sales_order__customer__name"),
+            )
+            .iterator(chunk_size=chunk_size)
+        )
+        payment_rows = (
+            payments.order_by("invoice__sales_order__customer_id", "paid_on", "created_at")
+            .values(
+                "amount", "paid_on", "mode", "invoice__invoice_no",
+                customer_id=models.F("invoice__sales_order__customer_id"),
+            )
+            .iterator(chunk_size=chunk_size)
+        )
+
+        payment_groups = groupby(payment_rows, key=itemgetter("customer_id"))
+        pending = next(payment_groups, None)
+        for customer_id, group in groupby(credit_rows, key=itemgetter("customer_id")):
+            group = list(group)
+            # Skip payment groups of customers without credit
+            while pending is not None and pending[0] < customer_id:
+                pending = next(payment_groups, None)
+            customer_payments = []
+            if pending is not None and pending[0] == customer_id:
+                customer_payments = list(pending[1])
+                pending = next(payment_groups, None)
+
+            latest = group[-1]
+            total_credit = sum(Decimal(str(row['amount'])) for row in group)
+            total_paid = sum(Decimal(str(row['payed_amount'] or 0)) for row in group)
+            yield {
+                'id': customer_id,
+                'customerName': latest['customer_name'],
+                'totalCredit': float(total_credit),
+                'creditLeft': float(total_credit - total_paid),
+                'invoiceNo': latest['invoice__invoice_no'],
+                'expiresAt': latest['expired_at'].strftime('%Y-%m-%d') if latest['expired_at'] else None,
+                'creditHistory': [
+                    {
+                        'id': row['id'],
+                        'date': row['created_at'].strftime('%Y-%m-%d'),
+                        'amount': float(row['amount']),
+                        'invoiceNo': row['invoice__invoice_no'],
+                        'type': 'Credit Grant',
+                        'status': 'Granted',
+                    }
+                    for row in group
+                ],
+                'paymentHistory': [
+                    {
+                        'date': row['paid_on'].strftime('%Y-%m-%d'),
+                        'amount': float(row['amount']),
+                        'invoiceNo': f"{row['invoice__invoice_no']}",
+                        'type': 'Payment',
+                        'method': row['mode'].title(),
+                    }
+                    for row in customer_payments
+                ],
+            }
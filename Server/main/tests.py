@@ -1,3 +1,245 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Company, User
+from transactions.models import Invoice, OrderLineItem, Payment, SalesOrder
+from .models import Credit, Customer, CustomerLedgerEntry, Product, VATSettings
+from .services import CustomerLedgerService
+
+
+class CustomerLedgerTests(TestCase):
+    """current_balance and credit_exposure must always equal a fresh recomputation."""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        vat = VATSettings.objects.create(category="Standard", rate=5, company=self.company)
+        self.product = Product.objects.create(
+            code="P", name="Product", unit_price=10, vat_category=vat, company=self.company
+        )
+        self.customer = Customer.objects.create(name="C", email="c@example.com", company=self.company)
+
+    def create_invoice(self, quantity=2, status="sent"):
+        order = SalesOrder.objects.create(customer=self.customer, company=self.company, order_date=date.today())
+        OrderLineItem.objects.create(sales_order=order, product=self.product, quantity=quantity, unit_price=10)
+        order.refresh_from_db()
+        return Invoice.objects.create(
+            sales_order=order, issue_date=date.today(), due_date=date.today(),
+            amount_due=order.grand_total, status=status, company=self.company
+        )
+
+    def assert_in_sync(self, balance):
+        self.customer.refresh_from_db()
+        stored = (self.customer.current_balance, self.customer.credit_exposure)
+        self.assertEqual(stored, CustomerLedgerService.expected_totals([self.customer.pk])[self.customer.pk])
+        self.assertEqual(self.customer.get_balance(), Decimal(balance))
+        last = self.customer.ledger_entries.order_by("pk").last()
+        if last is not None:
+            self.assertEqual((last.balance_after, last.exposure_after), stored)
+
+    def test_ledger_follows_invoice_payment_and_credit_writes(self):
+        first = self.create_invoice()
+        draft = self.create_invoice(quantity=1, status="draft")
+        self.assert_in_sync("21.00")
+
+        draft.status = "sent"
+        draft.save()
+        self.assert_in_sync("31.50")
+
+        payment = Payment.objects.create(invoice=first, amount=5, mode="cash", company=self.company)
+        self.assert_in_sync("26.50")
+        payment.refresh_from_db()
+        payment.amount = Decimal("8.00")
+        payment.save()
+        self.assert_in_sync("23.50")
+
+        credit = Credit.objects.get(invoice=first)
+        credit.amount = Decimal("30.00")
+        credit.save()
+        self.assert_in_sync("23.50")
+
+        first.refresh_from_db()
+        first.amount_due = Decimal("25.00")
+        first.save()
+        self.assert_in_sync("27.50")
+
+        payment.delete()
+        self.assert_in_sync("35.50")
+
+        Credit.objects.get(invoice=draft).delete()
+        self.assert_in_sync("35.50")
+
+        draft.refresh_from_db()
+        draft.status = "cancelled"
+        draft.save()
+        self.assert_in_sync("25.00")
+
+        first.delete()
+        self.assert_in_sync("0.00")
+
+    def test_overpaid_and_cancelled_invoices_owe_nothing(self):
+        overpaid = self.create_invoice()
+        Payment.objects.create(invoice=overpaid, amount=30, mode="cash", company=self.company)
+        self.assertEqual(self.customer.ledger_entries.order_by("pk").last().entry_type, "payment")
+        self.assert_in_sync("0.00")
+
+        cancelled = self.create_invoice(quantity=1)
+        Payment.objects.create(invoice=cancelled, amount=4, mode="cash", company=self.company)
+        self.assert_in_sync("6.50")
+        cancelled.refresh_from_db()
+        cancelled.status = "cancelled"
+        cancelled.save()
+        self.assert_in_sync("0.00")
+
+        self.create_invoice(quantity=3)
+        self.assert_in_sync("31.50")
+
+    def test_rebuild_corrects_drift(self):
+        invoice = self.create_invoice()
+        Payment.objects.create(invoice=invoice, amount=4, mode="cash", company=self.company)
+        Customer.objects.filter(pk=self.customer.pk).update(current_balance=99, credit_exposure=0)
+
+        self.assertEqual(len(CustomerLedgerService.rebuild(verify_only=True)), 1)
+        mismatches = CustomerLedgerService.rebuild()
+        self.assertEqual([row[0] for row in mismatches], [self.customer.pk])
+        self.assertEqual(self.customer.ledger_entries.order_by("pk").last().entry_type, "adjustment")
+        self.assert_in_sync("17.00")
+        self.assertEqual(CustomerLedgerService.rebuild(), [])
+        self.assertTrue(CustomerLedgerEntry.objects.filter(customer=self.customer).exists())
+
+
+class CreditReportTests(TestCase):
+    """Paged and streamed credit reports must carry exactly the rows of the plain report."""
+
+    url = "/api/main/credit-report/"
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="x", company=self.company, role="admin"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        vat = VATSettings.objects.create(category="Standard", rate=5, company=self.company)
+        product = Product.objects.create(code="P", name="Product", unit_price=10, vat_category=vat, company=self.company)
+        other = Company.objects.create(name="Other")
+        Customer.objects.create(name="No credit", email="none@example.com", company=self.company)
+        for index in range(7):
+            company = other if index == 3 else self.company
+            customer = Customer.objects.create(name=f"C{index}", email=f"c{index}@example.com", company=company)
+            for quantity in range(1, index % 3 + 2):
+                order = SalesOrder.objects.create(customer=customer, company=company, order_date=date.today())
+                OrderLineItem.objects.create(sales_order=order, product=product, quantity=quantity, unit_price=10)
+                order.refresh_from_db()
+                invoice = Invoice.objects.create(
+                    sales_order=order, issue_date=date.today(), due_date=date.today(),
+                    amount_due=order.grand_total, status="sent", company=company
+                )
+                if quantity > 1:
+                    Payment.objects.create(invoice=invoice, amount=quantity, mode="cash", company=company)
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_pages_match_unpaged_report(self):
+        full = self.get().json()
+        self.assertEqual(full["totalCustomers"], 6)
+        for report in full["creditReports"]:
+            self.assertEqual(
+                report["creditLeft"],
+                sum(row["amount"] for row in report["creditHistory"])
+                - sum(row["amount"] for row in report["paymentHistory"]),
+            )
+
+        for limit in (1, 2, 4, 6):
+            rows, after, pages = [], None, 0
+            while True:
+                params = {"limit": limit}
+                if after is not None:
+                    params["after"] = after
+                page = self.get(**params).json()
+                rows.extend(page["creditReports"])
+                pages += 1
+                after = page["nextAfter"]
+                if after is None:
+                    break
+                self.assertEqual(after, page["creditReports"][-1]["id"])
+            self.assertEqual(rows, full["creditReports"])
+            self.assertLessEqual(pages, len(rows) // limit + 1)
+
+    def test_streams_match_buffered_report(self):
+        for params in ({}, {"limit": 4}, {"limit": 4, "after": 0}):
+            buffered = self.get(**params).json()
+            streamed = self.get(stream="json", **params)
+            self.assertEqual(streamed["Content-Type"], "application/json")
+            document = json.loads(b"".join(streamed.streaming_content))
+            buffered.setdefault("nextAfter", None)
+            self.assertEqual(document, buffered)
+
+            lines = b"".join(self.get(stream="ndjson", **params).streaming_content).decode().splitlines()
+            self.assertEqual([json.loads(line) for line in lines], buffered["creditReports"])
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking the cursors must return every row exactly once, in list order."""
+
+    url = "/api/main/customers/"
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        user = User.objects.create_user(
+            username="user", email="user@example.com", password="x", company=self.company, role="admin"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        for index in range(7):
+            Customer.objects.create(name=f"C{index}", email=f"c{index}@example.com", company=self.company)
+        # Ties on created_at must be broken by id
+        Customer.objects.filter(name__in=["C1", "C2", "C3", "C4"]).update(created_at=timezone.now())
+
+    def expected_ids(self):
+        return list(
+            Customer.objects.filter(company=self.company).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+
+    def test_cursors_walk_every_row_once_with_duplicate_keys(self):
+        for page_size in (1, 2, 3, 7):
+            ids, params = [], {"page_size": page_size}
+            while True:
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 200)
+                page = response.json()
+                self.assertLessEqual(len(page["results"]), page_size)
+                ids.extend(row["id"] for row in page["results"])
+                self.assertLessEqual(len(ids), 7, "cursor repeated rows")
+                if page["next"] is None:
+                    break
+                params = parse_qs(urlsplit(page["next"]).query)
+            self.assertEqual(ids, self.expected_ids())
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+        for cursor in ("not-a-cursor!", encode({"a": 1}), encode(["2024-01-01T00:00:00"]),
+                       encode(["yesterday", "1"]), encode([{}, "1"]), encode(["2024-01-01T00:00:00", "x"])):
+            response = self.client.get(self.url, {"cursor": cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json(), {"detail": "Invalid cursor"})
+
+    def test_lists_are_unpaginated_without_cursor_or_page_size(self):
+        response = self.client.get(self.url)
+        self.assertEqual(sorted(row["id"] for row in response.json()), sorted(self.expected_ids()))
+
+        with override_settings(API_PAGINATION_REQUIRED=True, API_PAGE_SIZE=5):
+            page = self.client.get(self.url).json()
+        self.assertEqual(len(page["results"]), 5)
+        self.assertIsNotNone(page["next"])
@@ -1,3 +1,8 @@
+import json
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.dateparse import parse_datetime
 from rest_framework import status, viewsets
@@ -7,7 +12,6 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .models import Credit, Customer, Product, Supplier, VATSettings
-from transactions.models import Payment
 from .serializers import (
     CreditSerializer,
     CustomerSerializer,
@@ -15,8 +19,11 @@ from .serializers import (
     SupplierSerializer,
     VATSettingsSerializer,
 )
-from .services import LocationService
+from .services import CreditReportService, LocationService
 from audit.signals import AuditContext
+from base.prefetch import PrefetchProfileMixin
+
+logger = logging.getLogger(__name__)
 
 
 class CustomerViewSet(viewsets.ModelViewSet):
@@ -224,13 +231,13 @@ class SupplierViewSet(viewsets.ModelViewSet):
             serializer.save()
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(PrefetchProfileMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Product.objects.filter(company=self.request.user.company)
+        return super().get_queryset().filter(company=self.request.user.company)
 
     def perform_create(self, serializer):
         # Ensure current user is set for audit logging
@@ -292,125 +299,106 @@ class CustomerAvailableForSales(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        print("=" * 50)
-        print("DEBUG: CustomerAvailableForSales endpoint called!")
-        print(f"DEBUG: Request method: {request.method}")
-        print(f"DEBUG: Request path: {request.path}")
-        print(f"DEBUG: Request user: {request.user}")
-        print(f"DEBUG: User authenticated: {request.user.is_authenticated}")
-        print(f"DEBUG: User company: {getattr(request.user, 'company', 'No company attribute')}")
-        
         try:
-            # Get all customers for the company first
-            all_customers = Customer.objects.filter(company=request.user.company)
-            print(f"DEBUG: Found {all_customers.count()} total customers for company")
-            
-            # Filter customers who can order (using the property)
-            available_customers = [customer for customer in all_customers if customer.can_order]
-            print(f"DEBUG: Found {len(available_customers)} customers with can_order=True")
-            
+            # One query: customers of the company without an expired, unpaid credit
+            available_customers = (
+                Customer.objects.filter(company=request.user.company)
+                .annotate(has_expired_credit=Customer.expired_credit_exists())
+                .filter(has_expired_credit=False)
+                .select_related("company")
+            )
             serializer = CustomerSerializer(available_customers, many=True)
-            print(f"DEBUG: Serialized data: {serializer.data}")
             return Response(serializer.data)
         except Exception as e:
-            print(f"DEBUG: Error in CustomerAvailableForSales: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in CustomerAvailableForSales")
             return Response({"error": str(e)}, status=500)
         
 
 class CreditReport(APIView):
+    """
+    Credit and payment history per customer.
+
+    Query params:
+        limit, after: page through customers by id; the response carries
+            nextAfter to request the following page
+        stream: "json" or "ndjson" to stream the report instead of building
+            it in memory
+    """
     permission_classes = [IsAuthenticated]
-    
+    MAX_PAGE_SIZE = 1000
+
     def get(self, request):
         user = request.user
         if user.role != "admin" :
-            print(user.role)
             return Response(status=status.HTTP_403_FORBIDDEN)
-        
+
+        stream = request.query_params.get('stream')
+        if stream not in (None, 'json', 'ndjson'):
+            return Response(
+                {'detail': "stream must be 'json' or 'ndjson'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         try:
-            # Get all customers with their credit information
-            customers_with_credits = Customer.objects.filter(
-                company=user.company
-            ).prefetch_related(
-                'sales_orders__invoice__credits',
-                'sales_orders__invoice__payments'
+            limit = request.query_params.get('limit')
+            limit = min(int(limit), self.MAX_PAGE_SIZE) if limit else None
+            after = request.query_params.get('after')
+            after = int(after) if after else None
+        except ValueError:
+            return Response(
+                {'detail': "'limit' and 'after' must be integers."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            credit_reports = []
-            
-            for customer in customers_with_credits:
-                # Get all credits for this customer
-                credits = Credit.objects.filter(
-                    invoice__sales_order__customer=customer,
-                    invoice__company=user.company
-                ).select_related('invoice').order_by('created_at')
-                
-                if not credits.exists():
-                    continue
-                
-                # Calculate total credit and remaining credit properly
-                total_credit = sum(float(credit.amount) for credit in credits)
-                total_paid = sum(float(credit.payed_amount or 0) for credit in credits)
-                credit_left = total_credit - total_paid
-                
-                # Get the most recent credit for display
-                latest_credit = credits.last()
-                invoice_no = latest_credit.invoice.invoice_no if latest_credit else "N/A"
-                expires_at = latest_credit.expired_at.strftime('%Y-%m-%d') if latest_credit and latest_credit.expired_at else None
-                
-                # Build credit history - show each credit grant
-                credit_history = []
-                for credit in credits:
-                    credit_history.append({
-                        'id': credit.id,
-                        'date': credit.created_at.strftime('%Y-%m-%d'),
-                        'amount': float(credit.amount),
-                        'invoiceNo': credit.invoice.invoice_no,
-                        'type': 'Credit Grant',
-                        'status': 'Granted'
-                    })
-                
-                # Build payment history - get all payments for this customer
-                payment_history = []
-                all_payments = Payment.objects.filter(
-                    invoice__sales_order__customer=customer,
-                    invoice__company=user.company
-                ).order_by('paid_on')
-                
-                for payment in all_payments:
-                    payment_history.append({
-                        'date': payment.paid_on.strftime('%Y-%m-%d'),
-                        'amount': float(payment.amount),
-                        'invoiceNo': f"{payment.invoice.invoice_no}",
-                        'type': 'Payment',
-                        'method': payment.mode.title()
-                    })
-                
-                credit_report = {
-                    'id': customer.id,
-                    'customerName': customer.name,
-                    'totalCredit': total_credit,
-                    'creditLeft': credit_left,
-                    'invoiceNo': invoice_no,
-                    'expiresAt': expires_at,
-                    'creditHistory': credit_history,
-                    'paymentHistory': payment_history
-                }
-                
-                credit_reports.append(credit_report)
-            
-            return Response({
+        if limit is not None and limit < 1:
+            return Response({'detail': "'limit' must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            customer_ids = None
+            next_after = None
+            if limit is not None or after is not None:
+                customer_ids = CreditReportService.customer_ids_page(
+                    user.company, after=after, limit=limit or self.MAX_PAGE_SIZE
+                )
+                if customer_ids and len(customer_ids) == (limit or self.MAX_PAGE_SIZE):
+                    next_after = customer_ids[-1]
+
+            reports = CreditReportService.customer_reports(user.company, customer_ids)
+
+            if stream == 'ndjson':
+                return StreamingHttpResponse(
+                    (json.dumps(report, cls=DjangoJSONEncoder) + "\n" for report in reports),
+                    content_type='application/x-ndjson'
+                )
+            if stream == 'json':
+                return StreamingHttpResponse(
+                    self._stream_json(reports, next_after), content_type='application/json'
+                )
+
+            credit_reports = list(reports)
+            data = {
                 'creditReports': credit_reports,
                 'totalCustomers': len(credit_reports)
-            })
-            
+            }
+            if customer_ids is not None:
+                data['nextAfter'] = next_after
+            return Response(data)
+
         except Exception as e:
+            logger.exception("Error generating credit report")
             return Response(
                 {'error': f'Error generating credit report: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @staticmethod
+    def _stream_json(reports, next_after):
+        """Emit the same document as the buffered response, one customer at a time"""
+        yield '{"creditReports": ['
+        count = 0
+        for report in reports:
+            yield ("," if count else "") + json.dumps(report, cls=DjangoJSONEncoder)
+            count += 1
+        yield f'], "totalCustomers": {count}, "nextAfter": {json.dumps(next_after)}}}'
+
 class ExternalCreditReport(APIView):
     permission_classes = [IsAuthenticated]
 
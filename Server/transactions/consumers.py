@@ -5,6 +5,8 @@ from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from .models import Route, RouteLocationPing
+from .ping_buffer import ping_buffer
+from .serializers import RouteLocationPointSerializer
 
 
 class RouteTrackingConsumer(AsyncWebsocketConsumer):
@@ -42,6 +44,8 @@ class RouteTrackingConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        # Persist this worker's buffered pings rather than wait for the next interval
+        await database_sync_to_async(ping_buffer.flush)()
 
     async def receive(self, text_data):
         """Handle incoming WebSocket messages"""
@@ -66,8 +70,9 @@ class RouteTrackingConsumer(AsyncWebsocketConsumer):
     async def handle_location_update(self, data):
         """Handle GPS location updates"""
         try:
-            # Save location ping to database
-            ping_data = await self.save_location_ping(data)
+            # Validated in memory and written behind by ping_buffer, so the
+            # broadcast does not wait for the insert
+            ping_data = self.buffer_location_ping(data)
             
             # Broadcast to all connected clients
             await self.channel_layer.group_send(
@@ -96,6 +101,7 @@ class RouteTrackingConsumer(AsyncWebsocketConsumer):
         """Check if user has access to this route"""
         try:
             route = Route.objects.get(id=self.route_id)
+            self.route_pk = route.pk
             
             # Admin can access all routes
             if hasattr(self.user, 'role') and self.user.role == 'admin':
@@ -109,31 +115,38 @@ class RouteTrackingConsumer(AsyncWebsocketConsumer):
         except Route.DoesNotExist:
             return False
 
-    @database_sync_to_async
-    def save_location_ping(self, data):
-        """Save location ping to database"""
-        try:
-            route = Route.objects.get(id=self.route_id)
-            
-            ping = RouteLocationPing.objects.create(
-                route=route,
-                lat=data.get('lat'),
-                lon=data.get('lon'),
-                accuracy_meters=data.get('accuracy_meters'),
-                speed_mps=data.get('speed_mps'),
-                heading_degrees=data.get('heading_degrees'),
-                company=self.user.company
-            )
-            
-            return {
-                'id': str(ping.id),
-                'lat': float(ping.lat),
-                'lon': float(ping.lon),
-                'accuracy_meters': float(ping.accuracy_meters) if ping.accuracy_meters else None,
-                'speed_mps': float(ping.speed_mps) if ping.speed_mps else None,
-                'heading_degrees': float(ping.heading_degrees) if ping.heading_degrees else None,
-                'created_at': ping.created_at.isoformat()
-            }
-            
-        except Exception as e:
-            raise Exception(f"Failed to save location ping: {str(e)}")
+    def buffer_location_ping(self, data):
+        """
+        Validate a location update and queue it for writing.
+
+        Everything that could make the insert fail is checked here, since the
+        write happens later in a batch. No database access.
+        """
+        if self.user.company_id is None:
+            raise Exception("Failed to save location ping: user has no company")
+        serializer = RouteLocationPointSerializer(data=data)
+        if not serializer.is_valid():
+            raise Exception(f"Failed to save location ping: {serializer.errors}")
+        values = serializer.validated_data
+
+        ping = RouteLocationPing(
+            route_id=self.route_pk,
+            lat=values['lat'],
+            lon=values['lon'],
+            accuracy_meters=values.get('accuracy_meters'),
+            speed_mps=values.get('speed_mps'),
+            heading_degrees=values.get('heading_degrees'),
+            company_id=self.user.company_id
+        )
+        ping_buffer.submit(ping)
+
+        return {
+            'id': str(ping.id),
+            'lat': float(ping.lat),
+            'lon': float(ping.lon),
+            'accuracy_meters': float(ping.accuracy_meters) if ping.accuracy_meters else None,
+            'speed_mps': float(ping.speed_mps) if ping.speed_mps else None,
+            'heading_degrees': float(ping.heading_degrees) if ping.heading_degrees else None,
+            # Stamped on receipt; the buffered row is stored with the same value
+            'created_at': ping.created_at.isoformat()
+        }
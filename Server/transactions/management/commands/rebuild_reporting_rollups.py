@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from transactions.services import ReportingRollupService
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily reporting rollups from orders and invoices (backfill or repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only rebuild this company id')
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days recomputed per batch of queries')
+
+    def handle(self, *args, **options):
+        start = parse_date(options['start']) if options['start'] else None
+        end = parse_date(options['end']) if options['end'] else None
+        if (options['start'] and not start) or (options['end'] and not end):
+            raise CommandError('--start and --end must be YYYY-MM-DD')
+
+        days = ReportingRollupService.rebuild(
+            company_id=options['company'], start=start, end=end, chunk_days=options['chunk_days']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rollup days rebuilt: {days}"))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from transactions.models import PurchaseOrder, SalesOrder
+from transactions.services import OrderTotalsService, ReportingRollupService
+
+
+class Command(BaseCommand):
+    help = 'Recompute sales and purchase order totals with set-based UPDATEs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only recompute orders of this company id')
+
+    def handle(self, *args, **options):
+        sales_orders = SalesOrder.objects.all()
+        purchase_orders = PurchaseOrder.objects.all()
+        if options['company']:
+            sales_orders = sales_orders.filter(company_id=options['company'])
+            purchase_orders = purchase_orders.filter(company_id=options['company'])
+
+        sales_count = OrderTotalsService.recalculate_sales_orders(sales_orders)
+        purchase_count = OrderTotalsService.recalculate_purchase_orders(purchase_orders)
+
+        self.stdout.write(f"Sales orders recalculated: {sales_count}")
+        self.stdout.write(f"Purchase orders recalculated: {purchase_count}")
+
+        # The set-based UPDATEs bypass the signals that keep the rollups current
+        days = ReportingRollupService.rebuild(company_id=options['company'])
+        self.stdout.write(f"Rollup days rebuilt: {days}")
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_role'),
+        ('transactions', '0006_alter_invoice_due_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='route',
+            name='route_number',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AlterUniqueTogether(
+            name='route',
+            unique_together={('route_number', 'company')},
+        ),
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('SO', 'Sales Order'), ('PO', 'Purchase Order'), ('INV', 'Invoice'), ('RT', 'Route')], max_length=10)),
+                ('day', models.DateField()),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_sequences', to='accounts.company')),
+            ],
+            options={
+                'unique_together': {('company', 'doc_type', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_role'),
+        ('transactions', '0007_documentsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyVatRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(max_length=100)),
+                ('net_amount', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('vat_amount', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_vat_rollups', to='accounts.company')),
+            ],
+            options={
+                'unique_together': {('company', 'day', 'category')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyReportRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sales_gross', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('sales_net', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('sales_vat', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('sales_profit', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('sales_count', models.PositiveIntegerField(default=0)),
+                ('purchase_gross', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('purchase_net', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('purchase_vat', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('purchase_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_report_rollups', to='accounts.company')),
+            ],
+            options={
+                'unique_together': {('company', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_report_data_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'created_at', 'id'], name='transaction_company_eb456b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['company', 'created_at', 'id'], name='transaction_company_f358c9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['company', 'created_at', 'id'], name='transaction_company_07cf4b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['company', 'created_at', 'id'], name='transaction_company_371007_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routelocationping',
+            index=models.Index(fields=['company', 'created_at', 'id'], name='transaction_company_cb04a7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routevisit',
+            index=models.Index(fields=['company', 'created_at', 'id'], name='transaction_company_a308a0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['company', 'created_at', 'id'], name='transaction_company_54a898_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:38
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0011_closed_vat_report'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='routelocationping',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -5,12 +5,86 @@ from django.dispatch import receiver
 
 # Create your models here.
 # transactions/models.py
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from main.models import BaseModel, Credit, Customer, Product, VATSettings,Company
 from accounts.models import User
 
 
+class DocumentSequence(models.Model):
+    """
+    Per-company daily counter used to number orders, invoices and routes.
+    One row per (company, document type, day); allocation locks that row and
+    increments it, so numbering costs O(1) queries and is safe across workers.
+    """
+    SALES_ORDER = "SO"
+    PURCHASE_ORDER = "PO"
+    INVOICE = "INV"
+    ROUTE = "RT"
+    DOC_TYPE_CHOICES = [
+        (SALES_ORDER, "Sales Order"),
+        (PURCHASE_ORDER, "Purchase Order"),
+        (INVOICE, "Invoice"),
+        (ROUTE, "Route"),
+    ]
+    # Where each document type stores its number, used to seed a new day's
+    # counter from documents numbered before the counter row existed
+    NUMBER_FIELDS = {
+        SALES_ORDER: ("SalesOrder", "order_number"),
+        PURCHASE_ORDER: ("PurchaseOrder", "order_number"),
+        INVOICE: ("Invoice", "invoice_no"),
+        ROUTE: ("Route", "route_number"),
+    }
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='document_sequences')
+    doc_type = models.CharField(max_length=10, choices=DOC_TYPE_CHOICES)
+    day = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("company", "doc_type", "day")
+
+    def __str__(self):
+        return f"{self.doc_type}-{self.day.strftime('%Y%m%d')} ({self.last_value})"
+
+    @staticmethod
+    def format_number(doc_type, day, value):
+        return f"{doc_type}-{day.strftime('%Y%m%d')}-{value:03d}"
+
+    @classmethod
+    def _seed_value(cls, company_id, doc_type, day):
+        """Highest number already issued for this day, for counters created mid-day"""
+        model_name, field = cls.NUMBER_FIELDS[doc_type]
+        model = apps.get_model("transactions", model_name)
+        prefix = f"{doc_type}-{day.strftime('%Y%m%d')}-"
+        numbers = model.objects.filter(
+            company_id=company_id, **{f"{field}__startswith": prefix}
+        ).values_list(field, flat=True)
+        return max((int(n[len(prefix):]) for n in numbers if n[len(prefix):].isdigit()), default=0)
+
+    @classmethod
+    def next_number(cls, company_id, doc_type, day=None):
+        """
+        Allocate the next document number, e.g. SO-20250101-001.
+        The counter row stays locked until the caller's transaction ends.
+        """
+        from django.utils import timezone
+
+        day = day or timezone.localdate()
+        with transaction.atomic():
+            sequence, _ = cls.objects.select_for_update().get_or_create(
+                company_id=company_id,
+                doc_type=doc_type,
+                day=day,
+                defaults={"last_value": lambda: cls._seed_value(company_id, doc_type, day)},
+            )
+            sequence.last_value += 1
+            sequence.save(update_fields=["last_value"])
+        return cls.format_number(doc_type, day, sequence.last_value)
+
+
 class SalesOrder(BaseModel):
     STATUS_CHOICES = [
         ("draft", "Draft"),
@@ -38,6 +112,7 @@ class SalesOrder(BaseModel):
         indexes = [
             models.Index(fields=["customer", "status"]),
             models.Index(fields=["order_date"]),
+            models.Index(fields=["company", "created_at", "id"]),
         ]
         unique_together = ("order_number", "company")
 
@@ -46,51 +121,27 @@ class SalesOrder(BaseModel):
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            from datetime import datetime
-            timestamp = datetime.now().strftime('%Y%m%d')
-            # Ensure unique order_number for the day
-            today_orders = SalesOrder.objects.filter(
-                order_date=self.order_date
-            ).count()
-            base_order_number = f"SO-{timestamp}-{today_orders + 1:03d}"
-            # Check for duplicates and increment if needed
-            order_number = base_order_number
-            counter = today_orders + 1
-            while SalesOrder.objects.filter(order_number=order_number).exists():
-                counter += 1
-                order_number = f"SO-{timestamp}-{counter:03d}"
-            self.order_number = order_number
+            self.order_number = DocumentSequence.next_number(
+                self.company_id, DocumentSequence.SALES_ORDER
+            )
         super().save(*args, **kwargs)
 
     def calculate_totals(self):
         """
         Aggregate line items, compute subtotal, vat_total, grand_total, profit.
-        Call this from the save() of OrderLineItem and SalesOrder.
+        Call this from the save() of OrderLineItem and SalesOrder. The sums are
+        computed by one database query instead of loading every line; use
+        OrderTotalsService.recalculate_sales_orders to recompute a whole
+        queryset in the database.
         """
-        lines = self.line_items.select_related("product__vat_category")
-        net_subtotal = 0
-        vat_total = 0
-        total_cost = 0
-        for l in lines:
-            vat_rate = float(l.product.vat_category.rate or 0)
-            line_gross = float(l.line_total)
-            if self.prices_include_vat and vat_rate > 0:
-                # gross includes VAT → net = gross / (1 + r)
-                net = line_gross / (1 + vat_rate / 100)
-                vat = line_gross - net
-            else:
-                # exclusive or zero/exempt
-                net = line_gross
-                vat = line_gross * vat_rate / 100
-            net_subtotal += net
-            vat_total += vat
-            # compute cost using product.unit_cost
-            total_cost += float(getattr(l.product, "unit_cost", 0) or 0) * float(l.quantity)
-        self.subtotal = net_subtotal
-        self.vat_total = vat_total
-        self.grand_total = net_subtotal + vat_total
+        from .services import OrderTotalsService
+
+        totals = OrderTotalsService.order_totals(self, "sales_order")
+        self.subtotal = totals["subtotal"]
+        self.vat_total = totals["vat_total"]
+        self.grand_total = totals["grand_total"]
         # profit = revenue(net) - cost
-        self.profit = net_subtotal - total_cost
+        self.profit = totals["profit"]
 
 
 class OrderLineItem(BaseModel):
@@ -144,6 +195,7 @@ class PurchaseOrder(BaseModel):
         indexes = [
             models.Index(fields=["supplier", "status"]),
             models.Index(fields=["order_date"]),
+            models.Index(fields=["company", "created_at", "id"]),
         ]
         unique_together = ("order_number", "company")
 
@@ -152,40 +204,19 @@ class PurchaseOrder(BaseModel):
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            from datetime import datetime
-            timestamp = datetime.now().strftime('%Y%m%d')
-            # Ensure unique order_number for the day
-            today_orders = PurchaseOrder.objects.filter(
-                order_date=self.order_date
-            ).count()
-            base_order_number = f"PO-{timestamp}-{today_orders + 1:03d}"
-            # Check for duplicates and increment if needed
-            order_number = base_order_number
-            counter = today_orders + 1
-            while PurchaseOrder.objects.filter(order_number=order_number).exists():
-                counter += 1
-                order_number = f"PO-{timestamp}-{counter:03d}"
-            self.order_number = order_number
+            self.order_number = DocumentSequence.next_number(
+                self.company_id, DocumentSequence.PURCHASE_ORDER
+            )
         super().save(*args, **kwargs)
 
     def calculate_totals(self):
-        lines = self.line_items.select_related("product__vat_category")
-        net_subtotal = 0
-        vat_total = 0
-        for l in lines:
-            vat_rate = float(l.product.vat_category.rate or 0)
-            line_gross = float(l.line_total)
-            if self.prices_include_vat and vat_rate > 0:
-                net = line_gross / (1 + vat_rate / 100)
-                vat = line_gross - net
-            else:
-                net = line_gross
-                vat = line_gross * vat_rate / 100
-            net_subtotal += net
-            vat_total += vat
-        self.subtotal = net_subtotal
-        self.vat_total = vat_total
-        self.grand_total = net_subtotal + vat_total
+        """See SalesOrder.calculate_totals; purchase orders carry no profit."""
+        from .services import OrderTotalsService
+
+        totals = OrderTotalsService.order_totals(self, "purchase_order", with_cost=False)
+        self.subtotal = totals["subtotal"]
+        self.vat_total = totals["vat_total"]
+        self.grand_total = totals["grand_total"]
 
 
 class PurchaseOrderLineItem(BaseModel):
@@ -231,6 +262,7 @@ class Invoice(BaseModel):
         indexes = [
             models.Index(fields=["invoice_no"]),
             models.Index(fields=["due_date"]),
+            models.Index(fields=["company", "created_at", "id"]),
         ]
         unique_together = ("invoice_no", "company")
 
@@ -250,13 +282,32 @@ class Invoice(BaseModel):
             # No credit, use traditional invoice payment logic
             return max(Decimal(self.amount_due) - Decimal(self.paid_amount), Decimal('0.00'))
 
-    def update_payment_status(self):
-        """Update paid_amount and status based on credit system"""
-        # Force refresh from database to get latest data
-        self.refresh_from_db()
-        
-        try:
-            credit = self.credits
+    @staticmethod
+    def outstanding_expression():
+        """
+        SQL equivalent of the outstanding property, for annotate()/aggregate():
+        the credit's remaining amount, falling back to amount_due - paid_amount
+        when the invoice has no credit, never below zero.
+        """
+        from django.db.models.functions import Greatest
+
+        amount = models.DecimalField(max_digits=12, decimal_places=2)
+        remaining = models.Case(
+            models.When(
+                credits__isnull=False,
+                then=models.F("credits__amount") - models.F("credits__payed_amount"),
+            ),
+            default=models.F("amount_due") - models.F("paid_amount"),
+            output_field=amount,
+        )
+        return Greatest(remaining, models.Value(Decimal("0.00")), output_field=amount)
+
+    def apply_payment_totals(self, credit=None, total_paid=None):
+        """
+        Set paid_amount and status in memory from the invoice's credit, or from
+        the total of its payments when there is no credit. Does not save.
+        """
+        if credit is not None:
             # Use credit system for status calculation
             credit_amount = Decimal(str(credit.amount))
             paid_amount = Decimal(str(credit.payed_amount or 0))
@@ -271,14 +322,9 @@ class Invoice(BaseModel):
             else:
                 self.status = "sent"  # Credit granted but no payments yet
                 self.paid_amount = Decimal('0.00')
-                
-        except Credit.DoesNotExist:
+        else:
             # No credit system - use traditional payment logic
-            total_paid = self.payments.aggregate(
-                total=models.Sum('amount')
-            )['total'] or Decimal('0.00')
-            
-            total_paid = Decimal(str(total_paid))
+            total_paid = Decimal(str(total_paid or 0))
             amount_due = Decimal(str(self.amount_due))
             
             self.paid_amount = total_paid
@@ -289,6 +335,21 @@ class Invoice(BaseModel):
                 self.status = "sent"
             else:
                 self.status = "draft"
+
+    def update_payment_status(self):
+        """Update paid_amount and status based on credit system"""
+        # Force refresh from database to get latest data
+        self.refresh_from_db()
+        
+        try:
+            credit = self.credits
+            total_paid = None
+        except Credit.DoesNotExist:
+            credit = None
+            total_paid = self.payments.aggregate(
+                total=models.Sum('amount')
+            )['total']
+        self.apply_payment_totals(credit, total_paid)
         
         # Save the updated invoice
         self.save(update_fields=['paid_amount', 'status'])
@@ -297,17 +358,13 @@ class Invoice(BaseModel):
         print(f"Invoice {self.invoice_no}: amount_due={self.amount_due}, paid_amount={self.paid_amount}, status={self.status}")
         
     def save(self, *args, **kwargs):
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d')
-        # Always ensure invoice_no is unique
-        if not self.invoice_no or Invoice.objects.filter(invoice_no=self.invoice_no).exclude(pk=self.pk).exists():
-            counter = 1
-            while True:
-                candidate = f"INV-{timestamp}-{counter:03d}"
-                if not Invoice.objects.filter(invoice_no=candidate).exists():
-                    self.invoice_no = candidate
-                    break
-                counter += 1
+        # Blank or already taken (e.g. supplied by an admin or a script): allocate a new number
+        if not self.invoice_no or Invoice.objects.filter(
+            company_id=self.company_id, invoice_no=self.invoice_no
+        ).exclude(pk=self.pk).exists():
+            self.invoice_no = DocumentSequence.next_number(
+                self.company_id, DocumentSequence.INVOICE
+            )
         # Set amount_due from sales order if not set
         if not self.amount_due and self.sales_order:
             self.amount_due = self.sales_order.grand_total
@@ -355,11 +412,16 @@ class Payment(BaseModel):
     mode    = models.CharField(max_length=30, choices=[("cash", "Cash"), ("bank", "Bank")])
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='payments')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["company", "created_at", "id"]),
+        ]
+
                 
         
 class Route(BaseModel):
     # Human-readable ID for display
-    route_number = models.CharField(max_length=20, unique=True, blank=True)
+    route_number = models.CharField(max_length=20, blank=True)
     salesperson = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     name        = models.CharField(max_length=100)
     date        = models.DateField()
@@ -371,20 +433,18 @@ class Route(BaseModel):
         indexes = [
             models.Index(fields=["route_number"]),
             models.Index(fields=["salesperson", "date"]),
+            models.Index(fields=["company", "created_at", "id"]),
         ]
+        unique_together = ("route_number", "company")
 
     def __str__(self):
         return self.route_number or f"{self.name} - {self.date}"
 
     def save(self, *args, **kwargs):
         if not self.route_number:
-            from datetime import datetime
-            timestamp = datetime.now().strftime('%Y%m%d')
-            # Get count of routes for today
-            today_routes = Route.objects.filter(
-                date=self.date
-            ).count()
-            self.route_number = f"RT-{timestamp}-{today_routes + 1:03d}"
+            self.route_number = DocumentSequence.next_number(
+                self.company_id, DocumentSequence.ROUTE
+            )
         super().save(*args, **kwargs)
 
 
@@ -410,6 +470,11 @@ class RouteVisit(BaseModel):
     visit_duration_minutes = models.IntegerField(null=True, blank=True)
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='route_visits')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["company", "created_at", "id"]),
+        ]
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         
@@ -428,13 +493,105 @@ class RouteLocationPing(BaseModel):
     speed_mps = models.DecimalField(max_digits=8, decimal_places=4, null=True, blank=True)  # Increased precision for speed
     heading_degrees = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='route_location_pings')
+    # Stamped when the ping is built, i.e. when it is received, not when a
+    # buffered batch is inserted, so live broadcasts and stored rows agree
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         indexes = [
             models.Index(fields=["route", "created_at"]),
+            models.Index(fields=["company", "created_at", "id"]),
         ]
 
 
+class DailyReportRollup(models.Model):
+    """
+    Per-company, per-day sales and purchase totals (by order_date) read by the
+    report views. Refreshed by ReportingRollupService when orders change and
+    rebuilt with the rebuild_reporting_rollups command.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='daily_report_rollups')
+    day = models.DateField()
+    sales_gross = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    sales_net = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    sales_vat = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    sales_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    sales_count = models.PositiveIntegerField(default=0)
+    purchase_gross = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    purchase_net = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    purchase_vat = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    purchase_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("company", "day")
+
+    def __str__(self):
+        return f"{self.company_id} {self.day}"
+
+
+class DailyVatRollup(models.Model):
+    """Per-company, per-day net sales and VAT by VAT category (by invoice issue_date)"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='daily_vat_rollups')
+    day = models.DateField()
+    category = models.CharField(max_length=100)
+    net_amount = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    vat_amount = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("company", "day", "category")
+
+    def __str__(self):
+        return f"{self.company_id} {self.day} {self.category}"
+
+
+class ClosedVatReport(models.Model):
+    """
+    VAT totals of a period that ended before the day it was computed, shared by
+    all workers. Rows are deleted when a VAT rollup day inside the period is
+    recomputed, so writes to other periods leave them in place.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='closed_vat_reports')
+    period_start = models.DateField()
+    period_end = models.DateField()
+    # {category: {"sales": "...", "vat": "..."}} with decimals as strings
+    totals = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("company", "period_start", "period_end")
+
+    def __str__(self):
+        return f"{self.company_id} {self.period_start}..{self.period_end}"
+
+
+class ReportDataVersion(models.Model):
+    """
+    Per-company counter bumped after every committed write that can change a
+    report; report cache keys include it, so a bump invalidates them all.
+    """
+    company = models.OneToOneField(
+        Company, on_delete=models.CASCADE, primary_key=True, related_name='report_data_version'
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.company_id} v{self.version}"
+
+    @classmethod
+    def current(cls, company_id):
+        return cls.objects.filter(company_id=company_id).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, company_id):
+        if cls.objects.filter(company_id=company_id).update(version=models.F("version") + 1):
+            return
+        obj, created = cls.objects.get_or_create(company_id=company_id, defaults={"version": 1})
+        if not created:
+            cls.objects.filter(company_id=company_id).update(version=models.F("version") + 1)
+
+
 # Signal handlers for Payment model
 @receiver(post_save, sender=Payment)
 def update_credit_on_payment_save(sender, instance, created, **kwargs):
@@ -442,7 +599,8 @@ def update_credit_on_payment_save(sender, instance, created, **kwargs):
     print(f"DEBUG: Payment signal triggered - created: {created}, amount: {instance.amount}")
     
     try:
-        credit = instance.invoice.credits
+        # Read the credit fresh: the copy cached on instance.invoice may be stale
+        credit = Credit.objects.get(invoice_id=instance.invoice_id)
         print(f"DEBUG: Found credit with current payed_amount: {credit.payed_amount}")
         
         if created:
@@ -487,7 +645,7 @@ def update_credit_on_payment_delete(sender, instance, **kwargs):
     print(f"DEBUG: Payment delete signal triggered for amount: {instance.amount}")
     
     try:
-        credit = instance.invoice.credits
+        credit = Credit.objects.get(invoice_id=instance.invoice_id)
         # Recalculate total from remaining payments
         total_payments = instance.invoice.payments.aggregate(
             total=models.Sum('amount')
@@ -0,0 +1,161 @@
+"""
+Write-behind buffer for live GPS pings.
+
+RouteTrackingConsumer broadcasts a location update as soon as it arrives and
+hands the unsaved RouteLocationPing to ping_buffer, so fan-out never waits for
+the database. A daemon thread inserts buffered pings with bulk_create when
+ROUTE_PING_BUFFER_SIZE pings are waiting or every ROUTE_PING_FLUSH_INTERVAL
+seconds. Consumers flush on disconnect and the buffer is drained at exit;
+pings submitted after that are dropped. Pings that cannot be written are
+dropped too, so a broadcast ping is not guaranteed to be stored. Every dropped
+ping is logged with its id and route. Buffer depth and flush latency counters
+are kept per process.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import RouteLocationPing
+
+logger = logging.getLogger(__name__)
+
+
+class PingBuffer:
+    """Buffers RouteLocationPing instances and writes them in batches from a background thread"""
+
+    def __init__(self, batch_size=200, flush_interval=0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        # Serializes flushes, so pings are inserted in the order they arrived
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.last_flush_at = None
+
+    def submit(self, ping):
+        """Queue an unsaved RouteLocationPing; safe to call from the event loop (no database access)"""
+        if self._stopping:
+            # The queue has been drained for exit; writing here would block the event loop
+            with self._lock:
+                self.dropped += 1
+            logger.warning(f"Dropped route ping {ping.id} for route {ping.route_id}: buffer is shutting down")
+            return
+        with self._lock:
+            self._buffer.append(ping)
+            self.submitted += 1
+            depth = len(self._buffer)
+            self.max_depth = max(self.max_depth, depth)
+        self._ensure_thread()
+        if depth >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Write everything buffered so far on the calling thread.
+
+        Returns:
+            int: Number of pings written
+        """
+        with self._flush_lock:
+            with self._lock:
+                pings, self._buffer = self._buffer, []
+            if not pings:
+                return 0
+            started = time.monotonic()
+            written = self._write(pings)
+            elapsed_ms = (time.monotonic() - started) * 1000
+            with self._lock:
+                self.flushes += 1
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self.total_flush_ms += elapsed_ms
+                self.last_flush_at = timezone.now()
+            return written
+
+    def shutdown(self):
+        """Stop buffering and drain the queue synchronously (registered with atexit)"""
+        self._stopping = True
+        self._wakeup.set()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": len(self._buffer),
+                "max_depth": self.max_depth,
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+                "max_flush_ms": round(self.max_flush_ms, 3),
+                "last_flush_at": self.last_flush_at.isoformat() if self.last_flush_at else None,
+            }
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="route-ping-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # The writer thread owns its own connection; don't hold it between batches
+                connection.close()
+
+    def _write(self, pings):
+        written = 0
+        for start in range(0, len(pings), self.batch_size):
+            batch = pings[start:start + self.batch_size]
+            try:
+                with transaction.atomic():
+                    RouteLocationPing.objects.bulk_create(batch)
+                written += len(batch)
+            except Exception:
+                # e.g. a route deleted while its pings were buffered: keep the rest of the batch
+                logger.exception(f"Failed to write {len(batch)} route pings, retrying one by one")
+                for ping in batch:
+                    try:
+                        with transaction.atomic():
+                            RouteLocationPing.objects.bulk_create([ping])
+                        written += 1
+                    except Exception:
+                        with self._lock:
+                            self.dropped += 1
+                        logger.error(f"Dropped route ping {ping.id} for route {ping.route_id}")
+        with self._lock:
+            self.written += written
+        return written
+
+
+ping_buffer = PingBuffer(
+    batch_size=getattr(settings, "ROUTE_PING_BUFFER_SIZE", 200),
+    flush_interval=getattr(settings, "ROUTE_PING_FLUSH_INTERVAL", 0.5),
+)
+atexit.register(ping_buffer.shutdown)
@@ -0,0 +1,105 @@
+"""
+In-process result cache for the report endpoints.
+
+Entries are keyed on the view, the user's company, the query parameters and
+the company's ReportDataVersion, so any committed write that can change a
+report makes the old entries unreachable; they then age out through the TTL
+or the LRU bound. Hit/miss/eviction counters are kept per process.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from rest_framework.response import Response
+
+from .models import ReportDataVersion
+
+
+class ReportCache:
+    """Thread-safe LRU cache with a per-entry time-to-live"""
+
+    def __init__(self, max_entries=512, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+report_cache = ReportCache(
+    max_entries=getattr(settings, "REPORT_CACHE_MAX_ENTRIES", 512),
+    ttl=getattr(settings, "REPORT_CACHE_TTL", 300),
+)
+
+
+def cached_report(get):
+    """
+    Decorator for a report view's get(): serve successful responses from
+    report_cache and mark each response with an X-Report-Cache header.
+    """
+    @wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        company_id = getattr(request.user, "company_id", None)
+        params = tuple(sorted((k, tuple(v)) for k, v in request.query_params.lists()))
+        key = (
+            type(self).__name__,
+            company_id,
+            params,
+            tuple(sorted(kwargs.items())),
+            ReportDataVersion.current(company_id),
+        )
+        data = report_cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response["X-Report-Cache"] = "hit"
+            return response
+
+        response = get(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            report_cache.set(key, response.data)
+        response["X-Report-Cache"] = "miss"
+        return response
+
+    return wrapper
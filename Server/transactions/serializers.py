@@ -2,11 +2,16 @@ from rest_framework import serializers
 from .models import Invoice, Payment, PurchaseOrder, PurchaseOrderLineItem, Route, RouteVisit, SalesOrder, OrderLineItem, RouteLocationPing
 from main.models import Customer, Product
 from main.serializers import CustomerSerializer, ProductSerializer
+from .services import OrderBuilder
+from base.fieldsets import SparseFieldsetMixin
+from base.prefetch import PrefetchProfile
 
 class OrderLineItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.UUIDField(write_only=True)
 
+    prefetch_profile = PrefetchProfile(select_related=['product__company', 'product__vat_category'])
+
     class Meta:
         model = OrderLineItem
         fields = ['product_id', 'quantity', 'unit_price', 'discount', 'line_total', 'product']
@@ -18,7 +23,7 @@ class OrderLineItemSerializer(serializers.ModelSerializer):
         return value
 
 
-class SalesOrderSerializer(serializers.ModelSerializer):
+class SalesOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     line_items = OrderLineItemSerializer(many=True, read_only=False)
     salesperson = serializers.SerializerMethodField()  # Get from route visit context
     company_name = serializers.CharField(source="company.name", read_only=True)
@@ -27,6 +32,16 @@ class SalesOrderSerializer(serializers.ModelSerializer):
 
     has_invoice = serializers.SerializerMethodField()
 
+    prefetch_profile = PrefetchProfile(by_field={
+        'company_name': PrefetchProfile(select_related=['company']),
+        'customer_name': PrefetchProfile(select_related=['customer']),
+        'has_invoice': PrefetchProfile(select_related=['invoice']),
+        'line_items': PrefetchProfile(prefetch_related=[('line_items', OrderLineItem, OrderLineItemSerializer)]),
+        'salesperson': PrefetchProfile(prefetch_related=[
+            ('route_visits', RouteVisit, PrefetchProfile(select_related=['route__salesperson'])),
+        ]),
+    })
+
     class Meta:
         model = SalesOrder
         fields = [
@@ -41,7 +56,8 @@ class SalesOrderSerializer(serializers.ModelSerializer):
 
     def get_salesperson(self, obj):
         """Get salesperson from route visit context"""
-        route_visit = obj.route_visits.first()
+        # First visit by pk, like route_visits.first(), but served from the prefetch cache
+        route_visit = min(obj.route_visits.all(), key=lambda visit: visit.pk, default=None)
         if route_visit and route_visit.route.salesperson:
             return {
                 'id': route_visit.route.salesperson.id,
@@ -53,55 +69,19 @@ class SalesOrderSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         line_data = validated_data.pop('line_items', [])
         # salesperson field removed - will be derived from route visit context
-        order = SalesOrder.objects.create(**validated_data)
-        for item in line_data:
-            print(item)
-            OrderLineItem.objects.create(sales_order=order, **item)
-        order.calculate_totals()
-        order.save(update_fields=['subtotal', 'vat_total', 'grand_total', 'profit'])
-        return order
+        return OrderBuilder.create_sales_order(validated_data, line_data)
     
     def update(self, instance, validated_data):
-        # Extract nested line items from validated data
-        line_items_data = validated_data.pop('line_items', [])
-
-        # Update the top-level sales order attributes
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-
-        # Process the nested line items
-        current_line_items = list(instance.line_items.all())
-        
-        # Update existing line items based on product_id or other unique key
-        for item_data in line_items_data:
-            # Find a matching existing line item based on product_id or any unique identifier
-            existing_item = next(
-                (item for item in current_line_items 
-                if item.product_id == item_data.get('product_id')), 
-                None
-            )
-            
-            if existing_item:
-                # Update the existing line item
-                for attr, value in item_data.items():
-                    setattr(existing_item, attr, value)
-                existing_item.save()
-                current_line_items.remove(existing_item)  # Remove it from the list so we don't delete it later
-            else:
-                # Create a new line item
-                OrderLineItem.objects.create(sales_order=instance, **item_data)
-
-        # Delete any leftover line items that were not updated or recreated
-        for item in current_line_items:
-            item.delete()
-
-        return instance
+        # Lines are only reconciled when the payload carries them (PATCH may omit)
+        line_items_data = validated_data.pop('line_items', None)
+        return OrderBuilder.update_sales_order(instance, validated_data, line_items_data)
     
 class PurchaseOrderLineItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.UUIDField(write_only=True)
 
+    prefetch_profile = PrefetchProfile(select_related=['product__company', 'product__vat_category'])
+
     class Meta:
         model = PurchaseOrderLineItem
         fields = ['id', 'product', 'product_id', 'quantity', 'unit_cost',
@@ -117,6 +97,11 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
     line_items = PurchaseOrderLineItemSerializer(many=True, read_only=False)
     company_name = serializers.CharField(source="company.name", read_only=True)
 
+    prefetch_profile = PrefetchProfile(
+        select_related=['company'],
+        prefetch_related=[('line_items', PurchaseOrderLineItem, PurchaseOrderLineItemSerializer)],
+    )
+
 
     class Meta:
         model = PurchaseOrder
@@ -128,19 +113,17 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         line_data = validated_data.pop('line_items', [])
-        po = PurchaseOrder.objects.create(**validated_data)
-        for item in line_data:
-            PurchaseOrderLineItem.objects.create(purchase_order=po, **item)
-        po.calculate_totals()
-        po.save(update_fields=['subtotal', 'vat_total', 'grand_total'])
-
-        return po
+        return OrderBuilder.create_purchase_order(validated_data, line_data)
     
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     company_name = serializers.CharField(source="company.name", read_only=True)
     invoice_id = serializers.UUIDField(write_only=True)  # Add writable field for invoice_id
 
+    prefetch_profile = PrefetchProfile(by_field={
+        'company_name': PrefetchProfile(select_related=['company']),
+    })
+
     class Meta:
         model = Payment
         fields = ['id', 'invoice', 'amount', 'paid_on', 'mode', 'company_name', 'invoice_id']
@@ -160,12 +143,29 @@ class PaymentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
     
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     payments = PaymentSerializer(many=True, read_only=True)
     outstanding = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     customer_name = serializers.SerializerMethodField(read_only=True)
     company_name = serializers.CharField(source="company.name", read_only=True)
-    sales_order_details = SalesOrderSerializer(read_only=True)
+    sales_order_details = SalesOrderSerializer(source='sales_order', read_only=True)
+
+    # credits: the outstanding property reads the invoice's credit.
+    # sales_order_details goes through the select_related sales order, so its
+    # own relations are loaded with the sales_order__ prefix.
+    prefetch_profile = PrefetchProfile(by_field={
+        'outstanding': PrefetchProfile(select_related=['credits']),
+        'customer_name': PrefetchProfile(select_related=['sales_order__customer']),
+        'company_name': PrefetchProfile(select_related=['company']),
+        'payments': PrefetchProfile(prefetch_related=[('payments', Payment, PaymentSerializer)]),
+        'sales_order_details': PrefetchProfile(
+            select_related=['sales_order__company', 'sales_order__customer', 'sales_order__invoice'],
+            prefetch_related=[
+                ('sales_order__line_items', OrderLineItem, OrderLineItemSerializer),
+                ('sales_order__route_visits', RouteVisit, PrefetchProfile(select_related=['route__salesperson'])),
+            ],
+        ),
+    })
     
     class Meta:
         model = Invoice
@@ -174,6 +174,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'amount_due', 'paid_amount', 'outstanding', 'status', 'payments', 'customer_name', 'company_name', 'sales_order_details'
         ]
         read_only_fields = ['paid_amount', 'status', 'invoice_no', 'company_name']
+        expandable_fields = ['sales_order_details']
 
     def get_customer_name(self, obj):
         # Get customer name from related sales order
@@ -193,16 +194,32 @@ class InvoiceSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         """Ensure outstanding is always calculated fresh"""
         data = super().to_representation(instance)
-        data['outstanding'] = str(instance.outstanding)
+        if 'outstanding' in data:
+            data['outstanding'] = str(instance.outstanding)
         return data
+
+
+class InvoiceSummarySerializer(InvoiceSerializer):
+    """Invoice list rows: payments and sales order details only via ?expand="""
+
+    class Meta(InvoiceSerializer.Meta):
+        expandable_fields = ['payments', 'sales_order_details']
         
 
-class RouteVisitSerializer(serializers.ModelSerializer):
+class RouteVisitSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     sales_orders_details = serializers.SerializerMethodField(read_only=True)
     customer_name = serializers.SerializerMethodField(read_only=True)
     route_name = serializers.SerializerMethodField(read_only=True)
     company_name = serializers.CharField(source="company.name", read_only=True)
 
+    prefetch_profile = PrefetchProfile(by_field={
+        'company_name': PrefetchProfile(select_related=['company']),
+        'customer_name': PrefetchProfile(select_related=['customer']),
+        'route_name': PrefetchProfile(select_related=['route']),
+        'sales_orders': PrefetchProfile(prefetch_related=['sales_orders']),
+        'sales_orders_details': PrefetchProfile(prefetch_related=['sales_orders']),
+    })
+
     class Meta:
         model = RouteVisit
         fields = [
@@ -269,11 +286,32 @@ class RouteVisitSerializer(serializers.ModelSerializer):
         return instance
 
 
-class RouteSerializer(serializers.ModelSerializer):
+class RouteVisitSummarySerializer(serializers.ModelSerializer):
+    """Visit as listed on a route summary: no sales orders or notes"""
+    customer_name = serializers.SerializerMethodField(read_only=True)
+
+    prefetch_profile = PrefetchProfile(select_related=['customer'])
+
+    class Meta:
+        model = RouteVisit
+        fields = ['id', 'customer', 'customer_name', 'lat', 'lon', 'status', 'check_in', 'check_out']
+        read_only_fields = fields
+
+    def get_customer_name(self, obj):
+        return obj.customer.name if obj.customer else None
+
+
+class RouteSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     visits = RouteVisitSerializer(many=True, read_only=True)
     salesperson_name = serializers.CharField(source='salesperson.email', read_only=True)
     company_name = serializers.CharField(source='company.name', read_only=True)
 
+    prefetch_profile = PrefetchProfile(by_field={
+        'salesperson_name': PrefetchProfile(select_related=['salesperson']),
+        'company_name': PrefetchProfile(select_related=['company']),
+        'visits': PrefetchProfile(prefetch_related=[('visits', RouteVisit, RouteVisitSerializer)]),
+    })
+
     class Meta:
         model = Route
         fields = [
@@ -288,7 +326,7 @@ class RouteSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         
         # Make 'salesperson' read-only for non-admin users
-        if request and hasattr(request.user, 'role') and request.user.role != 'admin':
+        if 'salesperson' in fields and request and hasattr(request.user, 'role') and request.user.role != 'admin':
             fields['salesperson'].read_only = True
         return fields
 
@@ -300,31 +338,33 @@ class RouteSerializer(serializers.ModelSerializer):
         return super().create(validated_data)   
 
 
-class RouteLocationPingSerializer(serializers.ModelSerializer):
-    route = serializers.UUIDField()
-    lat = serializers.DecimalField(max_digits=20, decimal_places=15)
-    lon = serializers.DecimalField(max_digits=20, decimal_places=15)
-    accuracy_meters = serializers.DecimalField(max_digits=12, decimal_places=6, required=False, allow_null=True)
-    
-    speed_mps = serializers.DecimalField(max_digits=8, decimal_places=4, required=False, allow_null=True)
-    heading_degrees = serializers.DecimalField(max_digits=6, decimal_places=2, required=False, allow_null=True)
+class RouteSummarySerializer(RouteSerializer):
+    """Route list rows: slim visits; full visits only via ?expand=visit_details"""
+    visits = RouteVisitSummarySerializer(many=True, read_only=True)
+    visit_details = RouteVisitSerializer(source='visits', many=True, read_only=True)
 
-    company_name = serializers.CharField(source="company.name", read_only=True)
+    # visit_details comes last so its full visit prefetch wins when both are rendered
+    prefetch_profile = PrefetchProfile(by_field={
+        'salesperson_name': PrefetchProfile(select_related=['salesperson']),
+        'company_name': PrefetchProfile(select_related=['company']),
+        'visits': PrefetchProfile(prefetch_related=[('visits', RouteVisit, RouteVisitSummarySerializer)]),
+        'visit_details': PrefetchProfile(prefetch_related=[('visits', RouteVisit, RouteVisitSerializer)]),
+    })
 
-    class Meta:
-        model = RouteLocationPing
-        fields = [
-            'id', 'route', 'visit', 'lat', 'lon', 'accuracy_meters',
-            'speed_mps', 'heading_degrees', 'created_at', 'company_name'
-        ]
-        read_only_fields = ['id', 'created_at']
+    class Meta(RouteSerializer.Meta):
+        fields = RouteSerializer.Meta.fields + ['visit_details']
+        expandable_fields = ['visit_details']
+
+
+class RouteLocationValidationMixin:
+    """Route permission and coordinate checks shared by single and batched pings"""
 
     def validate_route(self, value):
-        """Validate that the route exists and belongs to the current user if they're a salesperson"""
+        """Validate that the route exists in the user's company and belongs to them if they're a salesperson"""
+        from .models import Route
+        user = self.context['request'].user
         try:
-            from .models import Route
-            route = Route.objects.get(id=value)
-            user = self.context['request'].user
+            route = Route.objects.get(id=value, company=user.company)
             role = getattr(user, 'role', '')
             if role == 'salesperson' and route.salesperson != user:
                 raise serializers.ValidationError("You can only send location for your own routes")
@@ -344,9 +384,88 @@ class RouteLocationPingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Longitude must be between -180 and 180")
         return value
 
+
+class RouteLocationPingSerializer(RouteLocationValidationMixin, serializers.ModelSerializer):
+    route = serializers.UUIDField()
+    lat = serializers.DecimalField(max_digits=20, decimal_places=15)
+    lon = serializers.DecimalField(max_digits=20, decimal_places=15)
+    accuracy_meters = serializers.DecimalField(max_digits=12, decimal_places=6, required=False, allow_null=True)
+    
+    speed_mps = serializers.DecimalField(max_digits=8, decimal_places=4, required=False, allow_null=True)
+    heading_degrees = serializers.DecimalField(max_digits=6, decimal_places=2, required=False, allow_null=True)
+
+    company_name = serializers.CharField(source="company.name", read_only=True)
+
+    prefetch_profile = PrefetchProfile(select_related=['route', 'company'])
+
+    class Meta:
+        model = RouteLocationPing
+        fields = [
+            'id', 'route', 'visit', 'lat', 'lon', 'accuracy_meters',
+            'speed_mps', 'heading_degrees', 'created_at', 'company_name'
+        ]
+        read_only_fields = ['id', 'created_at']
+
+
+class RouteLocationPointSerializer(RouteLocationValidationMixin, serializers.Serializer):
+    """One GPS point of a batched upload; the route is given once for the batch"""
+    visit = serializers.UUIDField(required=False, allow_null=True)
+    lat = serializers.DecimalField(max_digits=20, decimal_places=15)
+    lon = serializers.DecimalField(max_digits=20, decimal_places=15)
+    accuracy_meters = serializers.DecimalField(max_digits=12, decimal_places=6, required=False, allow_null=True)
+    speed_mps = serializers.DecimalField(max_digits=8, decimal_places=4, required=False, allow_null=True)
+    heading_degrees = serializers.DecimalField(max_digits=6, decimal_places=2, required=False, allow_null=True)
+
+
+class RouteLocationPingBatchSerializer(RouteLocationValidationMixin, serializers.Serializer):
+    """
+    Buffered GPS pings of one route, in recording order. Accepts rows:
+
+        {"route": "uuid", "pings": [{"lat": ..., "lon": ...}, ...]}
+
+    or the same points as columns of equal length:
+
+        {"route": "uuid", "lat": [...], "lon": [...], "speed_mps": [...]}
+    """
+    COLUMNS = ['visit', 'lat', 'lon', 'accuracy_meters', 'speed_mps', 'heading_degrees']
+
+    route = serializers.UUIDField()
+    pings = RouteLocationPointSerializer(many=True, allow_empty=False)
+
+    def to_internal_value(self, data):
+        if 'pings' not in data and isinstance(data.get('lat'), list):
+            columns = {name: data[name] for name in self.COLUMNS if data.get(name) is not None}
+            if not all(isinstance(values, list) for values in columns.values()):
+                raise serializers.ValidationError({'pings': ['Columns must be lists.']})
+            lengths = {len(values) for values in columns.values()}
+            if len(lengths) != 1:
+                raise serializers.ValidationError({'pings': ['Columns must have the same length.']})
+            data = {
+                'route': data.get('route'),
+                'pings': [dict(zip(columns, row)) for row in zip(*columns.values())],
+            }
+        return super().to_internal_value(data)
+
+    def validate_pings(self, value):
+        from django.conf import settings
+        if len(value) > settings.ROUTE_PING_BATCH_MAX:
+            raise serializers.ValidationError(
+                f"At most {settings.ROUTE_PING_BATCH_MAX} pings can be sent at once."
+            )
+        return value
+
     def validate(self, data):
-        """Additional validation"""
-        print(f"Validating RouteLocationPing data: {data}")  # Debug print
+        route = data['route']
+        visit_ids = {point['visit'] for point in data['pings'] if point.get('visit')}
+        if visit_ids:
+            known = set(RouteVisit.objects.filter(route=route, id__in=visit_ids).values_list('id', flat=True))
+            unknown = visit_ids - known
+            if unknown:
+                raise serializers.ValidationError(
+                    {'pings': [f"Visit {pk} is not on this route." for pk in sorted(map(str, unknown))]}
+                )
+        for point in data['pings']:
+            point['visit_id'] = point.pop('visit', None)
         return data
 
 
@@ -358,15 +477,20 @@ class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = ['id', 'name', 'email', 'phone', 'address', 
-                 'current_balance', 'order_count', 'total_spent', 'date']
+                 'current_balance', 'credit_exposure', 'order_count', 'total_spent', 'date']
+        read_only_fields = ['current_balance', 'credit_exposure']
         ref_name = 'TransactionCustomerSerializer'
 
     def get_order_count(self, obj):
-        
+        # Use the annotation when the customer came from an order_stats_annotations() query
+        if hasattr(obj, 'order_count'):
+            return obj.order_count
         return obj.sales_orders.count()
 
     def get_total_spent(self, obj):
+        if hasattr(obj, 'total_spent'):
+            return obj.total_spent
         from django.db.models import Sum
         return obj.sales_orders.aggregate(
             total=Sum('grand_total')
-        )['total'] or 0
\ No newline at end of file
+        )['total'] or 0
@@ -0,0 +1,794 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from functools import reduce
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import operator
+import threading
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from accounts.models import Company
+from audit.middleware import get_current_user
+from audit.utils import create_audit_logs_bulk, get_model_data
+from main.models import Credit, Product
+from .models import (
+    ClosedVatReport, DailyReportRollup, DailyVatRollup, Invoice, OrderLineItem, Payment, PurchaseOrder,
+    PurchaseOrderLineItem, ReportDataVersion, RouteLocationPing, SalesOrder,
+)
+
+logger = logging.getLogger(__name__)
+
+TWO_PLACES = Decimal("0.01")
+
+# Wide enough to hold unrounded sums of VAT-inclusive divisions
+AMOUNT_FIELD = DecimalField(max_digits=20, decimal_places=6)
+
+
+class DecimalLiteral(Value):
+    """
+    Decimal constant for arithmetic expressions. SQLite stores whole decimals
+    as INTEGER (and CASTs them back to INTEGER), so divisions would truncate;
+    there it is rendered as a REAL literal instead.
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return repr(float(self.value)), []
+
+
+HUNDRED = DecimalLiteral(Decimal("100"), output_field=AMOUNT_FIELD)
+
+
+def to_decimal(value) -> Decimal:
+    """Coerce floats, ints, strings and None to an exact Decimal"""
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value or 0))
+
+
+def quantize(value) -> Decimal:
+    """Round a Decimal to currency precision"""
+    return to_decimal(value).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+class OrderTotalsService:
+    """Order totals arithmetic, in Python or pushed down to the database"""
+
+    @staticmethod
+    def line_total(price, quantity, discount) -> Decimal:
+        """
+        Gross line amount after the percentage discount.
+        Returns: Decimal rounded to 2 places, matching the stored line_total
+        """
+        gross = to_decimal(price) * int(quantity)
+        return quantize(gross * (1 - to_decimal(discount) / 100))
+
+    @staticmethod
+    def summarize(lines: Iterable[Tuple], prices_include_vat: bool) -> Dict[str, Decimal]:
+        """
+        Compute order totals in a single pass.
+
+        Args:
+            lines: iterable of (line_total, vat_rate, unit_cost, quantity) tuples
+            prices_include_vat: whether line totals are VAT-inclusive (gross)
+
+        Returns: {'subtotal', 'vat_total', 'grand_total', 'profit'} as Decimals
+        """
+        net_subtotal = Decimal("0")
+        vat_total = Decimal("0")
+        total_cost = Decimal("0")
+        for line_total, vat_rate, unit_cost, quantity in lines:
+            line_gross = to_decimal(line_total)
+            rate = to_decimal(vat_rate)
+            if prices_include_vat and rate > 0:
+                # gross includes VAT → net = gross / (1 + r)
+                net = line_gross / (1 + rate / 100)
+                vat = line_gross - net
+            else:
+                # exclusive or zero/exempt
+                net = line_gross
+                vat = line_gross * rate / 100
+            net_subtotal += net
+            vat_total += vat
+            total_cost += to_decimal(unit_cost) * int(quantity or 0)
+        return {
+            "subtotal": quantize(net_subtotal),
+            "vat_total": quantize(vat_total),
+            "grand_total": quantize(net_subtotal + vat_total),
+            # profit = revenue(net) - cost
+            "profit": quantize(net_subtotal - total_cost),
+        }
+
+    @staticmethod
+    def line_expressions(order_field: str, with_cost: bool = True, prices_include_vat: Optional[bool] = None) -> Dict:
+        """
+        Per-line net/VAT/cost expressions for an order line item queryset.
+
+        Mirrors summarize(): when the parent order's prices include VAT and
+        the product's rate is positive, net = gross * 100 / (100 + rate);
+        otherwise net = gross and VAT = gross * rate / 100.
+
+        Args:
+            order_field: FK from the line to its order ('sales_order' or 'purchase_order')
+            with_cost: include product cost (unit_cost * quantity) for profit
+            prices_include_vat: use this flag instead of reading it from each
+                line's order (for one order whose flag may not be saved yet)
+
+        Returns: {'net', 'vat'[, 'cost']} expressions
+        """
+        gross = F("line_total")
+        rate = F("product__vat_category__rate")
+        exclusive_vat = ExpressionWrapper(
+            gross * Coalesce(rate, Value(Decimal("0"))) / HUNDRED, output_field=AMOUNT_FIELD
+        )
+        if prices_include_vat is False:
+            expressions = {"net": ExpressionWrapper(gross, output_field=AMOUNT_FIELD), "vat": exclusive_vat}
+        else:
+            inclusive = Q(product__vat_category__rate__gt=0)
+            if prices_include_vat is None:
+                inclusive &= Q(**{f"{order_field}__prices_include_vat": True})
+            inclusive_net = ExpressionWrapper(gross * HUNDRED / (HUNDRED + rate), output_field=AMOUNT_FIELD)
+            expressions = {
+                "net": Case(When(inclusive, then=inclusive_net), default=gross, output_field=AMOUNT_FIELD),
+                "vat": Case(
+                    When(inclusive, then=ExpressionWrapper(gross - inclusive_net, output_field=AMOUNT_FIELD)),
+                    default=exclusive_vat,
+                    output_field=AMOUNT_FIELD,
+                ),
+            }
+        if with_cost:
+            expressions["cost"] = ExpressionWrapper(
+                F("product__unit_cost") * F("quantity"), output_field=AMOUNT_FIELD
+            )
+        return expressions
+
+    @staticmethod
+    def order_totals(order, order_field: str, with_cost: bool = True) -> Dict[str, Decimal]:
+        """
+        Totals of one order from a single aggregate query over its lines.
+
+        Args:
+            order: SalesOrder or PurchaseOrder; its in-memory prices_include_vat is used
+            order_field: FK from the line to its order ('sales_order' or 'purchase_order')
+            with_cost: include profit (sales orders)
+
+        Returns: same shape as summarize() ('profit' only when with_cost)
+        """
+        expressions = OrderTotalsService.line_expressions(order_field, with_cost, order.prices_include_vat)
+        sums = order.line_items.order_by().aggregate(**{name: Sum(expr) for name, expr in expressions.items()})
+        net = to_decimal(sums["net"])
+        vat = to_decimal(sums["vat"])
+        totals = {
+            "subtotal": quantize(net),
+            "vat_total": quantize(vat),
+            "grand_total": quantize(net + vat),
+        }
+        if with_cost:
+            totals["profit"] = quantize(net - to_decimal(sums["cost"]))
+        return totals
+
+    @staticmethod
+    def _update_totals(queryset, line_model, order_field: str, with_cost: bool) -> int:
+        """One set-based UPDATE that recomputes totals for every order in queryset"""
+        expressions = OrderTotalsService.line_expressions(order_field, with_cost)
+        lines = (
+            line_model.objects.filter(**{order_field: OuterRef("pk")})
+            .order_by()
+            .values(order_field)
+        )
+
+        def total(expression):
+            return Coalesce(
+                Subquery(lines.annotate(total=Sum(expression)).values("total")[:1], output_field=AMOUNT_FIELD),
+                Value(Decimal("0")),
+                output_field=AMOUNT_FIELD,
+            )
+
+        net = total(expressions["net"])
+        vat = total(expressions["vat"])
+        values = {
+            "subtotal": Round(net, 2),
+            "vat_total": Round(vat, 2),
+            "grand_total": Round(net + vat, 2),
+            "updated_at": timezone.now(),
+        }
+        if with_cost:
+            values["profit"] = Round(net - total(expressions["cost"]), 2)
+        return queryset.order_by().update(**values)
+
+    @staticmethod
+    def recalculate_sales_orders(queryset=None) -> int:
+        """
+        Recompute subtotal/vat_total/grand_total/profit for a SalesOrder queryset
+        in the database. Bypasses save() and therefore audit logging.
+        Returns: number of orders updated
+        """
+        if queryset is None:
+            queryset = SalesOrder.objects.all()
+        return OrderTotalsService._update_totals(queryset, OrderLineItem, "sales_order", with_cost=True)
+
+    @staticmethod
+    def recalculate_purchase_orders(queryset=None) -> int:
+        """Recompute totals for a PurchaseOrder queryset in the database"""
+        if queryset is None:
+            queryset = PurchaseOrder.objects.all()
+        return OrderTotalsService._update_totals(
+            queryset, PurchaseOrderLineItem, "purchase_order", with_cost=False
+        )
+
+
+class OrderBuilder:
+    """
+    Batched write path for orders and their line items.
+
+    Lines are bulk-inserted, stock is adjusted with one UPDATE per product,
+    totals are computed in memory and the order row is written once. This
+    bypasses OrderLineItem.save()/PurchaseOrderLineItem.save(), which
+    recompute and re-save the parent order for every line.
+    """
+
+    SALES_TOTAL_FIELDS = ["subtotal", "vat_total", "grand_total", "profit"]
+    PURCHASE_TOTAL_FIELDS = ["subtotal", "vat_total", "grand_total"]
+
+    @staticmethod
+    def _load_products(product_ids) -> Dict:
+        products = Product.objects.select_related("vat_category").in_bulk(set(product_ids))
+        missing = set(product_ids) - set(products)
+        if missing:
+            raise Product.DoesNotExist(f"Products not found: {', '.join(str(pk) for pk in missing)}")
+        return products
+
+    @staticmethod
+    def _apply_stock(stock_delta: Dict) -> None:
+        """Apply per-product stock deltas with one UPDATE statement each"""
+        for product_id, delta in stock_delta.items():
+            if delta:
+                Product.objects.filter(pk=product_id).update(stock=F("stock") + delta)
+
+    @staticmethod
+    def _sales_totals(order: SalesOrder, lines: List[OrderLineItem], products: Dict) -> None:
+        totals = OrderTotalsService.summarize(
+            (
+                (
+                    line.line_total,
+                    products[line.product_id].vat_category.rate,
+                    products[line.product_id].unit_cost,
+                    line.quantity,
+                )
+                for line in lines
+            ),
+            order.prices_include_vat,
+        )
+        for field in OrderBuilder.SALES_TOTAL_FIELDS:
+            setattr(order, field, totals[field])
+
+    @staticmethod
+    def _build_sales_line(order: SalesOrder, item: Dict, line: Optional[OrderLineItem] = None) -> OrderLineItem:
+        if line is None:
+            line = OrderLineItem(sales_order=order, product_id=item["product_id"])
+        for attr, value in item.items():
+            setattr(line, attr, value)
+        line.line_total = OrderTotalsService.line_total(line.unit_price, line.quantity, line.discount)
+        return line
+
+    @staticmethod
+    def create_sales_order(validated_data: Dict, line_data: List[Dict]) -> SalesOrder:
+        """Create a sales order and all of its lines with a single order write"""
+        with transaction.atomic():
+            products = OrderBuilder._load_products([item["product_id"] for item in line_data])
+            order = SalesOrder(**validated_data)
+            lines = [OrderBuilder._build_sales_line(order, item) for item in line_data]
+            OrderBuilder._sales_totals(order, lines, products)
+            order.save()
+            OrderLineItem.objects.bulk_create(lines)
+
+            stock_delta = defaultdict(int)
+            for line in lines:
+                stock_delta[line.product_id] -= line.quantity
+            OrderBuilder._apply_stock(stock_delta)
+        return order
+
+    @staticmethod
+    def update_sales_order(order: SalesOrder, validated_data: Dict, line_data: Optional[List[Dict]] = None) -> SalesOrder:
+        """
+        Update a sales order and reconcile its lines by product.
+
+        Lines matching an existing product are updated, new products are
+        inserted and lines missing from line_data are deleted. Stock moves by
+        the net quantity change per product. When line_data is None the
+        existing lines are left untouched and only the totals are refreshed.
+        """
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(order, attr, value)
+
+            if line_data is None:
+                order.calculate_totals()
+                order.save()
+                return order
+
+            existing = {line.product_id: line for line in order.line_items.all()}
+            products = OrderBuilder._load_products(
+                list(existing) + [item["product_id"] for item in line_data]
+            )
+            stock_delta = defaultdict(int)
+            to_create, to_update = [], []
+            now = timezone.now()
+            for item in line_data:
+                line = existing.pop(item["product_id"], None)
+                if line is None:
+                    line = OrderBuilder._build_sales_line(order, item)
+                    to_create.append(line)
+                else:
+                    # give back what the old line took before applying the new quantity
+                    stock_delta[line.product_id] += line.quantity
+                    line = OrderBuilder._build_sales_line(order, item, line)
+                    line.updated_at = now
+                    to_update.append(line)
+                stock_delta[line.product_id] -= line.quantity
+
+            for line in existing.values():
+                stock_delta[line.product_id] += line.quantity
+            if existing:
+                OrderLineItem.objects.filter(pk__in=[line.pk for line in existing.values()]).delete()
+
+            OrderBuilder._sales_totals(order, to_create + to_update, products)
+            order.save()
+            OrderLineItem.objects.bulk_create(to_create)
+            OrderLineItem.objects.bulk_update(
+                to_update, ["quantity", "unit_price", "discount", "line_total", "updated_at"]
+            )
+            OrderBuilder._apply_stock(stock_delta)
+        return order
+
+    @staticmethod
+    def create_purchase_order(validated_data: Dict, line_data: List[Dict]) -> PurchaseOrder:
+        """Create a purchase order and all of its lines with a single order write"""
+        with transaction.atomic():
+            products = OrderBuilder._load_products([item["product_id"] for item in line_data])
+            po = PurchaseOrder(**validated_data)
+            lines = []
+            stock_delta = defaultdict(int)
+            for item in line_data:
+                line = PurchaseOrderLineItem(purchase_order=po, **item)
+                line.line_total = OrderTotalsService.line_total(line.unit_cost, line.quantity, line.discount)
+                lines.append(line)
+                stock_delta[line.product_id] += line.quantity
+
+            totals = OrderTotalsService.summarize(
+                (
+                    (line.line_total, products[line.product_id].vat_category.rate, 0, 0)
+                    for line in lines
+                ),
+                po.prices_include_vat,
+            )
+            for field in OrderBuilder.PURCHASE_TOTAL_FIELDS:
+                setattr(po, field, totals[field])
+            po.save()
+            PurchaseOrderLineItem.objects.bulk_create(lines)
+            OrderBuilder._apply_stock(stock_delta)
+        return po
+
+
+class PaymentService:
+    """Batched payment posting"""
+
+    @staticmethod
+    def post_payments(company, entries: List[Dict]) -> List[Payment]:
+        """
+        Insert many payments with one bulk INSERT, then bring each affected
+        invoice's credit and payment status up to date exactly once.
+
+        The per-payment post_save receivers are bypassed; instead credit
+        payed_amount is recomputed from the summed payments of each invoice,
+        and saving the invoice's paid_amount posts the balance change to the
+        ledger.
+
+        Args:
+            company: Company the payments belong to
+            entries: dicts with 'invoice' (Invoice), 'amount' and 'mode'
+
+        Returns: the created Payment instances
+        """
+        with transaction.atomic():
+            payments = Payment.objects.bulk_create(
+                [Payment(company=company, **entry) for entry in entries]
+            )
+            invoice_ids = {payment.invoice_id for payment in payments}
+            totals = dict(
+                Payment.objects.filter(invoice_id__in=invoice_ids)
+                .order_by()
+                .values("invoice_id")
+                .annotate(total=Sum("amount"))
+                .values_list("invoice_id", "total")
+            )
+            invoices = (
+                Invoice.objects.select_for_update(of=("self",))
+                .select_related("credits", "sales_order__customer")
+                .filter(pk__in=invoice_ids)
+            )
+            for invoice in invoices:
+                total_paid = totals.get(invoice.pk) or Decimal("0.00")
+                try:
+                    credit = invoice.credits
+                except Credit.DoesNotExist:
+                    # Same fallback as the single-payment signal
+                    credit = Credit.objects.create(
+                        invoice=invoice,
+                        amount=invoice.amount_due,
+                        expired_at=timezone.now()
+                        + timedelta(days=invoice.sales_order.customer.credit_expire_days),
+                        payed_amount=total_paid,
+                    )
+                else:
+                    credit.payed_amount = total_paid
+                    credit.save(update_fields=["payed_amount"])
+                invoice.apply_payment_totals(credit, total_paid)
+                invoice.save(update_fields=["paid_amount", "status"])
+
+            create_audit_logs_bulk(
+                model="Payment",
+                action="create",
+                by=get_current_user(),
+                entries=[(str(payment.id), None, get_model_data(payment)) for payment in payments],
+                company=company,
+            )
+        return payments
+
+
+class RouteTrackingService:
+    """Batched GPS ping ingestion"""
+
+    @staticmethod
+    def record_pings(route, company, points: List[Dict]) -> List[RouteLocationPing]:
+        """
+        Insert a route's buffered GPS pings with one bulk INSERT.
+
+        Pings are not audited, so no audit context is needed. created_at is
+        stamped per row in list order, so a track keeps the order it was
+        recorded in.
+
+        Args:
+            route: Route the pings belong to (already permission checked)
+            company: Company the pings belong to
+            points: dicts with lat, lon and optionally visit_id,
+                accuracy_meters, speed_mps and heading_degrees
+
+        Returns: the created RouteLocationPing instances
+        """
+        with transaction.atomic():
+            return RouteLocationPing.objects.bulk_create(
+                [RouteLocationPing(route=route, company=company, **point) for point in points],
+                batch_size=500,
+            )
+
+
+class ReportingRollupService:
+    """
+    Maintains DailyReportRollup / DailyVatRollup.
+
+    Writes mark (company, day) pairs dirty; the marked days are recomputed from
+    the source rows when the surrounding transaction commits, so a request that
+    touches an order many times refreshes each day once. The flush then bumps
+    the company's ReportDataVersion, which invalidates cached report results;
+    writes that only affect other reports call mark_dirty() without days.
+
+    Each refresh holds the company's ReportDataVersion row lock while it reads
+    the source rows and upserts the rollups, so two concurrent flushes for the
+    same company run one after the other and the later one always reads what
+    the earlier one saw (or newer).
+    """
+
+    _pending = threading.local()
+
+    @staticmethod
+    def mark_dirty(company_id, order_days=(), vat_days=(), sales_order_ids=(),
+                   product_ids=(), vat_category_ids=()) -> None:
+        """
+        Schedule a refresh of the given days after commit.
+
+        Args:
+            company_id: Company the rows belong to
+            order_days: order_date values whose sales/purchase totals changed
+            vat_days: invoice issue_date values whose VAT lines changed
+            sales_order_ids: orders whose invoice day (looked up at flush) changed
+            product_ids: products whose VAT category changed; every invoice day
+                with a line of theirs is looked up at flush
+            vat_category_ids: VAT categories whose rate or name changed; looked
+                up the same way through their products
+        """
+        if company_id is None:
+            return
+        pending = getattr(ReportingRollupService._pending, "dirty", None)
+        if pending is None:
+            pending = ReportingRollupService._pending.dirty = defaultdict(
+                lambda: {
+                    "order_days": set(), "vat_days": set(), "sales_order_ids": set(),
+                    "product_ids": set(), "vat_category_ids": set(),
+                }
+            )
+        entry = pending[company_id]
+        entry["order_days"].update(day for day in order_days if day)
+        entry["vat_days"].update(day for day in vat_days if day)
+        entry["sales_order_ids"].update(pk for pk in sales_order_ids if pk)
+        entry["product_ids"].update(pk for pk in product_ids if pk)
+        entry["vat_category_ids"].update(pk for pk in vat_category_ids if pk)
+        # Every mark registers a flush; the first one to run drains the whole set
+        transaction.on_commit(ReportingRollupService.flush)
+
+    @staticmethod
+    def flush() -> None:
+        """Refresh every day marked dirty on this thread"""
+        pending = getattr(ReportingRollupService._pending, "dirty", None) or {}
+        ReportingRollupService._pending.dirty = None
+        # Marks made in a transaction that rolled back are still pending here.
+        # Refreshing their days again is harmless, but the company may be gone.
+        existing = set(Company.objects.filter(pk__in=list(pending)).values_list("pk", flat=True))
+        for company_id, entry in pending.items():
+            if company_id not in existing:
+                continue
+            vat_days = set(entry["vat_days"])
+            if entry["sales_order_ids"]:
+                vat_days.update(
+                    Invoice.objects.filter(sales_order_id__in=entry["sales_order_ids"])
+                    .values_list("issue_date", flat=True)
+                )
+            if entry["product_ids"] or entry["vat_category_ids"]:
+                vat_days.update(
+                    Invoice.objects.filter(company_id=company_id)
+                    .filter(
+                        Q(sales_order__line_items__product_id__in=entry["product_ids"])
+                        | Q(sales_order__line_items__product__vat_category_id__in=entry["vat_category_ids"])
+                    )
+                    .order_by()
+                    .values_list("issue_date", flat=True)
+                    .distinct()
+                )
+            try:
+                ReportingRollupService.refresh_order_days(company_id, entry["order_days"])
+                ReportingRollupService.refresh_vat_days(company_id, vat_days)
+            except Exception:
+                # Reports must not break writes; rebuild_reporting_rollups repairs drift
+                logger.exception(f"Failed to refresh reporting rollups for company {company_id}")
+            # After the rollups, so a report cached under the new version is already current
+            ReportDataVersion.bump(company_id)
+
+    @staticmethod
+    def _lock_company(company_id) -> None:
+        """
+        Row-lock the company's ReportDataVersion until the surrounding
+        transaction ends; it serializes rollup refreshes of one company.
+        """
+        ReportDataVersion.objects.select_for_update().get_or_create(company_id=company_id)
+
+    @staticmethod
+    def refresh_order_days(company_id, days) -> None:
+        """Recompute the sales and purchase totals of the given days with two grouped queries"""
+        days = set(days)
+        if not days:
+            return
+        with transaction.atomic():
+            ReportingRollupService._lock_company(company_id)
+            ReportingRollupService._write_order_days(company_id, days)
+
+    @staticmethod
+    def _write_order_days(company_id, days) -> None:
+        sales = {
+            row.pop("order_date"): row
+            for row in SalesOrder.objects.filter(company_id=company_id, order_date__in=days)
+            .order_by()
+            .values("order_date")
+            .annotate(
+                sales_gross=Sum("grand_total"),
+                sales_net=Sum("subtotal"),
+                sales_vat=Sum("vat_total"),
+                sales_profit=Sum("profit"),
+                sales_count=Count("id"),
+            )
+        }
+        purchases = {
+            row.pop("order_date"): row
+            for row in PurchaseOrder.objects.filter(company_id=company_id, order_date__in=days)
+            .order_by()
+            .values("order_date")
+            .annotate(
+                purchase_gross=Sum("grand_total"),
+                purchase_net=Sum("subtotal"),
+                purchase_vat=Sum("vat_total"),
+                purchase_count=Count("id"),
+            )
+        }
+        rows = [
+            DailyReportRollup(company_id=company_id, day=day, **sales.get(day, {}), **purchases.get(day, {}))
+            for day in sales.keys() | purchases.keys()
+        ]
+        DailyReportRollup.objects.filter(company_id=company_id, day__in=days - {row.day for row in rows}).delete()
+        DailyReportRollup.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["company", "day"],
+            update_fields=[
+                "sales_gross", "sales_net", "sales_vat", "sales_profit", "sales_count",
+                "purchase_gross", "purchase_net", "purchase_vat", "purchase_count", "updated_at",
+            ],
+        )
+
+    @staticmethod
+    def refresh_vat_days(company_id, days) -> None:
+        """Recompute net sales and VAT per category for the given invoice days with one grouped query"""
+        days = set(days)
+        if not days:
+            return
+        with transaction.atomic():
+            ReportingRollupService._lock_company(company_id)
+            ReportingRollupService._write_vat_days(company_id, days)
+
+    @staticmethod
+    def _write_vat_days(company_id, days) -> None:
+        expressions = OrderTotalsService.line_expressions("sales_order", with_cost=False)
+        rows = [
+            DailyVatRollup(
+                company_id=company_id,
+                day=row["day"],
+                category=row["category"] or "uncategorized",
+                net_amount=to_decimal(row["net_amount"]),
+                vat_amount=to_decimal(row["vat_amount"]),
+            )
+            for row in OrderLineItem.objects.filter(
+                sales_order__company_id=company_id, sales_order__invoice__issue_date__in=days
+            )
+            .order_by()
+            .values(day=F("sales_order__invoice__issue_date"), category=F("product__vat_category__category"))
+            .annotate(net_amount=Sum(expressions["net"]), vat_amount=Sum(expressions["vat"]))
+        ]
+        # Products without a category and an explicit "uncategorized" one land in the same row
+        merged = {}
+        for row in rows:
+            key = (row.day, row.category)
+            if key in merged:
+                merged[key].net_amount += row.net_amount
+                merged[key].vat_amount += row.vat_amount
+            else:
+                merged[key] = row
+        # Cached totals of closed periods that contain one of these days are out of date
+        ClosedVatReport.objects.filter(
+            Q(company_id=company_id),
+            reduce(operator.or_, (Q(period_start__lte=day, period_end__gte=day) for day in days)),
+        ).delete()
+        stale = DailyVatRollup.objects.filter(company_id=company_id, day__in=days)
+        for day, category in merged:
+            stale = stale.exclude(day=day, category=category)
+        stale.delete()
+        DailyVatRollup.objects.bulk_create(
+            merged.values(),
+            update_conflicts=True,
+            unique_fields=["company", "day", "category"],
+            update_fields=["net_amount", "vat_amount", "updated_at"],
+        )
+
+    @staticmethod
+    def rebuild(company_id=None, start=None, end=None, chunk_days: int = 31) -> int:
+        """
+        Recompute rollups from scratch for a date range, chunk_days at a time.
+
+        Args:
+            company_id: Only this company (all companies when None)
+            start, end: Inclusive date bounds (unbounded when None)
+            chunk_days: Days refreshed per round of grouped queries
+
+        Returns: number of days refreshed
+        """
+        def in_range(queryset, field):
+            if start:
+                queryset = queryset.filter(**{f"{field}__gte": start})
+            if end:
+                queryset = queryset.filter(**{f"{field}__lte": end})
+            return set(queryset.order_by().values_list(field, flat=True).distinct())
+
+        companies = Company.objects.all()
+        if company_id is not None:
+            companies = companies.filter(pk=company_id)
+        refreshed = 0
+        for company_pk in companies.values_list("pk", flat=True):
+            order_days = (
+                in_range(SalesOrder.objects.filter(company_id=company_pk), "order_date")
+                | in_range(PurchaseOrder.objects.filter(company_id=company_pk), "order_date")
+                | in_range(DailyReportRollup.objects.filter(company_id=company_pk), "day")
+            )
+            vat_days = (
+                in_range(Invoice.objects.filter(company_id=company_pk), "issue_date")
+                | in_range(DailyVatRollup.objects.filter(company_id=company_pk), "day")
+            )
+            for days, refresh in (
+                (sorted(order_days), ReportingRollupService.refresh_order_days),
+                (sorted(vat_days), ReportingRollupService.refresh_vat_days),
+            ):
+                for index in range(0, len(days), chunk_days):
+                    refresh(company_pk, days[index:index + chunk_days])
+            refreshed += len(order_days | vat_days)
+        return refreshed
+
+    @staticmethod
+    def _day_range(queryset, start=None, end=None):
+        if start:
+            queryset = queryset.filter(day__gte=start)
+        if end:
+            queryset = queryset.filter(day__lte=end)
+        return queryset
+
+    @staticmethod
+    def sales_totals(company, start=None, end=None) -> Dict:
+        """total_sales / total_profit / order_count over the pre-aggregated days"""
+        return ReportingRollupService._day_range(
+            DailyReportRollup.objects.filter(company=company, sales_count__gt=0), start, end
+        ).aggregate(
+            total_sales=Sum("sales_gross"),
+            total_profit=Sum("sales_profit"),
+            order_count=Coalesce(Sum("sales_count"), 0),
+        )
+
+    @staticmethod
+    def purchase_totals(company, start=None, end=None) -> Dict:
+        """total_purchases / order_count over the pre-aggregated days"""
+        return ReportingRollupService._day_range(
+            DailyReportRollup.objects.filter(company=company, purchase_count__gt=0), start, end
+        ).aggregate(
+            total_purchases=Sum("purchase_gross"),
+            order_count=Coalesce(Sum("purchase_count"), 0),
+        )
+
+    @staticmethod
+    def closed_vat_totals(company, start, end) -> Dict[str, Dict[str, Decimal]]:
+        """
+        vat_totals() for a period that ended before today, stored in ClosedVatReport.
+
+        A stored period is only dropped when a VAT day inside it is recomputed,
+        so unrelated writes don't cost a recompute. A miss is computed under
+        the company's rollup lock, so a refresh committing meanwhile cannot
+        leave outdated totals behind. Open periods are always read fresh.
+        """
+        if end >= timezone.localdate():
+            return ReportingRollupService.vat_totals(company, start, end)
+        stored = (
+            ClosedVatReport.objects.filter(company=company, period_start=start, period_end=end)
+            .values_list("totals", flat=True)
+            .first()
+        )
+        if stored is not None:
+            return {
+                category: {"sales": Decimal(values["sales"]), "vat": Decimal(values["vat"])}
+                for category, values in stored.items()
+            }
+        with transaction.atomic():
+            ReportingRollupService._lock_company(company.pk)
+            totals = ReportingRollupService.vat_totals(company, start, end)
+            ClosedVatReport.objects.update_or_create(
+                company=company,
+                period_start=start,
+                period_end=end,
+                defaults={"totals": {
+                    category: {"sales": str(values["sales"]), "vat": str(values["vat"])}
+                    for category, values in totals.items()
+                }},
+            )
+        return totals
+
+    @staticmethod
+    def vat_totals(company, start, end) -> Dict[str, Dict[str, Decimal]]:
+        """{category: {'sales': net, 'vat': vat}} over the pre-aggregated invoice days"""
+        rows = (
+            ReportingRollupService._day_range(DailyVatRollup.objects.filter(company=company), start, end)
+            .order_by("category")
+            .values("category")
+            .annotate(sales=Sum("net_amount"), vat=Sum("vat_amount"))
+        )
+        return {
+            row["category"]: {"sales": to_decimal(row["sales"]), "vat": to_decimal(row["vat"])}
+            for row in rows
+        }
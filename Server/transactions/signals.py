@@ -1,6 +1,10 @@
-from django.db.models.signals import post_save, post_delete
+from decimal import Decimal
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import Payment, Invoice
+from main.models import Credit, Customer, Product, VATSettings
+from main.services import CustomerLedgerService
+from .models import Payment, Invoice, PurchaseOrder, Route, RouteVisit, SalesOrder
+from .services import ReportingRollupService
 
 @receiver(post_save, sender=Payment)
 def update_invoice_on_payment_save(sender, instance, created, **kwargs):
@@ -30,3 +34,217 @@ def update_invoice_on_payment_delete(sender, instance, **kwargs):
         print(f"Signal: Updated invoice {invoice.invoice_no} after payment deletion")
     except Exception as e:
         print(f"Error updating invoice after payment delete: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Customer balance ledger: each write posts only the difference it made
+# ---------------------------------------------------------------------------
+
+
+def _invoice_customer_id(instance, invoice_id):
+    """Customer behind invoice_id, read from the instance's cached invoice when it is that invoice"""
+    if invoice_id is None:
+        return None
+    invoice = instance._state.fields_cache.get("invoice")
+    if invoice is not None and invoice.pk == invoice_id and "sales_order" in invoice._state.fields_cache:
+        return invoice.sales_order.customer_id
+    return (
+        Invoice.objects.filter(pk=invoice_id)
+        .values_list("sales_order__customer_id", flat=True)
+        .first()
+    )
+
+
+def _previous_values(instance):
+    """Field values as loaded or last saved, keyed by attname ({} for new rows)"""
+    return getattr(instance, "_loaded_values", None) or {}
+
+
+def _post_ledger_change(entry_type, reference, old, new):
+    """Post the difference between two (customer_id, balance, exposure) contributions"""
+    if old and new and old[0] == new[0]:
+        CustomerLedgerService.post(
+            new[0], entry_type, new[1] - old[1], new[2] - old[2], reference
+        )
+        return
+    if old:
+        CustomerLedgerService.post(old[0], entry_type, -old[1], -old[2], reference)
+    if new:
+        CustomerLedgerService.post(new[0], entry_type, new[1], new[2], reference)
+
+
+def _invoice_contribution(values, customer_id):
+    balance = CustomerLedgerService.invoice_balance(
+        values.get("status"), values.get("amount_due"), values.get("paid_amount")
+    )
+    return (customer_id, balance, Decimal("0.00"))
+
+
+def _credit_contribution(values, customer_id):
+    exposure = CustomerLedgerService.credit_exposure(values.get("amount"), values.get("payed_amount"))
+    return (customer_id, Decimal("0.00"), exposure)
+
+
+def _current_values(instance, update_fields=None):
+    """Field values stored after the current save: fields left out of update_fields keep their previous value"""
+    values = {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+    if update_fields is None:
+        return values
+    written = {instance._meta.get_field(name).attname for name in update_fields}
+    return {**values, **{key: value for key, value in _previous_values(instance).items() if key not in written}}
+
+
+@receiver(pre_save, sender=Invoice)
+@receiver(pre_save, sender=Credit)
+@receiver(pre_save, sender=SalesOrder)
+@receiver(pre_save, sender=PurchaseOrder)
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=VATSettings)
+def load_missing_state(sender, instance, **kwargs):
+    """
+    The ledger and rollup receivers diff against the loaded state
+    (LoadedStateMixin); only instances built by hand with an existing pk
+    need a query here.
+    """
+    if instance._state.adding or getattr(instance, "_loaded_values", None) is not None:
+        return
+    instance._loaded_values = sender.objects.filter(pk=instance.pk).values().first()
+
+
+# Invoice fields the balance is computed from
+LEDGER_INVOICE_FIELDS = ("amount_due", "paid_amount", "status")
+
+
+@receiver(post_save, sender=Invoice)
+def post_invoice_to_ledger(sender, instance, created, **kwargs):
+    previous = _previous_values(instance)
+    current = _current_values(instance, kwargs.get("update_fields"))
+    changed = {attname for attname in LEDGER_INVOICE_FIELDS if previous.get(attname) != current[attname]}
+    if not created and not changed:
+        return
+    # A payment only moves paid_amount (and the status along with it)
+    entry_type = "invoice" if created or "amount_due" in changed or "paid_amount" not in changed else "payment"
+    customer_id = instance.sales_order.customer_id
+    old = None if created else _invoice_contribution(previous, customer_id)
+    _post_ledger_change(entry_type, instance.invoice_no, old, _invoice_contribution(current, customer_id))
+
+
+@receiver(post_save, sender=Credit)
+def post_credit_to_ledger(sender, instance, created, **kwargs):
+    previous = _previous_values(instance)
+    current = _current_values(instance, kwargs.get("update_fields"))
+    if not created and all(
+        previous.get(attname) == current[attname] for attname in ("amount", "payed_amount", "invoice_id")
+    ):
+        return
+    customer_id = _invoice_customer_id(instance, current["invoice_id"])
+    old = None
+    if not created:
+        old_customer_id = (
+            customer_id if previous.get("invoice_id") == current["invoice_id"]
+            else _invoice_customer_id(instance, previous.get("invoice_id"))
+        )
+        old = _credit_contribution(previous, old_customer_id)
+    _post_ledger_change("credit", instance.invoice_id, old, _credit_contribution(current, customer_id))
+
+
+def _deleted_with_customer(origin):
+    """Deleting the customer (instance or queryset) removes its ledger too"""
+    return isinstance(origin, Customer) or getattr(origin, "model", None) is Customer
+
+
+@receiver(pre_delete, sender=Invoice)
+@receiver(pre_delete, sender=Credit)
+def load_ledger_contribution(sender, instance, **kwargs):
+    """
+    Read what the stored row contributes to its customer's ledger. Deletes
+    often go through a copy whose paid amounts were updated elsewhere, so
+    the in-memory values are not used; the one query also finds the customer.
+    """
+    if _deleted_with_customer(kwargs.get("origin")):
+        return
+    if sender is Invoice:
+        row = (
+            Invoice.objects.filter(pk=instance.pk)
+            .values("status", "amount_due", "paid_amount", "sales_order__customer_id")
+            .first()
+        )
+        instance._ledger_contribution = row and _invoice_contribution(row, row["sales_order__customer_id"])
+    else:
+        row = (
+            Credit.objects.filter(pk=instance.pk)
+            .values("amount", "payed_amount", "invoice__sales_order__customer_id")
+            .first()
+        )
+        instance._ledger_contribution = row and _credit_contribution(row, row["invoice__sales_order__customer_id"])
+
+
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=Credit)
+def remove_from_ledger(sender, instance, **kwargs):
+    if _deleted_with_customer(kwargs.get("origin")):
+        return
+    if sender is Invoice:
+        entry_type, reference = "invoice", instance.invoice_no
+    else:
+        entry_type, reference = "credit", instance.invoice_id
+    _post_ledger_change(entry_type, reference, getattr(instance, "_ledger_contribution", None), None)
+
+
+# ---------------------------------------------------------------------------
+# Daily reporting rollups: mark the affected days, refreshed on commit
+# ---------------------------------------------------------------------------
+
+def _changed_days(instance, field):
+    """The field's current value and, if it moved, the value it was loaded with"""
+    return {getattr(instance, field), _previous_values(instance).get(field)}
+
+
+@receiver(post_save, sender=SalesOrder)
+@receiver(post_delete, sender=SalesOrder)
+def mark_sales_order_rollups(sender, instance, **kwargs):
+    ReportingRollupService.mark_dirty(
+        instance.company_id,
+        order_days=_changed_days(instance, "order_date"),
+        sales_order_ids=[] if kwargs.get("signal") is post_delete else [instance.pk],
+    )
+
+
+@receiver(post_save, sender=PurchaseOrder)
+@receiver(post_delete, sender=PurchaseOrder)
+def mark_purchase_order_rollups(sender, instance, **kwargs):
+    ReportingRollupService.mark_dirty(instance.company_id, order_days=_changed_days(instance, "order_date"))
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def mark_invoice_rollups(sender, instance, **kwargs):
+    ReportingRollupService.mark_dirty(instance.company_id, vat_days=_changed_days(instance, "issue_date"))
+
+
+# Fields the VAT rollup reads live from products and VAT categories
+VAT_ROLLUP_FIELDS = {Product: ("vat_category_id",), VATSettings: ("category", "rate")}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=VATSettings)
+def mark_vat_rollups(sender, instance, **kwargs):
+    """Invoice days with lines of a recategorized product or a changed rate need recomputing"""
+    previous = _previous_values(instance)
+    if not previous or all(previous.get(field) == getattr(instance, field) for field in VAT_ROLLUP_FIELDS[sender]):
+        return
+    if sender is Product:
+        ReportingRollupService.mark_dirty(instance.company_id, product_ids=[instance.pk])
+    else:
+        ReportingRollupService.mark_dirty(instance.company_id, vat_category_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+@receiver(post_save, sender=RouteVisit)
+@receiver(post_delete, sender=RouteVisit)
+def mark_report_data_changed(sender, instance, **kwargs):
+    """No rollup rows depend on these, but cached report results may"""
+    ReportingRollupService.mark_dirty(instance.company_id)
@@ -1,3 +1,665 @@
-from django.test import TestCase
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from statistics import median
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from accounts.models import Company, User
+from main.models import Customer, Product, Supplier, VATSettings
+from main.services import CustomerLedgerService
+from .ping_buffer import PingBuffer
+from .report_cache import ReportCache, report_cache
+from .serializers import CustomerSerializer
+from .services import OrderTotalsService, ReportingRollupService
+from .models import (
+    ClosedVatReport, DailyReportRollup, DailyVatRollup, DocumentSequence, Invoice, OrderLineItem, Payment, PurchaseOrder,
+    PurchaseOrderLineItem, Route, RouteLocationPing, RouteVisit, SalesOrder,
+)
+
+
+class DocumentSequenceTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        self.other_company = Company.objects.create(name="Globex")
+        self.day = date(2025, 1, 15)
+
+    def test_numbers_are_sequential_per_company_and_type(self):
+        numbers = [
+            DocumentSequence.next_number(self.company.id, DocumentSequence.SALES_ORDER, self.day)
+            for _ in range(3)
+        ]
+        self.assertEqual(numbers, ["SO-20250115-001", "SO-20250115-002", "SO-20250115-003"])
+        self.assertEqual(
+            DocumentSequence.next_number(self.other_company.id, DocumentSequence.SALES_ORDER, self.day),
+            "SO-20250115-001",
+        )
+        self.assertEqual(
+            DocumentSequence.next_number(self.company.id, DocumentSequence.INVOICE, self.day),
+            "INV-20250115-001",
+        )
+
+    def test_new_counter_continues_after_existing_numbers(self):
+        customer = Customer.objects.create(name="C", email="c@example.com", company=self.company)
+        SalesOrder.objects.create(
+            order_number="SO-20250115-007", customer=customer, company=self.company, order_date=self.day
+        )
+        self.assertEqual(
+            DocumentSequence.next_number(self.company.id, DocumentSequence.SALES_ORDER, self.day),
+            "SO-20250115-008",
+        )
+
+    def test_duplicate_invoice_number_is_renumbered(self):
+        customer = Customer.objects.create(name="C", email="c@example.com", company=self.company)
+        invoices = [
+            Invoice.objects.create(
+                sales_order=SalesOrder.objects.create(customer=customer, company=self.company, order_date=self.day),
+                invoice_no="INV-MANUAL-1", issue_date=self.day, due_date=self.day, amount_due=1, company=self.company,
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(invoices[0].invoice_no, "INV-MANUAL-1")
+        self.assertNotEqual(invoices[1].invoice_no, "INV-MANUAL-1")
+        invoices[0].save()
+        self.assertEqual(invoices[0].invoice_no, "INV-MANUAL-1")
+
+    def test_allocation_cost_does_not_grow_with_volume(self):
+        DocumentSequence.next_number(self.company.id, DocumentSequence.ROUTE, self.day)
+        with CaptureQueriesContext(connection) as early:
+            DocumentSequence.next_number(self.company.id, DocumentSequence.ROUTE, self.day)
+        for _ in range(50):
+            DocumentSequence.next_number(self.company.id, DocumentSequence.ROUTE, self.day)
+        with CaptureQueriesContext(connection) as late:
+            number = DocumentSequence.next_number(self.company.id, DocumentSequence.ROUTE, self.day)
+        self.assertEqual(number, "RT-20250115-053")
+        self.assertEqual(len(early.captured_queries), len(late.captured_queries))
+
+
+class DocumentSequenceLoadTests(TransactionTestCase):
+    """Parallel creation needs row locks, so this only runs on backends with SELECT ... FOR UPDATE."""
+
+    THREADS = 8
+    ORDERS_PER_THREAD = 25
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_parallel_sales_orders_get_unique_numbers_at_flat_latency(self):
+        company = Company.objects.create(name="Acme")
+        customer = Customer.objects.create(name="C", email="c@example.com", company=company)
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(self.ORDERS_PER_THREAD):
+                    started = time.perf_counter()
+                    SalesOrder.objects.create(customer=customer, company=company, order_date=date.today())
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+            except Exception as exc:  # surfaced in the main thread below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        numbers = list(SalesOrder.objects.filter(company=company).values_list("order_number", flat=True))
+        total = self.THREADS * self.ORDERS_PER_THREAD
+        self.assertEqual(len(numbers), total)
+        self.assertEqual(len(set(numbers)), total)
+
+        # Creation time must not grow with the number of orders already issued today
+        quarter = total // 4
+        self.assertLess(median(latencies[-quarter:]), median(latencies[:quarter]) * 3 + 0.01)
+
+
+class OrderTotalsTests(TestCase):
+    """The set-based UPDATE must round to the same cent as the Python summarize()."""
+
+    RATES = ["0", "5", "15", "5"]
+    LINES = [
+        # (unit price, quantity, discount %), one product per line at RATES[i]
+        ("19.99", 3, "12.50"),
+        ("3.33", 7, "0"),
+        # Whole line total: SQLite stores it as INTEGER, so it catches integer division
+        ("10.00", 2, "0"),
+        ("7.77", 11, "7.25"),
+    ]
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        self.products = []
+        for i, rate in enumerate(self.RATES):
+            vat = VATSettings.objects.create(category=f"R{i}", rate=Decimal(rate), company=self.company)
+            self.products.append(Product.objects.create(
+                code=f"P{i}", name=f"Product {i}", unit_price=10, unit_cost=Decimal("1.37") * (i + 1),
+                vat_category=vat, company=self.company,
+            ))
+        self.customer = Customer.objects.create(name="C", email="c@example.com", company=self.company)
+        self.supplier = Supplier.objects.create(name="S", email="s@example.com", company=self.company)
+
+    def expected(self, order, with_cost):
+        lines = order.line_items.select_related("product__vat_category")
+        return OrderTotalsService.summarize(
+            (
+                (l.line_total, l.product.vat_category.rate, l.product.unit_cost if with_cost else 0,
+                 l.quantity if with_cost else 0)
+                for l in lines
+            ),
+            order.prices_include_vat,
+        )
+
+    def assert_order_totals_match(self, order, order_field, with_cost):
+        """Per-order aggregate, with the saved and with a flipped, unsaved prices_include_vat flag"""
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                totals = OrderTotalsService.order_totals(order, order_field, with_cost)
+            expected = self.expected(order, with_cost)
+            self.assertEqual(totals, {field: expected[field] for field in totals})
+            order.prices_include_vat = not order.prices_include_vat
+
+    def test_sales_order_totals_match_summarize(self):
+        orders = []
+        for inclusive in (False, True):
+            order = SalesOrder.objects.create(
+                customer=self.customer, company=self.company, order_date=date.today(), prices_include_vat=inclusive
+            )
+            for product, (price, quantity, discount) in zip(self.products, self.LINES):
+                OrderLineItem.objects.create(
+                    sales_order=order, product=product, quantity=quantity,
+                    unit_price=Decimal(price), discount=Decimal(discount),
+                )
+            orders.append(order)
+        expected = {order.pk: self.expected(order, with_cost=True) for order in orders}
+        for order in orders:
+            self.assertEqual(order.grand_total, expected[order.pk]["grand_total"])
+            self.assert_order_totals_match(order, "sales_order", with_cost=True)
+
+        SalesOrder.objects.update(subtotal=0, vat_total=0, grand_total=0, profit=0)
+        OrderTotalsService.recalculate_sales_orders()
+
+        for order in SalesOrder.objects.all():
+            self.assertEqual(
+                {field: order.__dict__[field] for field in ("subtotal", "vat_total", "grand_total", "profit")},
+                expected[order.pk],
+            )
+
+    def test_purchase_order_totals_match_summarize(self):
+        orders = []
+        for inclusive in (False, True):
+            order = PurchaseOrder.objects.create(
+                supplier=self.supplier, company=self.company, order_date=date.today(), prices_include_vat=inclusive
+            )
+            for product, (cost, quantity, discount) in zip(self.products, self.LINES):
+                PurchaseOrderLineItem.objects.create(
+                    purchase_order=order, product=product, quantity=quantity,
+                    unit_cost=Decimal(cost), discount=Decimal(discount),
+                )
+            orders.append(order)
+        expected = {order.pk: self.expected(order, with_cost=False) for order in orders}
+        for order in orders:
+            self.assertEqual(order.grand_total, expected[order.pk]["grand_total"])
+            self.assert_order_totals_match(order, "purchase_order", with_cost=False)
+
+        PurchaseOrder.objects.update(subtotal=0, vat_total=0, grand_total=0)
+        OrderTotalsService.recalculate_purchase_orders()
+
+        for order in PurchaseOrder.objects.all():
+            self.assertEqual(
+                {field: order.__dict__[field] for field in ("subtotal", "vat_total", "grand_total")},
+                {field: expected[order.pk][field] for field in ("subtotal", "vat_total", "grand_total")},
+            )
+
+
+class ReportingRollupTests(TestCase):
+    """Daily rollups must equal a direct aggregate of the source rows after every write."""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        self.standard = VATSettings.objects.create(category="Standard", rate=5, company=self.company)
+        self.luxury = VATSettings.objects.create(category="Luxury", rate=15, company=self.company)
+        self.products = [
+            Product.objects.create(code=f"P{i}", name=f"Product {i}", unit_price=10, vat_category=vat, company=self.company)
+            for i, vat in enumerate((self.standard, self.luxury))
+        ]
+        self.customer = Customer.objects.create(name="C", email="c@example.com", company=self.company)
+        self.supplier = Supplier.objects.create(name="S", email="s@example.com", company=self.company)
+        self.day = date.today() - timedelta(days=10)
+
+    def write(self, action, *args, **kwargs):
+        """Run one write and its on-commit rollup refresh"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return action(*args, **kwargs)
+
+    def create_order(self, day, quantities):
+        order = self.write(SalesOrder.objects.create, customer=self.customer, company=self.company, order_date=day)
+        for product, quantity in zip(self.products, quantities):
+            self.write(OrderLineItem.objects.create, sales_order=order, product=product, quantity=quantity, unit_price=10)
+        return order
+
+    def assert_rollups_match(self):
+        expected_orders = defaultdict(dict)
+        for row in SalesOrder.objects.values("order_date").annotate(gross=Sum("grand_total"), count=Count("id")):
+            expected_orders[row["order_date"]].update(sales_gross=row["gross"], sales_count=row["count"])
+        for row in PurchaseOrder.objects.values("order_date").annotate(gross=Sum("grand_total"), count=Count("id")):
+            expected_orders[row["order_date"]].update(purchase_gross=row["gross"], purchase_count=row["count"])
+        stored_orders = {
+            row.day: {
+                key: value
+                for key, value in (
+                    ("sales_gross", row.sales_gross), ("sales_count", row.sales_count),
+                    ("purchase_gross", row.purchase_gross), ("purchase_count", row.purchase_count),
+                )
+                if (row.sales_count if key.startswith("sales") else row.purchase_count)
+            }
+            for row in DailyReportRollup.objects.filter(company=self.company)
+        }
+        self.assertEqual(stored_orders, dict(expected_orders))
+
+        expected_vat = defaultdict(lambda: [Decimal("0"), Decimal("0")])
+        for invoice in Invoice.objects.select_related("sales_order"):
+            for line in invoice.sales_order.line_items.select_related("product__vat_category"):
+                totals = expected_vat[(invoice.issue_date, line.product.vat_category.category)]
+                totals[0] += line.line_total
+                totals[1] += line.line_total * line.product.vat_category.rate / 100
+        stored_vat = {
+            (row.day, row.category): [row.net_amount, row.vat_amount]
+            for row in DailyVatRollup.objects.filter(company=self.company)
+        }
+        self.assertEqual(stored_vat, dict(expected_vat))
+
+    def test_rollups_follow_order_and_invoice_writes(self):
+        first = self.create_order(self.day, (2, 1))
+        second = self.create_order(self.day, (1, 3))
+        purchase = self.write(PurchaseOrder.objects.create, supplier=self.supplier, company=self.company, order_date=self.day)
+        self.write(PurchaseOrderLineItem.objects.create, purchase_order=purchase, product=self.products[0], quantity=4, unit_cost=3)
+        self.assert_rollups_match()
+
+        invoice = self.write(
+            Invoice.objects.create, sales_order=first, issue_date=self.day, due_date=self.day,
+            amount_due=SalesOrder.objects.get(pk=first.pk).grand_total, company=self.company,
+        )
+        self.write(
+            Invoice.objects.create, sales_order=second, issue_date=self.day, due_date=self.day,
+            amount_due=SalesOrder.objects.get(pk=second.pk).grand_total, company=self.company,
+        )
+        self.assert_rollups_match()
+
+        first.refresh_from_db()
+        first.order_date = self.day + timedelta(days=1)
+        self.write(first.save)
+        invoice.refresh_from_db()
+        invoice.issue_date = self.day + timedelta(days=2)
+        self.write(invoice.save)
+        line = OrderLineItem.objects.get(sales_order=second, product=self.products[1])
+        line.quantity = 5
+        self.write(line.save)
+        self.assert_rollups_match()
+
+        self.write(invoice.delete)
+        self.write(SalesOrder.objects.get(pk=second.pk).delete)
+        self.write(purchase.delete)
+        self.assert_rollups_match()
+
+    def test_vat_rollups_follow_product_and_rate_changes(self):
+        order = self.create_order(self.day, (2, 1))
+        self.write(
+            Invoice.objects.create, sales_order=order, issue_date=self.day, due_date=self.day,
+            amount_due=SalesOrder.objects.get(pk=order.pk).grand_total, company=self.company,
+        )
+
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.vat_category = self.luxury
+        self.write(product.save)
+        self.assert_rollups_match()
+
+        self.luxury.rate = Decimal("20.00")
+        self.write(self.luxury.save)
+        self.luxury.category = "Premium"
+        self.write(self.luxury.save)
+        self.assert_rollups_match()
+
+        # Stock updates save only the stock column and must not schedule a refresh
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.stock = 5
+            product.save(update_fields=["stock"])
+        self.assertEqual(callbacks, [])
+
+    def test_closed_vat_totals_are_dropped_only_by_writes_in_their_period(self):
+        order = self.create_order(self.day, (2, 1))
+        self.write(
+            Invoice.objects.create, sales_order=order, issue_date=self.day, due_date=self.day,
+            amount_due=SalesOrder.objects.get(pk=order.pk).grand_total, company=self.company,
+        )
+        period = (self.day - timedelta(days=1), self.day + timedelta(days=1))
+        totals = ReportingRollupService.closed_vat_totals(self.company, *period)
+        self.assertEqual(totals, ReportingRollupService.vat_totals(self.company, *period))
+        with self.assertNumQueries(1):
+            self.assertEqual(ReportingRollupService.closed_vat_totals(self.company, *period), totals)
+
+        # Open periods are never stored
+        ReportingRollupService.closed_vat_totals(self.company, self.day, date.today())
+        self.assertEqual(ClosedVatReport.objects.count(), 1)
+
+        later = self.create_order(self.day + timedelta(days=5), (1, 1))
+        self.write(
+            Invoice.objects.create, sales_order=later, issue_date=self.day + timedelta(days=5),
+            due_date=self.day, amount_due=SalesOrder.objects.get(pk=later.pk).grand_total, company=self.company,
+        )
+        self.assertTrue(ClosedVatReport.objects.filter(period_start=period[0], period_end=period[1]).exists())
+
+        line = OrderLineItem.objects.get(sales_order=order, product=self.products[0])
+        line.quantity = 4
+        self.write(line.save)
+        self.assertFalse(ClosedVatReport.objects.exists())
+        totals = ReportingRollupService.closed_vat_totals(self.company, *period)
+        self.assertEqual(totals["Standard"]["sales"], Decimal("40"))
+        self.assertEqual(totals, ReportingRollupService.vat_totals(self.company, *period))
+
+
+class ReportCacheTests(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ReportCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["evictions"], stats["hits"], stats["misses"]), (2, 1, 3, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = ReportCache(max_entries=2, ttl=10)
+        with mock.patch("transactions.report_cache.time.monotonic", return_value=100.0):
+            cache.set("a", 1)
+        with mock.patch("transactions.report_cache.time.monotonic", return_value=110.0):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("transactions.report_cache.time.monotonic", return_value=110.5):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_report_is_recomputed_after_a_write(self):
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+        company = Company.objects.create(name="Acme")
+        user = User.objects.create_user(
+            username="admin", email="admin@example.com", password="x", company=company, role="admin"
+        )
+        vat = VATSettings.objects.create(category="Standard", rate=5, company=company)
+        product = Product.objects.create(code="P", name="Product", unit_price=10, vat_category=vat, company=company)
+        customer = Customer.objects.create(name="C", email="c@example.com", company=company)
+        client = APIClient()
+        client.force_authenticate(user)
+        day = date.today() - timedelta(days=3)
+        url = f"/api/transactions/vat-report/?start={day}&end={day}"
+
+        def invoice_order(quantity):
+            with self.captureOnCommitCallbacks(execute=True):
+                order = SalesOrder.objects.create(customer=customer, company=company, order_date=day)
+                OrderLineItem.objects.create(sales_order=order, product=product, quantity=quantity, unit_price=10)
+                order.refresh_from_db()
+                Invoice.objects.create(
+                    sales_order=order, issue_date=day, due_date=day, amount_due=order.grand_total, company=company
+                )
+
+        invoice_order(2)
+        first = client.get(url)
+        self.assertEqual((first["X-Report-Cache"], first.data["Standard"]["sales"]), ("miss", 20.0))
+        self.assertEqual(client.get(url)["X-Report-Cache"], "hit")
+
+        invoice_order(1)
+        fresh = client.get(url)
+        self.assertEqual((fresh["X-Report-Cache"], fresh.data["Standard"]["sales"]), ("miss", 30.0))
+
+
+class ListQueryCountTests(TestCase):
+    """List endpoints load related data through serializer prefetch profiles, not per row."""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        self.user = User.objects.create_user(
+            username="admin", email="admin@example.com", password="x", company=self.company, role="admin"
+        )
+        vat = VATSettings.objects.create(category="Standard", rate=5, company=self.company)
+        self.products = [
+            Product.objects.create(code=f"P{i}", name=f"Product {i}", unit_price=10, vat_category=vat, company=self.company)
+            for i in range(2)
+        ]
+        self.customer = Customer.objects.create(name="C", email="c@example.com", company=self.company)
+        self.route = Route.objects.create(salesperson=self.user, name="North", date=date.today(), company=self.company)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_invoiced_orders(self, count):
+        for _ in range(count):
+            order = SalesOrder.objects.create(customer=self.customer, company=self.company, order_date=date.today())
+            for product in self.products:
+                OrderLineItem.objects.create(sales_order=order, product=product, quantity=1, unit_price=10)
+            visit = RouteVisit.objects.create(route=self.route, customer=self.customer, company=self.company)
+            visit.sales_orders.add(order)
+            order.refresh_from_db()
+            invoice = Invoice.objects.create(
+                sales_order=order, issue_date=date.today(), due_date=date.today(),
+                amount_due=order.grand_total, company=self.company
+            )
+            Payment.objects.create(invoice=invoice, amount=1, mode="cash", company=self.company)
+
+    def count_list_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(response.data), len(queries.captured_queries)
+
+    def assert_constant_queries(self, url):
+        self.add_invoiced_orders(2)
+        small_rows, small = self.count_list_queries(url)
+        self.add_invoiced_orders(6)
+        large_rows, large = self.count_list_queries(url)
+        self.assertEqual((small_rows, large_rows), (2, 8))
+        self.assertEqual(small, large)
+
+    def test_sales_order_list(self):
+        self.assert_constant_queries("/api/transactions/sales-orders/")
+
+    def test_invoice_list(self):
+        self.assert_constant_queries("/api/transactions/invoices/")
+
+    def test_payment_list(self):
+        self.assert_constant_queries("/api/transactions/payments/")
+
+    def test_route_visit_list(self):
+        self.assert_constant_queries("/api/transactions/routevisits/")
+
+    def test_customer_stats_are_annotated(self):
+        self.add_invoiced_orders(3)
+        Customer.objects.create(name="D", email="d@example.com", company=self.company)
+        with CaptureQueriesContext(connection) as queries:
+            data = CustomerSerializer(
+                Customer.objects.annotate(**Customer.order_stats_annotations()).order_by("name"), many=True
+            ).data
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertEqual([(row["order_count"], row["total_spent"]) for row in data], [(3, Decimal("63.00")), (0, 0)])
+
+    def test_expanded_invoice_list(self):
+        self.assert_constant_queries("/api/transactions/invoices/?expand=payments,sales_order_details")
+
+    def test_sparse_invoice_list(self):
+        self.add_invoiced_orders(2)
+        _, full = self.count_list_queries("/api/transactions/invoices/?expand=payments")
+        response = self.client.get("/api/transactions/invoices/?fields=id,invoice_no,status")
+        self.assertEqual(set(response.data[0]), {"id", "invoice_no", "status"})
+        _, sparse = self.count_list_queries("/api/transactions/invoices/?fields=id,invoice_no,status")
+        self.assertLess(sparse, full)
+
+
+class RouteLocationPingBatchTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        self.salesperson = User.objects.create_user(
+            username="rep", email="rep@example.com", password="x", company=self.company, role="salesperson"
+        )
+        self.route = Route.objects.create(salesperson=self.salesperson, name="North", date=date.today(), company=self.company)
+        self.client = APIClient()
+        self.client.force_authenticate(self.salesperson)
+        self.url = "/api/transactions/route-location-pings/batch/"
+
+    def test_rows_and_columns_are_inserted_in_order(self):
+        rows = [{"lat": "25.1", "lon": "55.1"}, {"lat": "25.2", "lon": "55.2", "speed_mps": "3.5"}]
+        response = self.client.post(self.url, {"route": str(self.route.id), "pings": rows}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+
+        columns = {"route": str(self.route.id), "lat": ["25.3", "25.4"], "lon": ["55.3", "55.4"]}
+        response = self.client.post(self.url, columns, format="json")
+        self.assertEqual(response.status_code, 201)
+        lats = RouteLocationPing.objects.filter(route=self.route).order_by("created_at").values_list("lat", flat=True)
+        self.assertEqual([str(lat)[:4] for lat in lats], ["25.1", "25.2", "25.3", "25.4"])
+
+    def test_invalid_ping_rejects_the_whole_batch(self):
+        rows = [{"lat": "25.1", "lon": "55.1"}, {"lat": "95", "lon": "55.2"}]
+        response = self.client.post(self.url, {"route": str(self.route.id), "pings": rows}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RouteLocationPing.objects.exists())
+
+    def test_routes_of_other_companies_are_not_found(self):
+        other = Company.objects.create(name="Other")
+        admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="x", company=other, role="admin"
+        )
+        self.client.force_authenticate(admin)
+        ping = {"route": str(self.route.id), "lat": "25.1", "lon": "55.1"}
+        for url, data in ((self.url, {"route": ping["route"], "pings": [ping]}),
+                          ("/api/transactions/route-location-pings/", ping)):
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data["route"], ["Route not found"])
+        self.assertFalse(RouteLocationPing.objects.exists())
+
+
+class PingBufferTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        user = User.objects.create_user(username="rep", email="rep@example.com", password="x", company=self.company)
+        self.route = Route.objects.create(salesperson=user, name="North", date=date.today(), company=self.company)
+        self.buffer = PingBuffer(batch_size=50, flush_interval=60)
+        self.addCleanup(self.buffer.shutdown)
+
+    def ping(self, lat):
+        return RouteLocationPing(route=self.route, company=self.company, lat=lat, lon=55)
+
+    def test_flush_writes_buffered_pings(self):
+        for lat in (1, 2, 3):
+            self.buffer.submit(self.ping(lat))
+        self.assertEqual(self.buffer.stats()["depth"], 3)
+        self.assertFalse(RouteLocationPing.objects.exists())
+
+        self.assertEqual(self.buffer.flush(), 3)
+        stats = self.buffer.stats()
+        self.assertEqual((stats["depth"], stats["written"], stats["flushes"]), (0, 3, 1))
+        self.assertEqual(RouteLocationPing.objects.count(), 3)
+
+    def test_pings_keep_the_time_they_were_received(self):
+        ping = self.ping(1)
+        received_at = ping.created_at
+        with mock.patch("django.utils.timezone.now", return_value=received_at + timedelta(seconds=5)):
+            self.buffer.submit(ping)
+            self.buffer.flush()
+        self.assertEqual(RouteLocationPing.objects.get().created_at, received_at)
+
+    def test_failed_batch_keeps_valid_pings(self):
+        self.buffer.submit(self.ping(1))
+        invalid = self.ping(None)
+        self.buffer.submit(invalid)
+        with self.assertLogs("transactions.ping_buffer", level="ERROR") as logs:
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertIn(f"Dropped route ping {invalid.id} for route {self.route.id}", logs.output[-1])
+        self.assertEqual(self.buffer.stats()["dropped"], 1)
+        self.assertEqual(RouteLocationPing.objects.count(), 1)
+
+    def test_pings_after_shutdown_are_dropped_without_writing(self):
+        self.buffer.submit(self.ping(1))
+        self.buffer.shutdown()
+        late = self.ping(2)
+        with self.assertNumQueries(0), self.assertLogs("transactions.ping_buffer", level="WARNING") as logs:
+            self.buffer.submit(late)
+        self.assertIn(str(late.id), logs.output[0])
+        stats = self.buffer.stats()
+        self.assertEqual((stats["depth"], stats["written"], stats["dropped"]), (0, 1, 1))
+        self.assertEqual(RouteLocationPing.objects.count(), 1)
+
+
+class BulkPaymentTests(TestCase):
+    """A bulk post must leave the same state behind as posting each payment on its own."""
+
+    AMOUNTS = [("0", "5.00"), ("0", "16.00"), ("1", "21.00"), ("2", "4.50")]
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme")
+        self.user = User.objects.create_user(
+            username="admin", email="admin@example.com", password="x", company=self.company, role="admin"
+        )
+        vat = VATSettings.objects.create(category="Standard", rate=5, company=self.company)
+        self.product = Product.objects.create(
+            code="P", name="Product", unit_price=10, vat_category=vat, company=self.company
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def invoices_for(self, name):
+        customer = Customer.objects.create(name=name, email=f"{name}@example.com", company=self.company)
+        invoices = []
+        for _ in range(3):
+            order = SalesOrder.objects.create(customer=customer, company=self.company, order_date=date.today())
+            OrderLineItem.objects.create(sales_order=order, product=self.product, quantity=2, unit_price=10)
+            order.refresh_from_db()
+            invoices.append(Invoice.objects.create(
+                sales_order=order, issue_date=date.today(), due_date=date.today(),
+                amount_due=order.grand_total, company=self.company
+            ))
+        return customer, invoices
+
+    def snapshot(self, customer, invoices):
+        rows = []
+        for invoice in invoices:
+            invoice.refresh_from_db()
+            invoice.credits.refresh_from_db()
+            rows.append((invoice.paid_amount, invoice.status, invoice.credits.amount, invoice.credits.payed_amount))
+        customer.refresh_from_db()
+        return rows, (customer.current_balance, customer.credit_exposure)
+
+    def test_bulk_matches_one_at_a_time(self):
+        single_customer, single_invoices = self.invoices_for("single")
+        bulk_customer, bulk_invoices = self.invoices_for("bulk")
+
+        for index, amount in self.AMOUNTS:
+            response = self.client.post("/api/transactions/payments/", {
+                "invoice_id": str(single_invoices[int(index)].id), "amount": amount, "mode": "cash"
+            }, format="json")
+            self.assertEqual(response.status_code, 201)
+
+        response = self.client.post("/api/transactions/payments/bulk/", [
+            {"invoice_id": str(bulk_invoices[int(index)].id), "amount": amount, "mode": "cash"}
+            for index, amount in self.AMOUNTS
+        ], format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), len(self.AMOUNTS))
+
+        single = self.snapshot(single_customer, single_invoices)
+        self.assertEqual(self.snapshot(bulk_customer, bulk_invoices), single)
+        self.assertEqual([row[1] for row in single[0]], ["paid", "paid", "sent"])
+        self.assertEqual(
+            CustomerLedgerService.expected_totals([bulk_customer.pk])[bulk_customer.pk], single[1]
+        )
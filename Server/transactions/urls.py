@@ -8,7 +8,9 @@ from .views import (
     InvoiceViewSet,
     OutstandingPaymentsView,
     PaymentViewSet,
+    PingBufferStatsView,
     PurchaseOrderViewSet,
+    ReportCacheStatsView,
     RouteEfficiencyReportView,
     RouteVisitViewSet,
     RouteViewSet,
@@ -36,6 +38,8 @@ urlpatterns = [
     path("reports/sales-vs-purchase/", SalesVsPurchaseReportView.as_view()),
     path("reports/route-efficiency/", RouteEfficiencyReportView.as_view()),
     path("reports/outstanding-payments/", OutstandingPaymentsView.as_view()),
+    path("reports/cache-stats/", ReportCacheStatsView.as_view()),
+    path("route-location-pings/buffer-stats/", PingBufferStatsView.as_view()),
     path("vat-report/", VATReportView.as_view()),
    
     path('customers/<uuid:pk>/', CustomerDetailView.as_view(), name='customer-detail'),
@@ -4,14 +4,11 @@ from rest_framework.permissions import IsAuthenticated
 from django.db.models import Sum, Count
 from .models import SalesOrder, PurchaseOrder
     
-from collections import defaultdict
-from decimal import Decimal
-from django.db.models import DecimalField
 from rest_framework import viewsets
 from rest_framework.views import APIView
 from rest_framework import generics
 from rest_framework import status
-from django.db.models import Sum, Count, Avg, F, Case, When
+from django.db.models import Sum, Count, Avg, F, Q, Case, When
 from django.utils.dateparse import parse_date
 from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated, BasePermission
@@ -19,47 +16,45 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from main.models import Customer
-from .models import Invoice, OrderLineItem, Payment, PurchaseOrder, Route, RouteVisit, SalesOrder, RouteLocationPing
+from .models import Invoice, Payment, PurchaseOrder, Route, RouteVisit, SalesOrder, RouteLocationPing
 from .serializers import (
-    InvoiceSerializer, PaymentSerializer, PurchaseOrderSerializer,
-    RouteSerializer, RouteVisitSerializer, SalesOrderSerializer,
-    RouteLocationPingSerializer, CustomerSerializer
+    InvoiceSerializer, InvoiceSummarySerializer, PaymentSerializer, PurchaseOrderSerializer,
+    RouteSerializer, RouteSummarySerializer, RouteVisitSerializer, SalesOrderSerializer,
+    RouteLocationPingSerializer, RouteLocationPingBatchSerializer, CustomerSerializer
 )
+from .ping_buffer import ping_buffer
+from .report_cache import cached_report, report_cache
+from .services import PaymentService, ReportingRollupService, RouteTrackingService
 from audit.signals import AuditContext
+from base.fieldsets import SummaryListMixin
+from base.prefetch import PrefetchProfileMixin
 
 
 # Sales Order Report API
 class SalesOrderReportView(APIView):
     permission_classes = [IsAuthenticated]
+    @cached_report
     def get(self, request):
         start = request.GET.get('start')
         end = request.GET.get('end')
-        qs = SalesOrder.objects.filter(company = request.user.company)
-        if start and end:
-            qs = qs.filter(order_date__gte=start, order_date__lte=end)
-        data = qs.aggregate(
-            total_sales=Sum('grand_total'),
-            total_profit=Sum('profit'),
-            order_count=Count('id')
-        )
+        if not (start and end):
+            start = end = None
+        data = ReportingRollupService.sales_totals(request.user.company, start, end)
         return Response(data)
 
 # Purchase Order Report API
 class PurchaseOrderReportView(APIView):
     permission_classes = [IsAuthenticated]
+    @cached_report
     def get(self, request):
         start = request.GET.get('start')
         end = request.GET.get('end')
-        qs = PurchaseOrder.objects.filter(company = request.user.company)
-        if start and end:
-            qs = qs.filter(order_date__gte=start, order_date__lte=end)
-        data = qs.aggregate(
-            total_purchases=Sum('grand_total'),
-            order_count=Count('id')
-        )
+        if not (start and end):
+            start = end = None
+        data = ReportingRollupService.purchase_totals(request.user.company, start, end)
         return Response(data)
     
-class SalesOrderViewSet(viewsets.ModelViewSet):
+class SalesOrderViewSet(PrefetchProfileMixin, viewsets.ModelViewSet):
     queryset = SalesOrder.objects.all()
     serializer_class = SalesOrderSerializer
     permission_classes = [IsAuthenticated]
@@ -141,7 +136,7 @@ class SalesOrderViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-class PurchaseOrderViewSet(viewsets.ModelViewSet):
+class PurchaseOrderViewSet(PrefetchProfileMixin, viewsets.ModelViewSet):
     queryset = PurchaseOrder.objects.all()
     serializer_class = PurchaseOrderSerializer
     permission_classes = [IsAuthenticated]
@@ -160,9 +155,10 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
             serializer.save()
     
     
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(SummaryListMixin, PrefetchProfileMixin, viewsets.ModelViewSet):
     queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
+    summary_serializer_class = InvoiceSummarySerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -265,7 +261,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'detail': f'Error refreshing invoices: {str(e)}'}, status=500)
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(PrefetchProfileMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
@@ -313,11 +309,51 @@ class PaymentViewSet(viewsets.ModelViewSet):
         if not self.has_write_access():
             return Response({'detail': 'Forbidden'}, status=403)
         return super().destroy(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Post many payments in one request, e.g. end-of-day cash for a route.
+        Accepts a list of payments (or {"payments": [...]}) with invoice_id,
+        amount and mode. Each affected invoice and credit is recomputed once.
+        """
+        data = request.data.get('payments') if isinstance(request.data, dict) else request.data
+        if not isinstance(data, list) or not data:
+            return Response(
+                {'detail': 'A non-empty list of payments is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = self.get_serializer(data=data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        invoice_ids = {item['invoice_id'] for item in serializer.validated_data}
+        invoices = Invoice.objects.filter(company=request.user.company).in_bulk(invoice_ids)
+        missing = [str(pk) for pk in invoice_ids if pk not in invoices]
+        if missing:
+            return Response(
+                {'invoice_id': [f'Invalid invoice ID: {pk}' for pk in missing]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        entries = []
+        for item in serializer.validated_data:
+            invoice_id = item.pop('invoice_id')
+            entries.append({**item, 'invoice': invoices[invoice_id]})
+
+        with AuditContext(request.user):
+            payments = PaymentService.post_payments(request.user.company, entries)
+
+        return Response(
+            self.get_serializer(payments, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
     
 
-class RouteViewSet(viewsets.ModelViewSet):
+class RouteViewSet(SummaryListMixin, PrefetchProfileMixin, viewsets.ModelViewSet):
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
+    summary_serializer_class = RouteSummarySerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -341,12 +377,12 @@ class RouteViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"])
     def visits(self, request, pk=None):
         route = self.get_object()
-        visits = route.visits.all()
+        visits = RouteVisitSerializer.prefetch_profile.apply(route.visits.all())
         serializer = RouteVisitSerializer(visits, many=True)
         return Response(serializer.data)
 
 
-class RouteVisitViewSet(viewsets.ModelViewSet):
+class RouteVisitViewSet(PrefetchProfileMixin, viewsets.ModelViewSet):
     queryset = RouteVisit.objects.all()
     serializer_class = RouteVisitSerializer
     permission_classes = [IsAuthenticated]
@@ -561,7 +597,7 @@ class RouteVisitViewSet(viewsets.ModelViewSet):
             )
     
 
-class RouteLocationPingViewSet(viewsets.ModelViewSet):
+class RouteLocationPingViewSet(PrefetchProfileMixin, viewsets.ModelViewSet):
     queryset = RouteLocationPing.objects.all()
     serializer_class = RouteLocationPingSerializer
     permission_classes = [IsAuthenticated]
@@ -588,6 +624,28 @@ class RouteLocationPingViewSet(viewsets.ModelViewSet):
         with AuditContext(self.request.user):
             serializer.save()
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Upload buffered GPS pings of one route in one request, e.g. after a
+        dead zone. The route is checked once and the pings are inserted with
+        one bulk INSERT. Accepts {"route", "pings": [...]} or columnar
+        {"route", "lat": [...], "lon": [...], ...} payloads.
+        """
+        serializer = RouteLocationPingBatchSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        route = serializer.validated_data['route']
+        pings = RouteTrackingService.record_pings(
+            route, route.company, serializer.validated_data['pings']
+        )
+        return Response({
+            'route': str(route.id),
+            'created': len(pings),
+            'last_created_at': pings[-1].created_at,
+        }, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['get'])
     def route_summary(self, request):
         """Get route summary and optimization metrics - FIXED VERSION"""
@@ -1119,6 +1177,7 @@ class VATReportView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @cached_report
     def get(self, request, *args, **kwargs):
         # Parse and validate date parameters
         start = parse_date(request.GET.get("start", ""))
@@ -1130,67 +1189,12 @@ class VATReportView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Handle VAT-inclusive vs exclusive pricing logic
-        line_items = (
-            OrderLineItem.objects
-            .select_related('product__vat_category', 'sales_order')
-            .filter(
-                sales_order__invoice__issue_date__gte=start,
-                sales_order__invoice__issue_date__lte=end,
-                sales_order__company=request.user.company
-            )
-            .annotate(
-                vat_rate=F('product__vat_category__rate'),
-                vat_category=F('product__vat_category__category'),
-                prices_include_vat=F('sales_order__prices_include_vat'),
-                # Calculate net amount and VAT based on pricing model
-                net_amount=Case(
-                    # When prices include VAT: net = gross / (1 + rate/100)
-                    When(
-                        sales_order__prices_include_vat=True,
-                        product__vat_category__rate__gt=0,
-                        then=F('line_total') / (1 + F('product__vat_category__rate') / 100)
-                    ),
-                    # When prices exclude VAT or rate is 0: net = gross
-                    default=F('line_total'),
-                    output_field=DecimalField(max_digits=12, decimal_places=2)
-                ),
-                vat_amount=Case(
-                    # When prices include VAT: vat = gross - net
-                    When(
-                        sales_order__prices_include_vat=True,
-                        product__vat_category__rate__gt=0,
-                        then=F('line_total') - (F('line_total') / (1 + F('product__vat_category__rate') / 100))
-                    ),
-                    # When prices exclude VAT: vat = net * rate/100
-                    When(
-                        product__vat_category__rate__isnull=False,
-                        then=F('line_total') * F('product__vat_category__rate') / 100
-                    ),
-                    default=Decimal('0.00'),
-                    output_field=DecimalField(max_digits=12, decimal_places=2)
-                )
-            )
-            .values('vat_category', 'net_amount', 'vat_amount')
-        )
-        
-        # Initialize report structure
         report = {
             "period_start": str(start),
             "period_end": str(end),
         }
-        
-        # Use defaultdict for cleaner aggregation
-        category_totals = defaultdict(lambda: {"sales": Decimal('0.00'), "vat": Decimal('0.00')})
-        
-        # Aggregate data efficiently
-        for item in line_items:
-            category = item['vat_category'] or 'uncategorized'
-            category_totals[category]["sales"] += Decimal(str(item['net_amount'] or 0))
-            category_totals[category]["vat"] += Decimal(str(item['vat_amount'] or 0))
-        
-        # Convert to the expected format and ensure float conversion for JSON serialization
-        for category, totals in category_totals.items():
+        # Pre-aggregated per invoice day and VAT category; closed periods are stored once computed
+        for category, totals in ReportingRollupService.closed_vat_totals(request.user.company, start, end).items():
             report[category] = {
                 "sales": float(totals["sales"]),
                 "vat": float(totals["vat"])
@@ -1202,6 +1206,7 @@ class SalesVsPurchaseReportView(APIView):
     """Sales vs Purchase comparison report"""
     permission_classes = [IsAuthenticated]
     
+    @cached_report
     def get(self, request):
         start = parse_date(request.GET.get("start", ""))
         end = parse_date(request.GET.get("end", ""))
@@ -1209,28 +1214,9 @@ class SalesVsPurchaseReportView(APIView):
         if not (start and end):
             return Response({"detail": "start & end required"}, status=400)
         
-        # Sales data
-        sales_data = SalesOrder.objects.filter(
-            order_date__gte=start, order_date__lte=end,company=request.user.company
-        ).aggregate(
-            total_sales=Sum('grand_total'),
-            total_profit=Sum('profit'),
-            order_count=Count('id')
-        )
-        
-        # Purchase data  
-        purchase_data = PurchaseOrder.objects.filter(
-            order_date__gte=start, order_date__lte=end, company=request.user.company
-        ).aggregate(
-            total_purchases=Sum('grand_total'),
-            order_count=Count('id')
-        )
-        print({
-            "period": {"start": start, "end": end},
-            "sales": sales_data,
-            "purchases": purchase_data,
-            "net_profit": (sales_data.get('total_sales', 0) or 0) - (purchase_data.get('total_purchases', 0) or 0)
-        })
+        # Sales and purchase data from the daily rollups
+        sales_data = ReportingRollupService.sales_totals(request.user.company, start, end)
+        purchase_data = ReportingRollupService.purchase_totals(request.user.company, start, end)
         return Response({
             "period": {"start": start, "end": end},
             "sales": sales_data,
@@ -1242,6 +1228,7 @@ class RouteEfficiencyReportView(APIView):
     """Route efficiency and performance reports"""
     permission_classes = [IsAuthenticated]
     
+    @cached_report
     def get(self, request):
         start = parse_date(request.GET.get("start", ""))
         end = parse_date(request.GET.get("end", ""))
@@ -1272,33 +1259,57 @@ class OutstandingPaymentsView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        # Get all invoices that have outstanding amounts
-        invoices = Invoice.objects.select_related('sales_order__customer').filter(company=request.user.company)
-
-        customer_outstanding = {}
-        for invoice in invoices:
-            outstanding = invoice.outstanding
-            if outstanding > 0:  # Only include invoices with outstanding amounts
-                customer = invoice.sales_order.customer
-                if customer.id not in customer_outstanding:
-                    customer_outstanding[customer.id] = {
-                        "customer_name": customer.name,
-                        "customer_email": customer.email,
-                        "total_outstanding": 0,
-                        "invoice_count": 0
-                    }
-                
-                customer_outstanding[customer.id]["total_outstanding"] += float(outstanding)
-                customer_outstanding[customer.id]["invoice_count"] += 1
-        
-        # Format the amounts properly
-        result = []
-        for customer_data in customer_outstanding.values():
-            customer_data["total_outstanding"] = round(customer_data["total_outstanding"], 2)
-            result.append(customer_data)
-        
+        # One GROUP BY customer over the invoices that still have something outstanding
+        rows = (
+            Invoice.objects.filter(company=request.user.company)
+            .annotate(outstanding_amount=Invoice.outstanding_expression())
+            .filter(outstanding_amount__gt=0)
+            .values(
+                "sales_order__customer_id",
+                "sales_order__customer__name",
+                "sales_order__customer__email",
+            )
+            .annotate(total=Sum("outstanding_amount"), invoice_count=Count("id"))
+            .order_by("sales_order__customer__name")
+        )
+
+        result = [
+            {
+                "customer_name": row["sales_order__customer__name"],
+                "customer_email": row["sales_order__customer__email"],
+                "total_outstanding": round(float(row["total"]), 2),
+                "invoice_count": row["invoice_count"],
+            }
+            for row in rows
+        ]
         return Response(result)
     
+class ReportCacheStatsView(APIView):
+    """Hit/miss counters of this worker's report cache (admins only)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if getattr(request.user, 'role', '') != 'admin':
+            return Response(
+                {"detail": "You do not have permission to perform this action."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(report_cache.stats())
+
+
+class PingBufferStatsView(APIView):
+    """Depth and flush latency of this worker's live tracking ping buffer (admins only)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if getattr(request.user, 'role', '') != 'admin':
+            return Response(
+                {"detail": "You do not have permission to perform this action."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(ping_buffer.stats())
+
+
 class CustomerViewSet(viewsets.ModelViewSet):
     """Customer ViewSet with proper CRUD operations"""
     queryset = Customer.objects.all()
@@ -1314,7 +1325,7 @@ class CustomerViewSet(viewsets.ModelViewSet):
         if role == 'salesperson':
             qs = qs.filter(sales_orders__salesperson=user).distinct()
         
-        return qs
+        return qs.annotate(**Customer.order_stats_annotations())
 
 
 class CustomerDetailView(generics.RetrieveAPIView):
@@ -1323,7 +1334,9 @@ class CustomerDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return super().get_queryset().filter(company=self.request.user.company)
+        return super().get_queryset().filter(
+            company=self.request.user.company
+        ).annotate(**Customer.order_stats_annotations())
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -1371,7 +1384,7 @@ class CustomerSummaryView(APIView):
 
     def get(self, request, customer_id):
         try:
-            customer = Customer.objects.get(id=customer_id)
+            customer = Customer.objects.annotate(**Customer.order_stats_annotations()).get(id=customer_id)
             
             # Get sales orders
             sales_orders = SalesOrder.objects.filter(customer=customer)
@@ -1392,10 +1405,17 @@ class CustomerSummaryView(APIView):
             invoices_data = InvoiceSerializer(invoices, many=True).data
             
             # Calculate summary statistics
-            total_orders = sales_orders.count()
-            pending_orders = sales_orders.filter(status='confirmed').count()
-            total_spent = sales_orders.aggregate(total=Sum('grand_total'))['total'] or 0
-            outstanding_balance = sum(float(inv.outstanding) for inv in invoices)
+            totals = sales_orders.aggregate(
+                total_orders=Count('id'),
+                pending_orders=Count('id', filter=Q(status='confirmed')),
+                total_spent=Sum('grand_total'),
+            )
+            total_orders = totals['total_orders']
+            pending_orders = totals['pending_orders']
+            total_spent = totals['total_spent'] or 0
+            outstanding_balance = float(
+                invoices.aggregate(total=Sum(Invoice.outstanding_expression()))['total'] or 0
+            )
             
             return Response({
                 'customer': customer_data,